@@ -0,0 +1,108 @@
+import logging
+
+import numpy as np
+
+from catalog_retrieval import normalize_text
+from offer_schema import aggregate_row_to_offer
+
+logger = logging.getLogger(__name__)
+
+# Tryby zasilania agregatu - nazwy pól sekcji "agregat" oraz indeksy kolumn w tabeli
+POWER_MODES = {
+    'tylko_drogowy': 4,
+    'drogowy_siec_230V': 5,
+    'drogowy_siec_400V': 6,
+}
+DEFAULT_POWER_MODE = 'tylko_drogowy'
+
+# Obsługiwane temperatury docelowe (°C)
+TEMPERATURES = (0, -20)
+DEFAULT_TEMPERATURE = 0
+
+
+def _column(rows, idx) -> np.ndarray:
+    """Kolumna liczbowa jako tablica float (puste wartości -> NaN)"""
+    return np.array(
+        [row[idx] if isinstance(row[idx], (int, float)) else np.nan for row in rows],
+        dtype=np.float64
+    )
+
+
+def _available(value) -> bool:
+    """Czy wersja agregatu jest dostępna w danym trybie zasilania (kolumna zawiera kod)"""
+    value = (value or '').strip()
+    return bool(value) and value != '-'
+
+
+class AggregateSolver:
+    """Dobór agregatów Daikin do pojazdu na podstawie kubatury, temperatury i zasilania"""
+
+    def __init__(self, agregaty):
+        self.agregaty = list(agregaty)
+        rows = self.agregaty
+
+        self.cooling_capacity = {
+            0: _column(rows, 8),
+            -20: _column(rows, 9),
+        }
+        self.van_size = {
+            0: _column(rows, 10),
+            -20: _column(rows, 11),
+        }
+        price = _column(rows, 7)
+        # Brak ceny sortujemy na koniec
+        self.price_key = np.where(np.isnan(price), np.inf, price)
+        self.power = {
+            mode: np.array([_available(row[idx]) for row in rows], dtype=bool)
+            for mode, idx in POWER_MODES.items()
+        }
+        # Modele jako kody całkowite, aby filtr po modelu był operacją wektorową
+        model_keys = [self._model_key(row[1]) for row in rows]
+        self.model_ids = {key: idx for idx, key in enumerate(dict.fromkeys(model_keys))}
+        self.model_codes = np.array([self.model_ids[key] for key in model_keys], dtype=np.int64)
+
+    @staticmethod
+    def _model_key(model) -> str:
+        return ''.join(normalize_text(model).split())
+
+    def rank(self, kubatura, temperature=DEFAULT_TEMPERATURE, power_mode=DEFAULT_POWER_MODE,
+             model=None, top_n=5) -> np.ndarray:
+        """Zwraca indeksy kompatybilnych agregatów od najlepiej dopasowanego.
+
+        Agregat jest kompatybilny, gdy rekomendowana kubatura dla danej temperatury
+        jest nie mniejsza niż kubatura pojazdu i wersja istnieje w danym trybie
+        zasilania. Preferowany jest najmniejszy zapas kubatury, potem niższa cena
+        i większa moc chłodnicza.
+        """
+        if temperature not in TEMPERATURES:
+            raise ValueError(f"Nieobsługiwana temperatura: {temperature}")
+        if power_mode not in POWER_MODES:
+            raise ValueError(f"Nieobsługiwany tryb zasilania: {power_mode}")
+
+        van_size = self.van_size[temperature]
+        with np.errstate(invalid='ignore'):
+            compatible = (van_size >= kubatura) & self.power[power_mode]
+        if model:
+            compatible &= self.model_codes == self.model_ids.get(self._model_key(model), -1)
+
+        candidates = np.flatnonzero(compatible)
+        if candidates.size == 0:
+            return candidates
+
+        oversize = van_size[candidates] - kubatura
+        # Zawężenie do najlepszych top_n wartości zapasu (z remisami) przed sortowaniem
+        if candidates.size > top_n:
+            kth = np.partition(oversize, top_n - 1)[top_n - 1]
+            keep = oversize <= kth
+            candidates = candidates[keep]
+            oversize = oversize[keep]
+
+        capacity = self.cooling_capacity[temperature][candidates]
+        order = np.lexsort((-np.nan_to_num(capacity), self.price_key[candidates], oversize))
+        return candidates[order][:top_n]
+
+    def solve(self, kubatura, temperature=DEFAULT_TEMPERATURE, power_mode=DEFAULT_POWER_MODE,
+              model=None, top_n=5) -> list:
+        """Zwraca listę sekcji "agregat" dla najlepiej dopasowanych agregatów"""
+        ranked = self.rank(kubatura, temperature, power_mode, model, top_n)
+        return [aggregate_row_to_offer(self.agregaty[idx]) for idx in ranked]
@@ -0,0 +1,192 @@
+"""Wsadowe generowanie ofert z pliku JSONL.
+
+Każda linia pliku wejściowego to obiekt JSON z treścią oferty w polu "text"
+(alternatywnie "tekst" lub "body") i opcjonalnym identyfikatorem "id"
+(lub "request_id"). Wywołania LLM wykonywane są współbieżnie (asyncio),
+a pliki PDF renderowane w puli procesów. Wywołania idą pasem wsadowym limitu LLM
+(rate_limiter); przy LLM_LIMITER_DB wskazującym ten sam plik co aplikacja wsad
+ustępuje miejsca handlowcom korzystającym ze strony.
+
+Przykład (offline, z lokalnym zamiennikiem LLM):
+    python batch_offers.py requests.jsonl --out-dir batch_out --stub --stub-latency 0.8
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from database import get_shared_database
+from llm_cache import LLMResponseCache
+from logging_setup import setup_logging
+from offer_generator import OfferGenerator, render_offer_pdf
+from pdf_store import safe_name
+from rate_limiter import BATCH, get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+def iter_requests(path):
+    """Strumieniowo czyta plik JSONL i zwraca pary (id, tekst)"""
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield f"line-{line_no}", None, f"Niepoprawny JSON: {e}"
+                continue
+            request_id = str(item.get('id') or item.get('request_id') or f"line-{line_no}")
+            text = item.get('text') or item.get('tekst') or item.get('body')
+            yield request_id, text, None
+
+
+def percentile(values, p):
+    """Percentyl p (0-100) metodą najbliższego rangą"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def _make_clients(args):
+    """Klient synchroniczny, asynchroniczny i limit wywołań asynchronicznych: lokalny zamiennik albo brama LLM"""
+    if args.stub:
+        from llm_stub import AsyncStubOpenAI, StubOpenAI
+        return (
+            StubOpenAI(latency=args.stub_latency, jitter=args.stub_jitter),
+            AsyncStubOpenAI(latency=args.stub_latency, jitter=args.stub_jitter),
+            get_rate_limiter()
+        )
+
+    from config import OPENAI_API_KEY, OPENAI_BASE_URL
+    from llm_gateway import LLMGateway
+    if not OPENAI_API_KEY and not OPENAI_BASE_URL:
+        raise SystemExit("Brak klucza API OpenAI (OPENAI_API_KEY) - użyj --stub do pracy offline")
+    # Wywołania wsadu przez bramę: ponowienia, deadline, circuit breaker i przydział limitu
+    # (pas wsadowy) dla każdej próby - OfferGenerator nie pobiera już własnego przydziału
+    gateway = LLMGateway(OPENAI_API_KEY or 'local', limiter=get_rate_limiter(), lane=BATCH)
+    return gateway, gateway.async_client, None
+
+
+async def run_batch(args) -> dict:
+    client, async_client, rate_limiter = _make_clients(args)
+    cache = LLMResponseCache(':memory:') if args.no_cache else None
+    generator = OfferGenerator(
+        get_shared_database(), cache=cache, client=client, async_client=async_client,
+        rate_limiter=rate_limiter
+    )
+
+    pdf_dir = os.path.join(args.out_dir, 'pdf')
+    os.makedirs(pdf_dir, exist_ok=True)
+    results_path = os.path.join(args.out_dir, 'results.jsonl')
+    failures_path = os.path.join(args.out_dir, 'failures.jsonl')
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    offer_latencies = []
+    total_latencies = []
+    counters = {'ok': 0, 'failed': 0}
+
+    with open(results_path, 'w', encoding='utf-8') as results, \
+            open(failures_path, 'w', encoding='utf-8') as failures, \
+            ProcessPoolExecutor(max_workers=args.pdf_workers) as pdf_pool:
+
+        def write(f, record):
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                request_id, text, error = item
+                if error or not text:
+                    counters['failed'] += 1
+                    write(failures, {'id': request_id, 'error': error or "Brak treści oferty"})
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    offer_data, missing_data = await generator.create_offer_async(
+                        text, selected_attachments={}, attachments_cost=0
+                    )
+                    offer_done = time.perf_counter()
+
+                    pdf_path = os.path.join(pdf_dir, f"{safe_name(request_id)}.pdf")
+                    await loop.run_in_executor(
+                        pdf_pool, render_offer_pdf, offer_data, pdf_path, {}, 0, args.images
+                    )
+                    done = time.perf_counter()
+                except Exception as e:
+                    counters['failed'] += 1
+                    logger.error(f"Błąd oferty {request_id}: {str(e)}")
+                    write(failures, {'id': request_id, 'error': str(e)})
+                    continue
+
+                counters['ok'] += 1
+                offer_latencies.append(offer_done - start)
+                total_latencies.append(done - start)
+                write(results, {
+                    'id': request_id,
+                    'offer': offer_data,
+                    'missing_data': missing_data,
+                    'pdf': pdf_path,
+                    'offer_latency_s': round(offer_done - start, 4),
+                    'total_latency_s': round(done - start, 4)
+                })
+
+        started = time.perf_counter()
+        workers = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+        for item in iter_requests(args.input):
+            await queue.put(item)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - started
+
+    return {
+        'ok': counters['ok'],
+        'failed': counters['failed'],
+        'elapsed_s': round(elapsed, 3),
+        'throughput_offers_per_s': round(counters['ok'] / elapsed, 3) if elapsed else 0.0,
+        'offer_latency_p50_s': round(percentile(offer_latencies, 50), 4),
+        'offer_latency_p95_s': round(percentile(offer_latencies, 95), 4),
+        'total_latency_p50_s': round(percentile(total_latencies, 50), 4),
+        'total_latency_p95_s': round(percentile(total_latencies, 95), 4),
+        'results': results_path,
+        'failures': failures_path
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Wsadowe generowanie ofert z pliku JSONL")
+    parser.add_argument('input', help="plik JSONL z treściami ofert")
+    parser.add_argument('--out-dir', default='batch_out', help="katalog na results.jsonl, failures.jsonl i pdf/")
+    parser.add_argument('--concurrency', type=int, default=8, help="maksymalna liczba równoległych wywołań LLM")
+    parser.add_argument('--pdf-workers', type=int, default=os.cpu_count() or 2, help="liczba procesów renderujących PDF")
+    parser.add_argument('--images', nargs='*', default=[], help="zdjęcia dołączane do każdego PDF")
+    parser.add_argument('--no-cache', action='store_true', help="nie używaj trwałego cache odpowiedzi LLM")
+    parser.add_argument('--stub', action='store_true', help="lokalny zamiennik LLM zamiast API OpenAI")
+    parser.add_argument('--stub-latency', type=float, default=0.0, help="średnie opóźnienie zamiennika [s]")
+    parser.add_argument('--stub-jitter', type=float, default=0.0, help="rozrzut opóźnienia zamiennika [s]")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging()
+    summary = asyncio.run(run_batch(args))
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Benchmark doboru agregatów: czas jednego zapytania dla katalogów 50, 5k i 500k agregatów.
+
+Uruchomienie: python benchmarks/bench_aggregate_solver.py [--repeat 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregate_solver import POWER_MODES, TEMPERATURES, AggregateSolver
+
+CATALOG_SIZES = (50, 5_000, 500_000)
+PRODUCT_LINES = ('Van', 'Van Invisible', 'Van Zero')
+MODELS = ('Z200', 'Z250', 'Z350', 'Z380', 'SFZ007', 'SFZ008', 'SFZ009')
+
+
+def synthetic_catalog(size, seed=0) -> list:
+    """Generuje wiersze o układzie kolumn tabeli "Agregaty Daikin" """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(size):
+        van_0 = rng.choice((11.0, 16.0, 21.0, 24.0, 28.0, None))
+        van_20 = rng.choice((10.0, 16.0, 18.0, 21.0, None))
+        mode = rng.randrange(3)
+        rows.append((
+            rng.choice(PRODUCT_LINES),
+            rng.choice(MODELS),
+            rng.choice(('R134A', 'R452A')),
+            '12V',
+            f"SA{i:05d}" if mode == 0 else '',
+            f"SBA{i:05d}" if mode == 1 else '',
+            f"SBB{i:05d}" if mode == 2 else '-',
+            rng.choice((None, float(rng.randrange(15_000, 40_000)))),
+            rng.uniform(1500, 4000),
+            rng.choice((None, rng.uniform(1000, 2100))),
+            van_0,
+            van_20,
+            '',
+            'S'
+        ))
+    return rows
+
+
+def run(repeat):
+    rng = random.Random(1)
+    print(f"{'agregatów':>10} {'budowa [ms]':>12} {'p50 [ms]':>10} {'p95 [ms]':>10}")
+    for size in CATALOG_SIZES:
+        rows = synthetic_catalog(size)
+        start = time.perf_counter()
+        solver = AggregateSolver(rows)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        timings = []
+        for _ in range(repeat):
+            kubatura = rng.uniform(2.5, 20.0)
+            temperature = rng.choice(TEMPERATURES)
+            power_mode = rng.choice(list(POWER_MODES))
+            start = time.perf_counter()
+            solver.rank(kubatura, temperature, power_mode)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{size:>10} {build_ms:>12.1f} {p50:>10.3f} {p95:>10.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=200, help="liczba zapytań na rozmiar katalogu")
+    run(parser.parse_args().repeat)
@@ -0,0 +1,80 @@
+"""Benchmark renderowania PDF oferty: czas budowy i rozmiar pliku przed i po przygotowaniu obrazów.
+
+"przed" - logo i zdjęcia osadzane bezpośrednio z plików (parsowane przez FPDF w każdym dokumencie),
+"po"    - obrazy zmniejszone do rozdzielczości druku i sparsowane raz na proces (pdf_assets).
+
+Uruchomienie: python benchmarks/bench_pdf_render.py [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import offer_generator
+import pdf_assets
+from offer_generator import render_offer_pdf_bytes
+
+IMAGES = ['images/test1.jpeg', 'images/test2.jpeg', 'images/test3.jpeg']
+
+OFFER = {
+    'dane_klienta': {
+        'nazwa': 'Chłodex Sp. z o.o.', 'adres': 'ul. Polna 12, 00-950 Warszawa', 'nip': '5260001246',
+        'osoba_odpowiedzialna': 'Jan Kowalski', 'telefon': '+48 600 100 200', 'email': 'jan@example.com'
+    },
+    'data_oferty': '2025-01-17',
+    'numer_oferty': 'OF/2025/001',
+    'pojazd': {
+        'marka': 'Opel Vivaro', 'model': 'L2H1', 'kubatura': 6.0,
+        'zabudowa_cena': 11000.0, 'sklejki_cena': 3230.0, 'nadkola_cena': 500.0
+    },
+    'agregat': {'model': 'Z350', 'daikin_product_line': 'Van', 'cena_cennikowa': 0.0},
+    'grzanie': {'model_jednostki': 'Z350', 'model_opcji': '1KIT561', 'cena': 1800.0},
+    'zestaw_podgrzewacza': {'grzatki_elektryczne': '', 'model_opcji': '', 'cena': 0.0},
+}
+
+
+def direct_place_image(pdf, path, x, y, w, h=0, background=None):
+    """Osadzanie obrazu jak przed zmianą - bezpośrednio z pliku"""
+    pdf.image(path, x, y, w, h)
+
+
+def measure(repeat) -> tuple:
+    times = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(render_offer_pdf_bytes(OFFER, {}, 0, IMAGES))
+        times.append(time.perf_counter() - start)
+    return times, size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    place_image = offer_generator.place_image
+    offer_generator.place_image = direct_place_image
+    try:
+        before, before_size = measure(args.repeat)
+    finally:
+        offer_generator.place_image = place_image
+
+    pdf_assets.clear_asset_cache()
+    start = time.perf_counter()
+    render_offer_pdf_bytes(OFFER, {}, 0, IMAGES)
+    first = time.perf_counter() - start
+    after, after_size = measure(args.repeat)
+
+    print(f"{'wariant':<36}{'mediana [ms]':>14}{'rozmiar [KB]':>14}")
+    print(f"{'przed (obrazy z plików)':<36}{statistics.median(before) * 1000:>14.1f}{before_size / 1024:>14.1f}")
+    print(f"{'po - pierwszy dokument w procesie':<36}{first * 1000:>14.1f}{after_size / 1024:>14.1f}")
+    print(f"{'po - kolejne dokumenty':<36}{statistics.median(after) * 1000:>14.1f}{after_size / 1024:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark wyceny: N wariantów ofert w pętli (price_offer) i jednym przebiegiem (price_batch).
+
+Uruchomienie: python benchmarks/bench_pricing.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from pricing import DEFAULT_PRICE_LIST, PRICE_COMPONENTS, price_batch, price_offer
+
+
+def synthetic_offers(size, seed=0) -> tuple:
+    """Warianty ofert (słowniki w formacie OfferGenerator) i wybrane wyposażenie"""
+    rng = random.Random(seed)
+    codes = DEFAULT_PRICE_LIST.codes
+    offers, selections = [], []
+    for _ in range(size):
+        offer = {}
+        for section, name in PRICE_COMPONENTS.values():
+            offer.setdefault(section, {})[name] = float(rng.randrange(0, 40_000))
+        offers.append(offer)
+        selections.append({code: True for code in rng.sample(codes, rng.randrange(0, 8))})
+    return offers, selections
+
+
+def run(sizes):
+    print(f"{'wariantów':>10} {'pętla [ms]':>12} {'kolumny [ms]':>13} {'wektorowo [ms]':>15}")
+    for size in sizes:
+        offers, selections = synthetic_offers(size)
+
+        start = time.perf_counter()
+        looped = [price_offer(offer, selected=selected)['total'] for offer, selected in zip(offers, selections)]
+        loop_ms = (time.perf_counter() - start) * 1000
+
+        # Przygotowanie kolumn i macierzy wyborów (poza mierzonym przebiegiem)
+        start = time.perf_counter()
+        columns = {
+            item: np.array([offer[section][name] for offer in offers])
+            for item, (section, name) in PRICE_COMPONENTS.items()
+        }
+        matrix = DEFAULT_PRICE_LIST.selection_matrix(selections)
+        columns_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        totals = price_batch(columns, selections=matrix)['total']
+        batch_ms = (time.perf_counter() - start) * 1000
+
+        assert np.allclose(totals, looped)
+        print(f"{size:>10} {loop_ms:>12.1f} {columns_ms:>13.1f} {batch_ms:>15.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000],
+                        help="liczby wariantów ofert")
+    run(parser.parse_args().sizes)
@@ -0,0 +1,102 @@
+"""Benchmark rozmiaru promptu: liczba tokenów bloku katalogu przed i po zmianie formatu.
+
+Porównuje:
+  - pełny katalog jako JSON z wcięciami (stary format),
+  - pełny katalog jako zwięzły blok tabelaryczny,
+  - stały prefiks promptu systemowego (instrukcje i nagłówki tabel),
+  - wiersze katalogu wybrane dla przykładowych tekstów (kolejna wiadomość).
+
+Tokeny liczone są przez tiktoken (o200k_base, jak gpt-4o-mini), a gdy biblioteka
+nie jest zainstalowana - w przybliżeniu jako liczba znaków / 4.
+
+Uruchomienie: python benchmarks/bench_prompt_tokens.py [--db autoadaptacje.db]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_service import CatalogService
+from offer_generator import build_analysis_prompt
+
+SAMPLE_TEXTS = (
+    "Firma Chłodex Sp. z o.o., ul. Polna 12, 00-950 Warszawa, NIP 526-000-12-46. "
+    "Proszę o ofertę na zabudowę izotermiczną Opel Vivaro L2H1, temperatura 0 st.C.",
+    "Dzień dobry, potrzebujemy chłodni -20 do Renault Master L3 H2 z zasilaniem 230V.",
+    "Proszę o wycenę zabudowy dla busa, kontakt jan.kowalski@example.com",
+)
+
+
+def legacy_json_block(catalog) -> str:
+    """Pełny katalog w dawnym formacie promptu: JSON z wcięciami"""
+    def price(value):
+        return float(value if value is not None else 0)
+
+    db_context = {
+        "dostepne_samochody": [
+            {"marka": v[0], "model": v[1], "kubatura": v[2], "zabudowa_cena": price(v[3]),
+             "sklejki_cena": price(v[4]), "nadkola_cena": price(v[5])}
+            for v in catalog.vehicles
+        ],
+        "dostepne_agregaty": [
+            {"model": a[1], "daikin_product_line": a[0], "refrigerant": a[2], "instalacja_elektryczna": a[3],
+             "cena_cennikowa": price(a[7]), "cooling_capacity_0C": price(a[8]),
+             "cooling_capacity_-20C": price(a[9]), "recommended_van_size_0C": price(a[10]),
+             "recommended_van_size_-20C": price(a[11])}
+            for a in catalog.agregaty
+        ],
+        "opcje_grzania": [{"model": g[0], "opcja": g[1], "cena": price(g[2])} for g in catalog.grzanie]
+    }
+    return json.dumps(db_context, indent=2, ensure_ascii=False)
+
+
+def token_counter():
+    """Funkcja licząca tokeny oraz opis zastosowanej metody"""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding('o200k_base')
+        return (lambda text: len(encoding.encode(text))), "tiktoken o200k_base"
+    except ImportError:
+        return (lambda text: len(text) // 4), "przybliżenie: znaki / 4"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='autoadaptacje.db')
+    args = parser.parse_args(argv)
+
+    count_tokens, method = token_counter()
+    catalog = CatalogService(args.db).snapshot()
+    print(f"Liczenie tokenów: {method}")
+
+    full_json = legacy_json_block(catalog)
+    start = time.perf_counter()
+    compact = catalog.catalog_block
+    build_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{'wariant':<44}{'znaki':>9}{'tokeny':>9}")
+    rows = [
+        ("pełny katalog, JSON indent=2", full_json),
+        ("pełny katalog, blok tabelaryczny", compact),
+        ("prompt systemowy (stały prefiks)", build_analysis_prompt()),
+    ]
+    for name, text in rows:
+        print(f"{name:<44}{len(text):>9}{count_tokens(text):>9}")
+    print(f"  budowa bloku: {build_ms:.2f} ms (raz na wersję katalogu)")
+
+    print("\nWiersze katalogu dla przykładowych tekstów (kolejna wiadomość):")
+    for text in SAMPLE_TEXTS:
+        retrieval = catalog.prompt_index.select_context(text)
+        label = "pełny katalog" if retrieval.fallback else "kandydaci"
+        print(f"  {text[:40]!r:<46}{label:<15}{count_tokens(retrieval.block):>7} tokenów")
+
+    before = count_tokens(full_json)
+    after = count_tokens(compact)
+    print(f"\nBlok katalogu: {before} -> {after} tokenów (-{100 * (1 - after / before):.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+"""Zestaw benchmarków ścieżki oferty z progiem regresji.
+
+Mierzy etapy: budowę migawki katalogu, wyszukiwanie pojazdu, szybką ekstrakcję, budowę promptu,
+dobór agregatu, parsowanie odpowiedzi LLM, obliczanie ceny, konwersje modelu oferty
+(dawne save_to_session/update_offer_from_grids), renderowanie PDF (1, 10, 100 ofert, z obrazami
+i bez) oraz całe create_offer z lokalnym zamiennikiem LLM (StubOpenAI, bez opóźnienia) -
+czyli wyłącznie narzut aplikacji. Etapy zależne od katalogu uruchamiane są dla katalogów
+syntetycznych w skali 1x, 100x i 10000x tabel z autoadaptacje.db. Tabela pojazdów powielana
+jest najwyżej VEHICLE_SCALE_CAP razy: indeksy pojazdów dla 900 tys. wierszy zajmują kilka GB
+pamięci, więc w skali 10000x rośnie tylko tabela agregatów.
+
+Wyniki (minimum, mediana i p95 w ms) zapisywane są w pliku benchmarks/baseline.json. Próg
+regresji dotyczy minimum - jest najmniej wrażliwe na chwilowe obciążenie maszyny. Budowa struktur
+katalogu mierzona jest co najmniej BUILD_REPEAT razy, za każdym razem na świeżej migawce,
+i porównywana medianą; etapy z mniej niż MIN_GATE_REPEAT pomiarami są tylko informacyjne. Przed
+porównaniem wyniki skalowane są stosunkiem czasów stałego obciążenia kalibracyjnego (bazowy /
+bieżący), co znosi różnicę szybkości maszyny między przebiegami; etap wolniejszy od bazowego
+o więcej niż --threshold (domyślnie 25%) kończy przebieg kodem 1.
+Nowy plik bazowy zapisuje --update-baseline - tylko z faktycznego przebiegu na danej maszynie;
+przebieg częściowy nadpisuje wyłącznie zmierzone etapy.
+
+Uruchomienie:
+    python benchmarks/run_benchmarks.py [--scales 1 100 10000] [--only pdf] [--threshold 0.25]
+    python benchmarks/run_benchmarks.py --update-baseline
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+# Benchmark nie zapisuje śladów ani metryk telemetrii
+os.environ.setdefault('OFFER_TRACE_PATH', '')
+os.environ.setdefault('OFFER_METRICS_PATH', '')
+
+import logging
+
+from catalog_service import CatalogService, CatalogSnapshot
+from llm_cache import LLMResponseCache
+from llm_stub import StubOpenAI
+from offer_generator import OfferGenerator, render_offer_pdf_bytes
+from offer_model import Offer
+from pricing import DEFAULT_PRICE_LIST, offer_columns, price_batch
+
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+DEFAULT_THRESHOLD = float(os.environ.get('BENCH_THRESHOLD', 0.25))
+# Różnice poniżej tej wartości (ms) traktowane są jako szum pomiaru
+MIN_DELTA_MS = 0.5
+# Etapy z mniejszą liczbą pomiarów nie są porównywane z progiem regresji
+MIN_GATE_REPEAT = 3
+# Pomiary budowy struktur katalogu (każdy na nowej migawce): co najmniej BUILD_REPEAT, a dla
+# szybkich struktur kolejne, dopóki łączny czas pomiarów nie przekroczy BUILD_BUDGET_S
+BUILD_REPEAT = 3
+BUILD_MAX_REPEAT = 15
+BUILD_BUDGET_S = 1.0
+SCALES = (1, 100, 10_000)
+VEHICLE_SCALE_CAP = 1_000
+PDF_COUNTS = (1, 10, 100)
+IMAGES = ['images/test1.jpeg', 'images/test2.jpeg', 'images/test3.jpeg']
+
+# Struktury pochodne migawki budowane przy pierwszym użyciu oraz struktury, z których korzystają
+DERIVED_STRUCTURES = (
+    ('vehicle_resolver', ()),
+    ('prompt_index', ()),
+    ('catalog_block', ('prompt_index',)),
+    ('fast_extractor', ()),
+    ('aggregate_solver', ()),
+)
+
+SAMPLE_TEXTS = (
+    "Firma Chłodex Sp. z o.o., ul. Polna 12, 00-950 Warszawa, NIP 526-000-12-46. "
+    "Proszę o ofertę na zabudowę izotermiczną Opel Vivaro L2H1, temperatura 0 st.C.",
+    "Dzień dobry, potrzebujemy chłodni -20 do Renault Master L3 H2 z zasilaniem 230V.",
+    "Proszę o wycenę zabudowy dla busa, kontakt jan.kowalski@example.com",
+)
+
+
+class SyntheticDatabase:
+    """Zamiennik OfferDatabase z katalogiem w pamięci (bez pliku SQLite)"""
+
+    def __init__(self, catalog):
+        self._catalog = catalog
+
+    def catalog(self):
+        return self._catalog
+
+    def get_vehicle_info(self, marka, model):
+        return self._catalog.vehicle_info(marka, model)
+
+
+def scaled_rows(base, scale):
+    """Tabele katalogu powielone scale razy; kopie pojazdów i agregatów dostają inne nazwy"""
+    vehicles = [
+        (row[0] if i == 0 else f"{row[0]} S{i}", *row[1:])
+        for i in range(min(scale, VEHICLE_SCALE_CAP)) for row in base.vehicles
+    ]
+    agregaty = [
+        (row[0], row[1] if i == 0 else f"{row[1]}-{i}", *row[2:])
+        for i in range(scale) for row in base.agregaty
+    ]
+    return vehicles, agregaty, base.grzanie, base.zestawy, base.wyposazenie
+
+
+class Runner:
+    """Pomiar etapów: minimum, mediana i p95 czasu jednego wywołania w ms"""
+
+    def __init__(self, only=None, repeat=5):
+        self.only = only
+        self.repeat = repeat
+        self.results = {}
+
+    def wanted(self, name) -> bool:
+        return not self.only or any(part in name for part in self.only)
+
+    def bench(self, name, fn, number=1, repeat=None, warmup=1):
+        if not self.wanted(name):
+            return
+        for _ in range(warmup):
+            fn()
+        samples = []
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            samples.append((time.perf_counter() - start) * 1000 / number)
+        self._store(name, samples, number)
+
+    def build(self, name, fn, setup=lambda: None):
+        """Budowa struktur zapamiętywanych po pierwszym użyciu: fn(setup()) mierzone na świeżych
+        danych z setup() (poza pomiarem), bez rozgrzewki; zwraca wynik ostatniego wywołania fn.
+        Próg regresji dotyczy mediany."""
+        samples = []
+        wanted = self.wanted(name)
+        while not samples or wanted and (
+                len(samples) < BUILD_REPEAT
+                or len(samples) < BUILD_MAX_REPEAT and sum(samples) < BUILD_BUDGET_S * 1000):
+            data = setup()
+            # Bez odśmiecania w trakcie pomiaru (jak timeit) - porządki po setup() robimy wcześniej
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                result = fn(data)
+                samples.append((time.perf_counter() - start) * 1000)
+            finally:
+                gc.enable()
+        if wanted:
+            self._store(name, samples, 1, gate='median_ms')
+        return result
+
+    def _store(self, name, samples, number, gate='min_ms'):
+        samples = sorted(samples)
+        self.results[name] = {
+            'min_ms': round(samples[0], 4),
+            'median_ms': round(statistics.median(samples), 4),
+            'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+            'repeat': len(samples),
+            'number': number,
+            'gate': gate
+        }
+        result = self.results[name]
+        print(f"{name:<40}{result['min_ms']:>12.3f}{result['median_ms']:>12.3f}{result['p95_ms']:>12.3f}")
+
+
+def calibrate(repeat=20) -> float:
+    """Minimum czasu (ms) stałego obciążenia w czystym Pythonie - miara bieżącej szybkości maszyny"""
+    def workload():
+        data = {f"klucz {i}": str(i * 7919 % 1000) for i in range(20_000)}
+        return sorted(data.items(), key=lambda item: item[1])
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        workload()
+        samples.append((time.perf_counter() - start) * 1000)
+    return min(samples)
+
+
+def fresh_snapshot(rows, prepared=()):
+    """Nowa migawka bez zbudowanych struktur pochodnych (poza wskazanymi w prepared)"""
+    snapshot = CatalogSnapshot.from_rows(*rows)
+    for name in prepared:
+        getattr(snapshot, name)
+    return snapshot
+
+
+def make_generator(catalog):
+    return OfferGenerator(SyntheticDatabase(catalog), cache=LLMResponseCache(':memory:'), client=StubOpenAI())
+
+
+def bench_catalog(runner, base, scale):
+    """Etapy zależne od rozmiaru katalogu"""
+    tag = f"x{scale}"
+    rows = scaled_rows(base, scale)
+    catalog = runner.build(f"catalog_build/{tag}", lambda _: CatalogSnapshot.from_rows(*rows))
+    for name, prepared in DERIVED_STRUCTURES:
+        stage = f"catalog_{name}/{tag}"
+        if runner.wanted(stage):
+            runner.build(stage, lambda snapshot: getattr(snapshot, name), lambda: fresh_snapshot(rows, prepared))
+        # Kolejne etapy korzystają z gotowych struktur migawki
+        getattr(catalog, name)
+
+    generator = make_generator(catalog)
+    vehicles = catalog.vehicles
+    step = max(1, len(vehicles) // 97)
+    exact = [(row[0], row[1]) for row in vehicles[::step]]
+    fuzzy = [(marka.lower(), model.replace('H', ' H')) for marka, model in exact]
+    runner.bench(f"vehicle_lookup_exact/{tag}", lambda: [catalog.vehicle_info(*name) for name in exact],
+                 number=10)
+    runner.bench(f"vehicle_lookup_fuzzy/{tag}", lambda: [catalog.vehicle_info(*name) for name in fuzzy])
+
+    fast_results = {text: generator._fast_extract(text, catalog) for text in SAMPLE_TEXTS}
+    runner.bench(f"fast_extract/{tag}", lambda: [generator._fast_extract(t, catalog) for t in SAMPLE_TEXTS])
+    runner.bench(f"prompt_build/{tag}", lambda: [
+        generator._prepare_llm_request(t, catalog, fast) for t, fast in fast_results.items()
+    ])
+
+    offer = StubOpenAI().synthesize([{'role': 'user', 'content': SAMPLE_TEXTS[0]}])
+    extracted = json.loads(offer)
+    runner.bench(f"aggregate_select/{tag}", lambda: generator._select_aggregate(catalog, 6.0, extracted), number=10)
+
+    def create_offers():
+        # Nowy cache przy każdym przebiegu - mierzona jest ścieżka bez trafień w cache
+        generator.cache = LLMResponseCache(':memory:')
+        for text in SAMPLE_TEXTS:
+            generator.create_offer(text, {}, 0)
+    runner.bench(f"create_offer_stub/{tag}", create_offers)
+
+
+def bench_offer(runner, base):
+    """Etapy niezależne od rozmiaru katalogu"""
+    catalog = CatalogSnapshot.from_rows(*scaled_rows(base, 1))
+    generator = make_generator(catalog)
+    content = StubOpenAI().synthesize([{'role': 'user', 'content': SAMPLE_TEXTS[0]}])
+    runner.bench("response_parse", lambda: generator._parse_response(content), number=100)
+
+    offer_data, _ = generator.create_offer(SAMPLE_TEXTS[0], {}, 0)
+    runner.bench("total_cost", lambda: generator.calculate_total_cost(offer_data, 300.0), number=1000)
+    variants = [offer_data] * 10_000
+    selections = DEFAULT_PRICE_LIST.selection_matrix([{'atest_pzh': True, 'pianka_40mm': True}] * len(variants))
+    columns = offer_columns(variants)
+    runner.bench("price_batch/10000", lambda: price_batch(columns, selections=selections))
+
+    model = Offer.from_dict(offer_data, 300.0)
+    runner.bench("offer_model_from_dict", lambda: Offer.from_dict(offer_data, 300.0), number=100)
+    runner.bench("offer_model_rows", lambda: [model.rows(s) for s in model.sections], number=100)
+
+    rows = [dict(row) for row in model.rows('pojazd')]
+    edited = [dict(row, **({'Wartość': '12000'} if row['Pole'] == 'zabudowa_cena' else {})) for row in rows]
+
+    def apply_edit():
+        model.apply_rows('pojazd', edited)
+        model.apply_rows('pojazd', rows)
+    runner.bench("offer_model_apply_rows", apply_edit, number=100)
+    runner.bench("offer_model_to_dict", model.to_dict, number=100)
+
+    for count in PDF_COUNTS:
+        for images, label in ((None, 'bez_obrazow'), (IMAGES, 'z_obrazami')):
+            runner.bench(
+                f"pdf_render/{count}/{label}",
+                lambda: [render_offer_pdf_bytes(offer_data, {'atest_pzh': True}, 100.0, images) for _ in range(count)],
+                number=max(1, 10 // count), repeat=max(MIN_GATE_REPEAT, min(runner.repeat, 30 // count))
+            )
+
+
+def compare(results, baseline, threshold, speed=1.0) -> list:
+    """Wypisuje porównanie z plikiem bazowym; zwraca nazwy etapów z regresją.
+
+    Porównywane jest minimum albo mediana (pole gate wyniku); etapy z mniej niż MIN_GATE_REPEAT
+    pomiarami (w bieżącym przebiegu lub w pliku bazowym) są tylko wypisywane.
+    speed: stosunek czasu kalibracji bazowej do bieżącej - bieżące wyniki są przez niego mnożone.
+    """
+    regressions = []
+    print(f"\n{'etap':<40}{'bazowy [ms]':>14}{'teraz [ms]':>14}{'zmiana':>10}")
+    for name, result in results.items():
+        gate = result.get('gate', 'min_ms')
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<40}{'-':>14}{result[gate]:>14.3f}{'nowy':>10}")
+            continue
+        before, now = base[gate], result[gate] * speed
+        change = now / before - 1 if before else 0.0
+        gated = min(result['repeat'], base['repeat']) >= MIN_GATE_REPEAT
+        regressed = gated and change > threshold and now - before > MIN_DELTA_MS
+        marker = '  REGRESJA' if regressed else ('' if gated else '  (informacyjnie)')
+        print(f"{name:<40}{before:>14.3f}{now:>14.3f}{change:>+10.1%}{marker}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='autoadaptacje.db')
+    parser.add_argument('--scales', type=int, nargs='+', default=list(SCALES), help="skale katalogu syntetycznego")
+    parser.add_argument('--only', nargs='*', help="uruchom tylko etapy zawierające podany tekst")
+    parser.add_argument('--repeat', type=int, default=5, help="liczba pomiarów etapu")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="dopuszczalny wzrost minimum względem pliku bazowego (0.25 = 25%%)")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help="zapisz wyniki jako nowy plik bazowy")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    base = CatalogService(args.db).snapshot()
+    runner = Runner(args.only, args.repeat)
+    calibration = calibrate()
+    print(f"{'etap':<40}{'minimum [ms]':>12}{'mediana [ms]':>12}{'p95 [ms]':>12}")
+    for scale in args.scales:
+        bench_catalog(runner, base, scale)
+    bench_offer(runner, base)
+    # Kalibracja przed i po pomiarach - minimum odpowiada najmniej obciążonej chwili
+    calibration = min(calibration, calibrate())
+    print(f"\nkalibracja: {calibration:.3f} ms")
+
+    if args.update_baseline:
+        # Przebieg częściowy (--only, --scales) aktualizuje tylko zmierzone etapy
+        stages = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                stages = json.load(f)['stages']
+        stages.update(runner.results)
+        baseline = {
+            'meta': {
+                'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'processor': platform.processor() or platform.machine(),
+                'cpu_count': os.cpu_count(),
+                'calibration_ms': round(calibration, 4)
+            },
+            'stages': stages
+        }
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"\nZapisano plik bazowy: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nBrak pliku bazowego {args.baseline} - uruchom z --update-baseline")
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    speed = baseline['meta'].get('calibration_ms', calibration) / calibration
+    print(f"kalibracja bazowa: {baseline['meta'].get('calibration_ms', calibration):.3f} ms (współczynnik {speed:.2f})")
+    regressions = compare(runner.results, baseline['stages'], args.threshold, speed)
+    if regressions:
+        print(f"\nRegresja powyżej {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"\nBez regresji powyżej {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""Masowe ponowne renderowanie PDF dla zapisanych ofert (np. po zmianie OfferTemplate).
+
+Wejście to plik JSONL - każda linia zawiera ofertę w polu "offer" (np. results.jsonl
+z batch_offers.py) albo sam obiekt oferty. Opcjonalne pola: "id", "selected_attachments",
+"attachments_cost", "images". Pliki wynikowe mają deterministyczne nazwy <id>.pdf, więc
+ponowne uruchomienie nadpisuje te same pliki.
+
+Przykład:
+    python bulk_render.py batch_out/results.jsonl --out-dir rerender --workers 4
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from logging_setup import setup_logging
+from offer_generator import LOGO_PATH, HEADER_COLOR, build_offer_pdf
+from pdf_assets import get_image_asset
+from pdf_store import safe_name
+
+logger = logging.getLogger(__name__)
+
+# Szerokości obrazów w szablonie (mm) - do wstępnego przygotowania w procesach roboczych
+LOGO_WIDTH = 40
+PHOTO_WIDTH = 60
+
+
+def iter_offers(path):
+    """Strumieniowo czyta oferty z pliku JSONL i zwraca zadania renderowania"""
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Linia {line_no}: niepoprawny JSON: {str(e)}")
+                continue
+            offer = item.get('offer', item)
+            offer_id = item.get('id') or offer.get('numer_oferty') or hashlib.sha256(
+                json.dumps(offer, sort_keys=True, ensure_ascii=False).encode('utf-8')
+            ).hexdigest()[:16]
+            yield {
+                'id': str(offer_id),
+                'offer': offer,
+                'selected_attachments': item.get('selected_attachments') or offer.get('dodatkowe_wyposazenie') or {},
+                'attachments_cost': item.get('attachments_cost', 0),
+                'images': item.get('images')
+            }
+
+
+def _init_worker(images):
+    """Inicjalizacja procesu roboczego: obrazy przygotowywane są raz na proces"""
+    get_image_asset(LOGO_PATH, LOGO_WIDTH, HEADER_COLOR)
+    for image_path in images:
+        if os.path.exists(image_path):
+            get_image_asset(image_path, PHOTO_WIDTH)
+
+
+def render_task(task, out_dir, default_images) -> dict:
+    """Renderuje jeden PDF do <out_dir>/<id>.pdf; nie korzysta ze stanu sesji Streamlit"""
+    start = time.perf_counter()
+    images = task['images'] if task['images'] is not None else default_images
+    pdf = build_offer_pdf(task['offer'], task['selected_attachments'], task['attachments_cost'], images)
+    data = pdf.output(dest='S').encode('latin-1')
+
+    pdf_path = os.path.join(out_dir, f"{safe_name(task['id'])}.pdf")
+    tmp_path = f"{pdf_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, pdf_path)
+    return {
+        'id': task['id'],
+        'pdf': pdf_path,
+        'pages': pdf.page,
+        'bytes': len(data),
+        'seconds': round(time.perf_counter() - start, 4)
+    }
+
+
+def run(args) -> dict:
+    os.makedirs(args.out_dir, exist_ok=True)
+    tasks = list(iter_offers(args.input))
+    total = len(tasks)
+    done = failed = pages = size = 0
+    failures = []
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.images,)) as pool:
+        futures = {pool.submit(render_task, task, args.out_dir, args.images): task['id'] for task in tasks}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+                done += 1
+                pages += result['pages']
+                size += result['bytes']
+            except Exception as e:
+                failed += 1
+                failures.append({'id': futures[future], 'error': str(e)})
+                logger.error(f"Błąd renderowania {futures[future]}: {str(e)}")
+            finished = done + failed
+            if not args.quiet and (finished == total or finished % args.progress_every == 0):
+                elapsed = time.perf_counter() - started
+                print(f"[{finished}/{total}] {elapsed:.1f} s, błędy: {failed}", file=sys.stderr, flush=True)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'rendered': done,
+        'failed': failed,
+        'pages': pages,
+        'megabytes': round(size / 1024 / 1024, 3),
+        'elapsed_s': round(elapsed, 3),
+        'documents_per_s': round(done / elapsed, 3) if elapsed else 0.0,
+        'pages_per_s': round(pages / elapsed, 3) if elapsed else 0.0,
+        'mb_per_s': round(size / 1024 / 1024 / elapsed, 3) if elapsed else 0.0,
+        'failures': failures
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Masowe renderowanie PDF zapisanych ofert")
+    parser.add_argument('input', help="plik JSONL z ofertami")
+    parser.add_argument('--out-dir', default='rerender', help="katalog na pliki <id>.pdf")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help="liczba procesów renderujących")
+    parser.add_argument('--images', nargs='*', default=[], help="zdjęcia dla ofert bez własnej listy zdjęć")
+    parser.add_argument('--progress-every', type=int, default=10, help="co ile dokumentów raportować postęp")
+    parser.add_argument('--quiet', action='store_true', help="bez raportowania postępu")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging()
+    summary = run(args)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
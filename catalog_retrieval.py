@@ -0,0 +1,172 @@
+import logging
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Liczba kandydatów przekazywanych do LLM
+TOP_VEHICLES = 10
+
+# Minimalne pokrycie nazwy pojazdu przez tekst oferty, poniżej którego
+# wysyłamy pełny katalog
+MIN_CONFIDENCE = 0.6
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_VARIANT_RE = re.compile(r"^(l\d)(h\d)$")
+
+
+def normalize_text(text) -> str:
+    """Zamienia tekst na małe litery bez polskich znaków i akcentów"""
+    if text is None:
+        return ''
+    text = str(text).casefold().replace('ł', 'l')
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text) -> list:
+    """Dzieli tekst na tokeny; warianty typu "L2H1" dostają też tokeny "l2" i "h1" """
+    tokens = []
+    for token in _TOKEN_RE.findall(normalize_text(text)):
+        tokens.append(token)
+        match = _VARIANT_RE.match(token)
+        if match:
+            tokens.extend(match.groups())
+    return tokens
+
+
+def _features(tokens) -> set:
+    """Cechy dokumentu: tokeny oraz trigramy znakowe tokenów"""
+    features = set(tokens)
+    for token in tokens:
+        padded = f" {token} "
+        features.update(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+
+def _compact_value(value) -> str:
+    """Wartość komórki w zwięzłym zapisie (bez ".0" i zbędnych spacji)"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return ' '.join(str(value).split()).replace('|', '/')
+
+
+# Tabele katalogu w promptcie: nazwa i kolumny
+VEHICLE_TABLE = ("POJAZDY", ("marka", "model", "kubatura", "zabudowa_cena", "sklejki_cena", "nadkola_cena"))
+HEATING_TABLE = ("OPCJE_GRZANIA", ("model", "opcja", "cena"))
+
+
+def table_header(title, header) -> str:
+    return f"{title} ({'|'.join(header)})"
+
+
+def format_table(title, header, rows) -> str:
+    """Tabela w formacie: tytuł z nagłówkiem kolumn, potem jeden wiersz na linię, pola oddzielone "|" """
+    lines = [table_header(title, header)]
+    lines.extend('|'.join(_compact_value(value) for value in row) for row in rows)
+    return '\n'.join(lines)
+
+
+def catalog_schema() -> str:
+    """Same nagłówki tabel katalogu - część stałego prefiksu promptu"""
+    return '\n'.join(table_header(*table) for table in (VEHICLE_TABLE, HEATING_TABLE))
+
+
+def build_catalog_block(vehicles, grzanie) -> str:
+    """Zwięzły, tabelaryczny blok katalogu do promptu (pojazdy i opcje grzania)"""
+    return '\n\n'.join([
+        format_table(*VEHICLE_TABLE, (v[:6] for v in vehicles)),
+        format_table(*HEATING_TABLE, (g[:3] for g in grzanie))
+    ])
+
+
+@dataclass
+class RetrievalResult:
+    block: str
+    confidence: float
+    fallback: bool
+    full_size: int
+
+    @property
+    def selected_size(self) -> int:
+        return len(self.block)
+
+    @property
+    def reduction(self) -> float:
+        """Procentowe zmniejszenie bloku katalogu względem pełnego katalogu"""
+        if not self.full_size:
+            return 0.0
+        return 100.0 * (1 - self.selected_size / self.full_size)
+
+
+class CatalogIndex:
+    """Indeks TF-IDF (tokeny + trigramy) nad pojazdami z bazy"""
+
+    def __init__(self, vehicles, grzanie):
+        self.vehicles = list(vehicles)
+        self.grzanie = list(grzanie)
+
+        self._vehicle_features = [
+            _features(tokenize(f"{v[0]} {v[1]}")) for v in self.vehicles
+        ]
+
+        # Indeks odwrócony: cecha -> lista pojazdów
+        self._postings = defaultdict(list)
+        for idx, features in enumerate(self._vehicle_features):
+            for feature in features:
+                self._postings[feature].append(idx)
+
+        count = len(self.vehicles) or 1
+        self._idf = {
+            feature: math.log(1 + count / len(postings))
+            for feature, postings in self._postings.items()
+        }
+        self._vehicle_weight = [
+            sum(self._idf[f] for f in features) or 1.0
+            for features in self._vehicle_features
+        ]
+
+        self._full_block = None
+
+    @property
+    def full_block(self) -> str:
+        """Pełny katalog w zapisie tabelarycznym, budowany przy pierwszym użyciu"""
+        if self._full_block is None:
+            self._full_block = build_catalog_block(self.vehicles, self.grzanie)
+        return self._full_block
+
+    def search_vehicles(self, text, top_n=TOP_VEHICLES) -> list:
+        """Zwraca listę (wynik, indeks) pojazdów najlepiej pasujących do tekstu"""
+        query = _features(tokenize(text))
+        scores = defaultdict(float)
+        for feature in query:
+            for idx in self._postings.get(feature, ()):
+                scores[idx] += self._idf[feature]
+
+        ranked = sorted(
+            ((score / self._vehicle_weight[idx], idx) for idx, score in scores.items()),
+            key=lambda item: (-item[0], item[1])
+        )
+        return ranked[:top_n]
+
+    def select_context(self, text, top_n=TOP_VEHICLES) -> RetrievalResult:
+        """Wybiera kandydatów dla tekstu oferty; przy niskiej pewności zwraca pełny katalog"""
+        ranked = self.search_vehicles(text, top_n)
+        confidence = ranked[0][0] if ranked else 0.0
+        full_size = len(self.full_block)
+
+        if confidence < MIN_CONFIDENCE:
+            return RetrievalResult(self.full_block, confidence, True, full_size)
+
+        # Tylko kandydaci o wyniku zbliżonym do najlepszego. Opcje grzania idą w całości -
+        # agregat dobierany jest lokalnie dopiero po odpowiedzi LLM
+        vehicles = [
+            self.vehicles[idx] for score, idx in ranked
+            if score >= confidence * 0.8
+        ]
+        return RetrievalResult(build_catalog_block(vehicles, self.grzanie), confidence, False, full_size)
@@ -0,0 +1,175 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import cached_property
+from types import MappingProxyType
+
+import streamlit as st
+
+from llm_cache import catalog_fingerprint
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'autoadaptacje.db'
+
+# Jak często (w sekundach) sprawdzać, czy baza zmieniła się od ostatniego odczytu
+REFRESH_CHECK_INTERVAL = 2.0
+
+VEHICLE_COLUMNS = [
+    "Marka", "Model", "Kubatura (m³)",
+    "Zabudowy izotermiczne Cena (zł netto)",
+    "Sklejki Cena (zł netto)",
+    "Nadkola sklejka 12mm Cena zł netto"
+]
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Niezmienna kopia tabel cennikowych z gotowymi słownikami wyszukiwania"""
+    vehicles: tuple
+    agregaty: tuple
+    grzanie: tuple
+    zestawy: tuple
+    version: str
+    vehicles_by_name: MappingProxyType = field(repr=False)
+    # Wiersze (kod, nazwa, sekcja, cena) tabeli cen wyposażenia; nie wchodzą do wersji katalogu,
+    # bo nie trafiają do promptu
+    wyposazenie: tuple = ()
+
+    @classmethod
+    def from_rows(cls, vehicles, agregaty, grzanie, zestawy, wyposazenie=()):
+        vehicles = tuple(vehicles)
+        by_name = {}
+        for row in vehicles:
+            by_name.setdefault((row[0], row[1]), row)
+        return cls(
+            vehicles=vehicles,
+            agregaty=tuple(agregaty),
+            grzanie=tuple(grzanie),
+            zestawy=tuple(zestawy),
+            version=catalog_fingerprint(vehicles, agregaty, grzanie, zestawy),
+            vehicles_by_name=MappingProxyType(by_name),
+            wyposazenie=tuple(wyposazenie)
+        )
+
+    def vehicle_info(self, marka, model):
+        """Dane pojazdu w formacie OfferDatabase.get_vehicle_info lub None"""
+        row = self.vehicles_by_name.get((marka, model))
+        if row is None:
+            row = self.vehicle_resolver.resolve(marka, model)
+        if row is None:
+            return None
+        return {
+            'marka': row[0],
+            'model': row[1],
+            'kubatura': row[2],
+            'zabudowa_cena': row[3],
+            'sklejki_cena': row[4],
+            'nadkola_cena': row[5]
+        }
+
+    # Struktury pochodne budowane leniwie, raz na wersję katalogu
+
+    @cached_property
+    def vehicle_resolver(self):
+        from vehicle_resolver import VehicleResolver
+        return VehicleResolver(self.vehicles)
+
+    @cached_property
+    def prompt_index(self):
+        """Indeks wyszukiwania kandydatów do promptu (pojazdy i opcje grzania)"""
+        from catalog_retrieval import CatalogIndex
+        return CatalogIndex(self.vehicles, self.grzanie)
+
+    @property
+    def catalog_block(self) -> str:
+        """Pełny tabelaryczny blok katalogu, budowany raz na wersję katalogu"""
+        return self.prompt_index.full_block
+
+    @cached_property
+    def fast_extractor(self):
+        from fast_extractor import FastExtractor
+        return FastExtractor(self.vehicles, self.agregaty, self.grzanie)
+
+    @cached_property
+    def aggregate_solver(self):
+        from aggregate_solver import AggregateSolver
+        return AggregateSolver(self.agregaty)
+
+    @cached_property
+    def price_list(self):
+        """Cennik dodatkowego wyposażenia"""
+        from pricing import PriceList
+        return PriceList.from_rows(self.wyposazenie)
+
+    @cached_property
+    def vehicles_frame(self):
+        """Tabela pojazdów jako DataFrame (panel administracyjny)"""
+        import pandas as pd
+        return pd.DataFrame(list(self.vehicles), columns=VEHICLE_COLUMNS)
+
+
+class CatalogService:
+    """Wspólny dla procesu dostęp do katalogu: jedno połączenie tylko do odczytu i migawka w pamięci"""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self._snapshot = None
+        self._data_version = None
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def _read_snapshot(self) -> CatalogSnapshot:
+        cursor = self._conn.cursor()
+        columns = ', '.join(f'"{column}"' for column in VEHICLE_COLUMNS)
+        vehicles = cursor.execute(f'SELECT {columns} FROM samochody').fetchall()
+        agregaty = cursor.execute('SELECT * FROM "Agregaty Daikin"').fetchall()
+        grzanie = cursor.execute('SELECT * FROM "Grzanie"').fetchall()
+        zestawy = cursor.execute('SELECT * FROM "Zestaw_podgrzewacza_odplywu_skroplin"').fetchall()
+        try:
+            wyposazenie = cursor.execute(
+                'SELECT "Kod", "Nazwa", "Sekcja", "Cena PLN" FROM "Ceny wyposażenia"'
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # Baza bez tabeli cen (tworzy ją OfferDatabase) - obowiązują ceny domyślne
+            logger.warning("Brak tabeli cen wyposażenia, używam cen domyślnych")
+            wyposazenie = ()
+        return CatalogSnapshot.from_rows(vehicles, agregaty, grzanie, zestawy, wyposazenie)
+
+    def _changed(self) -> bool:
+        """Czy plik bazy lub jej zawartość zmieniły się od ostatniego odczytu"""
+        mtime = os.stat(self.db_path).st_mtime_ns
+        data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        changed = (mtime, data_version) != (self._mtime, self._data_version)
+        self._mtime, self._data_version = mtime, data_version
+        return changed
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Aktualna migawka katalogu; baza sprawdzana jest najwyżej co REFRESH_CHECK_INTERVAL s"""
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot is not None and now - self._checked_at < REFRESH_CHECK_INTERVAL:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is None or (now - self._checked_at >= REFRESH_CHECK_INTERVAL and self._changed()):
+                start = time.perf_counter()
+                self._snapshot = self._read_snapshot()
+                self._changed()
+                logger.info(
+                    f"Wczytano katalog {self._snapshot.version} "
+                    f"w {(time.perf_counter() - start) * 1000:.1f} ms"
+                )
+            self._checked_at = now
+            return self._snapshot
+
+
+@st.cache_resource
+def get_catalog_service(db_path=DB_PATH) -> CatalogService:
+    """Jedna instancja serwisu katalogu na proces (wspólna dla sesji i przeładowań Streamlit)"""
+    return CatalogService(db_path)
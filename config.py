@@ -3,13 +3,28 @@ import streamlit as st
 
 # Próba załadowania zmiennych środowiskowych z pliku .env
 
+def _secret(name):
+    """Wartość z sekretów Streamlit; poza aplikacją (np. w trybie wsadowym) plik sekretów może nie istnieć"""
+    try:
+        return st.secrets.get(name)
+    except FileNotFoundError:
+        return None
+
 # Próba pobrania klucza API z różnych źródeł
 OPENAI_API_KEY = (
-    st.secrets.get("OPENAI_API_KEY") or  # Z sekretów Streamlit
+    _secret("OPENAI_API_KEY") or  # Z sekretów Streamlit
+    os.environ.get("OPENAI_API_KEY") or  # Ze zmiennych środowiskowych
     None  # Jeśli nie znaleziono
 )
 
-if not OPENAI_API_KEY:
+# Adres API zgodnego z OpenAI, np. lokalnego serwera llm_stub_server.py (domyślnie api.openai.com)
+OPENAI_BASE_URL = (
+    _secret("OPENAI_BASE_URL") or
+    os.environ.get("OPENAI_BASE_URL") or
+    None
+)
+
+if not OPENAI_API_KEY and not OPENAI_BASE_URL:
     st.error("""
     Brak klucza API OpenAI. 
     1. Utwórz plik .env w głównym katalogu projektu
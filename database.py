@@ -3,15 +3,20 @@ import logging
 from typing import Optional, List, Dict
 import json
 import os
+import threading
 import streamlit as st
 
+from catalog_service import DB_PATH, CatalogSnapshot, get_catalog_service
+from pricing import ATTACHMENTS, PriceList
+
 logger = logging.getLogger(__name__)
 
 class OfferDatabase:
-    def __init__(self):
+    def __init__(self, db_path=DB_PATH):
         """Inicjalizacja połączenia z bazą SQLite"""
         try:
-            db_path = 'autoadaptacje.db'
+            self.db_path = db_path
+            self._lock = threading.Lock()
             
             # Sprawdź czy plik istnieje
             if not os.path.exists(db_path):
@@ -20,8 +25,10 @@ class OfferDatabase:
             else:
                 logger.info(f"Znaleziono plik bazy danych: {db_path}")
             
-            self.conn = sqlite3.connect(db_path)
+            # Połączenie współdzielone między sesjami Streamlit (różne wątki)
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
             self.create_tables()
+            self.catalog_service = get_catalog_service(db_path)
             
             
         except Exception as e:
@@ -30,6 +37,10 @@ class OfferDatabase:
             raise
 
     def create_tables(self):
+        with self._lock:
+            self._create_tables()
+
+    def _create_tables(self):
         cursor = self.conn.cursor()
         
         # Tworzenie tabel zgodnie z nowym schematem
@@ -78,42 +89,49 @@ class OfferDatabase:
                 "Nadkola sklejka 12mm Cena zł netto" INTEGER
             )
         """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS "Ceny wyposażenia" (
+                "Kod" TEXT PRIMARY KEY,
+                "Nazwa" TEXT,
+                "Sekcja" TEXT,
+                "Cena PLN" REAL
+            )
+        """)
+        # Ceny domyślne tylko dla brakujących pozycji - zmienione w bazie ceny zostają
+        cursor.executemany(
+            'INSERT OR IGNORE INTO "Ceny wyposażenia" ("Kod", "Nazwa", "Sekcja", "Cena PLN") VALUES (?, ?, ?, ?)',
+            ATTACHMENTS
+        )
+
+        # Pojazdy wyszukiwane są w migawce katalogu (słownik), nie zapytaniem SQL - indeks
+        # (Marka, Model) z wcześniejszych wersji tylko spowalniał import cennika
+        cursor.execute('DROP INDEX IF EXISTS "idx_samochody_marka_model"')
         
         self.conn.commit()
 
+    def catalog(self) -> CatalogSnapshot:
+        """Aktualna migawka tabel cennikowych (bez zapytań do bazy na gorącej ścieżce)"""
+        return self.catalog_service.snapshot()
+
     def get_vehicle_info(self, marka, model):
-        """Pobiera informacje o pojeździe z nowej struktury bazy danych"""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT 
-                "Marka", "Model", "Kubatura (m³)",
-                "Zabudowy izotermiczne Cena (zł netto)",
-                "Sklejki Cena (zł netto)",
-                "Nadkola sklejka 12mm Cena zł netto"
-            FROM samochody
-            WHERE "Marka" = ? AND "Model" = ?
-        """, (marka, model))
-        
-        result = cursor.fetchone()
-        if result:
-            return {
-                'marka': result[0],
-                'model': result[1],
-                'kubatura': result[2],
-                'zabudowa_cena': result[3],
-                'sklejki_cena': result[4],
-                'nadkola_cena': result[5]
-            }
-        return None
+        """Pobiera informacje o pojeździe z migawki katalogu"""
+        return self.catalog().vehicle_info(marka, model)
 
     def get_available_aggregates(self):
         """Pobiera dostępne agregaty Daikin"""
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM "Agregaty Daikin"')
-        return cursor.fetchall()
+        return list(self.catalog().agregaty)
 
     def get_heating_options(self):
         """Pobiera opcje grzania"""
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM "Grzanie"')
-        return cursor.fetchall() 
\ No newline at end of file
+        return list(self.catalog().grzanie)
+
+    def get_price_list(self) -> PriceList:
+        """Cennik dodatkowego wyposażenia"""
+        return self.catalog().price_list
+
+
+@st.cache_resource
+def get_shared_database(db_path=DB_PATH) -> OfferDatabase:
+    """Jedna instancja OfferDatabase na proces - tabele tworzone są tylko raz"""
+    return OfferDatabase(db_path)
@@ -0,0 +1,308 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from catalog_retrieval import normalize_text
+from offer_schema import aggregate_row_to_offer, empty_offer, vehicle_row_to_offer
+
+logger = logging.getLogger(__name__)
+
+# Minimalna pewność, od której pole uznajemy za ustalone bez LLM
+MIN_FIELD_CONFIDENCE = 0.8
+# Pewność wartości domyślnych (tekst nic nie mówi) - poniżej progu, decyduje LLM lub dobór agregatu
+DEFAULT_FIELD_CONFIDENCE = 0.3
+
+# Pola, które muszą być ustalone, aby całkowicie pominąć wywołanie LLM
+REQUIRED_FIELDS = [
+    ('dane_klienta', 'nazwa'),
+    ('dane_klienta', 'adres'),
+    ('dane_klienta', 'nip'),
+    ('pojazd', 'marka'),
+    ('pojazd', 'model'),
+    ('wymagania', 'temperatura'),
+    ('wymagania', 'zasilanie'),
+]
+
+# Słowa kluczowe oznaczające, że klient oczekuje danej sekcji oferty
+SECTION_KEYWORDS = {
+    'grzanie': ('grzanie', 'grzaniem', 'ogrzewanie'),
+    'zestaw_podgrzewacza': ('podgrzewacz', 'skroplin'),
+}
+
+NIP_WEIGHTS = (6, 5, 7, 2, 3, 4, 5, 6, 7)
+
+# Dłuższa "nazwa firmy" to zwykle przechwycony fragment zdania - trafia do LLM z niską pewnością
+MAX_COMPANY_LENGTH = 80
+MAX_COMPANY_WORDS = 8
+MAX_PERSON_WORDS = 4
+
+_NIP_RE = re.compile(r"(NIP[:\s]*)?(?<!\d)(\d{3}[-\s]?\d{3}[-\s]?\d{2}[-\s]?\d{2}|\d{3}[-\s]?\d{2}[-\s]?\d{2}[-\s]?\d{3})(?!\d)", re.IGNORECASE)
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PHONE_RE = re.compile(r"(tel(?:efon)?\.?[:\s]*|kom(?:órka)?\.?[:\s]*)?(?<![\d-])((?:\+48[\s-]?)?\d{3}[\s-]?\d{3}[\s-]?\d{3})(?![\d-])", re.IGNORECASE)
+_LEGAL_FORM = r"(?i:sp\.\s*z\s*o\.\s*o\.|sp\.\s*j\.|sp\.\s*k\.|s\.\s*a\.|s\.\s*c\.)(?=[\s,;]|$)"
+_LEGAL_FORM_RE = re.compile(_LEGAL_FORM)
+# Etykieta "Firma:" - wartość do przecinka, średnika lub końca wiersza (zdanie przycina _SENTENCE_END_RE)
+_COMPANY_LABEL_RE = re.compile(r"(?:firma|klient|nazwa firmy)\s*[:\-]\s*([^\n,;]+)", re.IGNORECASE)
+# Forma prawna poprzedzona najwyżej pięcioma słowami od wielkiej litery ("Lody Polarne Sp. z o.o.")
+_COMPANY_FORM_RE = re.compile(r"((?:[A-ZĄĆĘŁŃÓŚŹŻ0-9][\w&'’-]*\s+){1,5}" + _LEGAL_FORM + ")")
+_COMPANY_PREFIX_RE = re.compile(r"^(?:firma|klient|zamawiający|odbiorca)\s+", re.IGNORECASE)
+_SENTENCE_END_RE = re.compile(r"(?<=\w{2})[.!?](?=\s|$)")
+_ADDRESS_RE = re.compile(r"((?:ul\.|al\.|os\.|pl\.)?\s*[^\n,;:]*?\d+[a-zA-Z]?(?:/\d+)?,?\s*\d{2}-\d{3}\s+[^\n,;.]+)", re.IGNORECASE)
+_PERSON_RE = re.compile(r"(?:osoba kontaktowa|osoba odpowiedzialna|kontakt|zamawiający)\s*[:\-]\s*([^\n,;]+)", re.IGNORECASE)
+# Koniec imienia i nazwiska: dane kontaktowe zapisane w tej samej linii
+_PERSON_END_RE = re.compile(r"\b(?:tel|telefon|kom|komórka|e-?mail|mail)\b|\+?\d|\S+@", re.IGNORECASE)
+_DATE_RE = re.compile(r"(?<!\d)(\d{1,2})[./-](\d{1,2})[./-](\d{4})(?!\d)")
+_VARIANT_SPLIT_RE = re.compile(r"\b(l\d)\s+(h\d)\b")
+# Temperatura ujemna od -10 do -30 (również "minus 20" bez jednostki) - klasa -20°C; nie "-20%"
+_FROZEN_RE = re.compile(
+    r"(?<![\w-])(?:-|−|minus\s*)\s?(?:[12]\d|30)(?!\d|\s*%)|mroźni|mrozni|głęboko|gleboko", re.IGNORECASE
+)
+# Dodatnia temperatura tylko z kontekstem (°C, st.C, zakres "+2 do +8", "temperatura +5") - sam
+# zapis "+48" to prefiks numeru telefonu
+_CHILLED_RE = re.compile(
+    r"(?<![-\d])0\s*(?:°|st)"
+    r"|(?<![\w-])\+\s?\d{1,2}\s*(?:°|st\b|c\b|do\s*\+)"
+    r"|temperatur\w*\s*[:\-]?\s*(?:od\s*)?\+\s?\d{1,2}(?!\d)"
+    r"|izoterm|chłodzon|chlodzon", re.IGNORECASE
+)
+_POWER_400_RE = re.compile(r"\b400\s*v\b|\bsi[łl][ay]\b|\bsi[łl]ow\w*|\btr[óo]jfaz\w*", re.IGNORECASE)
+_POWER_230_RE = re.compile(r"\b230\s*v\b|\bsie[ćc]|\bpost[óo]j", re.IGNORECASE)
+
+
+def clean_company_name(value: str) -> tuple:
+    """Przycina nazwę firmy za formą prawną albo na końcu zdania; zwraca (nazwa, czy wiarygodna)"""
+    legal_form = _LEGAL_FORM_RE.search(value)
+    if legal_form:
+        value = value[:legal_form.end()]
+    else:
+        sentence_end = _SENTENCE_END_RE.search(value)
+        if sentence_end:
+            value = value[:sentence_end.start()]
+    value = _COMPANY_PREFIX_RE.sub('', ' '.join(value.split()).strip(' ,;:'))
+    plausible = (
+        0 < len(value) <= MAX_COMPANY_LENGTH
+        and len(value.split()) <= MAX_COMPANY_WORDS
+        and (value[0].isupper() or value[0].isdigit())
+    )
+    return value, plausible
+
+
+def clean_person_name(value: str) -> str:
+    """Imię i nazwisko z etykiety kontaktu - bez telefonu i e-maila; pusty tekst, gdy to nie nazwa osoby"""
+    end = _PERSON_END_RE.search(value)
+    if end:
+        value = value[:end.start()]
+    value = ' '.join(value.split()).strip(' .,;:-')
+    words = value.split()
+    if not words or len(words) > MAX_PERSON_WORDS or not all(w[0].isalpha() for w in words):
+        return ''
+    return value
+
+
+def is_valid_nip(digits: str) -> bool:
+    """Sprawdza sumę kontrolną numeru NIP"""
+    if len(digits) != 10 or not digits.isdigit():
+        return False
+    checksum = sum(int(d) * w for d, w in zip(digits, NIP_WEIGHTS)) % 11
+    return checksum == int(digits[9])
+
+
+@dataclass
+class FastExtraction:
+    """Wynik lokalnej ekstrakcji: dane oferty i pewność dla każdego pola"""
+    offer: dict = field(default_factory=empty_offer)
+    confidence: dict = field(default_factory=dict)
+    required_sections: set = field(default_factory=set)
+
+    def set(self, section, name, value, confidence):
+        """Ustawia pole, jeśli pewność jest wyższa niż dotychczasowa"""
+        key = (section, name)
+        if confidence <= self.confidence.get(key, 0.0):
+            return
+        if name is None:
+            self.offer[section] = value
+        else:
+            self.offer[section][name] = value
+        self.confidence[key] = confidence
+
+    def is_resolved(self, section, name) -> bool:
+        return self.confidence.get((section, name), 0.0) >= MIN_FIELD_CONFIDENCE
+
+    def resolved_fields(self) -> dict:
+        """Pola ustalone z wystarczającą pewnością w postaci {sekcja: {pole: wartość}}"""
+        resolved = {}
+        for (section, name), confidence in self.confidence.items():
+            if confidence < MIN_FIELD_CONFIDENCE:
+                continue
+            if name is None:
+                resolved[section] = self.offer[section]
+            else:
+                resolved.setdefault(section, {})[name] = self.offer[section][name]
+        return resolved
+
+    def unresolved(self) -> list:
+        """Lista pól, których nie udało się ustalić lokalnie"""
+        missing = [
+            f"{section}.{name}" for section, name in REQUIRED_FIELDS
+            if not self.is_resolved(section, name)
+        ]
+        missing.extend(
+            section for section in sorted(self.required_sections)
+            if not self.is_resolved(section, 'model_opcji')
+        )
+        return missing
+
+    def merge_into(self, extracted_info: dict) -> dict:
+        """Nadpisuje odpowiedź LLM polami ustalonymi lokalnie"""
+        for section, values in self.resolved_fields().items():
+            if isinstance(values, dict) and isinstance(extracted_info.get(section), dict):
+                extracted_info[section].update(values)
+            else:
+                extracted_info[section] = values
+        return extracted_info
+
+
+class FastExtractor:
+    """Regułowa ekstrakcja danych klienta oraz słownikowe dopasowanie pojazdu i agregatu"""
+
+    def __init__(self, vehicles, agregaty, grzanie=()):
+        self.vehicles = list(vehicles)
+        self.agregaty = list(agregaty)
+        self.grzanie = list(grzanie)
+
+        # Słownik "marka model" (znormalizowane) -> wiersz katalogu
+        self._vehicle_names = {}
+        for v in self.vehicles:
+            key = ' '.join(normalize_text(f"{v[0]} {v[1]}").split())
+            self._vehicle_names.setdefault(key, v)
+        # Najdłuższe nazwy sprawdzamy najpierw ("Mercedes-Benz Sprinter" przed "Sprinter")
+        self._vehicle_keys = sorted(self._vehicle_names, key=len, reverse=True)
+
+        # Kody wersji agregatów (kolumny zasilania) -> wiersz katalogu
+        self._aggregate_codes = {}
+        for a in self.agregaty:
+            for code in (a[4], a[5], a[6]):
+                code = normalize_text(code).replace('*', '').strip()
+                if code and code != '-':
+                    self._aggregate_codes.setdefault((self._model_key(a[1]), code), a)
+
+    @staticmethod
+    def _model_key(model) -> str:
+        return ''.join(normalize_text(model).split())
+
+    def extract(self, text: str) -> FastExtraction:
+        result = FastExtraction()
+        self._extract_client(text, result)
+        self._extract_vehicle(text, result)
+        self._extract_aggregate(text, result)
+        self._extract_requirements(text, result)
+        self._extract_date(text, result)
+
+        normalized = normalize_text(text)
+        for section, keywords in SECTION_KEYWORDS.items():
+            if any(k in normalized for k in keywords):
+                result.required_sections.add(section)
+
+        logger.debug(
+            f"Szybka ekstrakcja: ustalono {len(result.resolved_fields())} sekcji, "
+            f"brakuje {result.unresolved()}"
+        )
+        return result
+
+    def _extract_client(self, text, result):
+        nip_spans = []
+        for match in _NIP_RE.finditer(text):
+            digits = re.sub(r"\D", "", match.group(2))
+            labelled = bool(match.group(1))
+            if is_valid_nip(digits):
+                confidence = 1.0 if labelled else 0.85
+            elif labelled:
+                confidence = 0.5
+            else:
+                continue
+            nip_spans.append(match.span(2))
+            result.set('dane_klienta', 'nip', digits, confidence)
+
+        email = _EMAIL_RE.search(text)
+        if email:
+            result.set('dane_klienta', 'email', email.group(0), 1.0)
+
+        for match in _PHONE_RE.finditer(text):
+            if any(start <= match.start(2) < end for start, end in nip_spans):
+                continue
+            result.set('dane_klienta', 'telefon', match.group(2).strip(),
+                       0.95 if match.group(1) else 0.8)
+
+        labelled = _COMPANY_LABEL_RE.search(text)
+        if labelled:
+            name, plausible = clean_company_name(labelled.group(1))
+            if name:
+                result.set('dane_klienta', 'nazwa', name, 0.9 if plausible else 0.4)
+        company = _COMPANY_FORM_RE.search(text)
+        if company:
+            name, plausible = clean_company_name(company.group(1))
+            if name:
+                result.set('dane_klienta', 'nazwa', name, 0.85 if plausible else 0.4)
+
+        address = _ADDRESS_RE.search(text)
+        if address:
+            result.set('dane_klienta', 'adres', ' '.join(address.group(1).split()).strip(' ,;'), 0.85)
+
+        # Pierwsza etykieta z nazwą osoby - "kontakt: 600-200-300" to telefon, nie osoba
+        person = _PERSON_RE.search(text)
+        while person:
+            name = clean_person_name(person.group(1))
+            if name:
+                result.set('dane_klienta', 'osoba_odpowiedzialna', name, 0.85)
+                break
+            # Odrzucone dopasowanie może zawierać kolejną etykietę - szukamy od początku jego treści
+            person = _PERSON_RE.search(text, person.start(1))
+
+    def _extract_vehicle(self, text, result):
+        normalized = ' ' + ' '.join(normalize_text(text).split()) + ' '
+        normalized = _VARIANT_SPLIT_RE.sub(r"\1\2", normalized)
+        for key in self._vehicle_keys:
+            if f" {key} " in normalized or f" {key}," in normalized or f" {key}." in normalized:
+                vehicle = vehicle_row_to_offer(self._vehicle_names[key])
+                for name, value in vehicle.items():
+                    result.set('pojazd', name, value, 1.0)
+                return
+
+    def _extract_aggregate(self, text, result):
+        normalized = normalize_text(text)
+        compact = ''.join(normalized.split())
+        for (model, code), row in self._aggregate_codes.items():
+            if code in normalized and model in compact:
+                for name, value in aggregate_row_to_offer(row).items():
+                    result.set('agregat', name, value, 1.0)
+                return
+
+    def _extract_requirements(self, text, result):
+        """Temperatura docelowa i tryb zasilania; bez wskazań - 0°C i tylko drogowy jako pola nieustalone"""
+        # Numery telefonów (np. "+48 601 234 567") nie mogą zostać odczytane jako temperatura
+        text = _PHONE_RE.sub(' ', text)
+        if _FROZEN_RE.search(text):
+            result.set('wymagania', 'temperatura', -20, 0.95)
+        elif _CHILLED_RE.search(text):
+            result.set('wymagania', 'temperatura', 0, 0.95)
+        else:
+            result.set('wymagania', 'temperatura', 0, DEFAULT_FIELD_CONFIDENCE)
+
+        if _POWER_400_RE.search(text):
+            result.set('wymagania', 'zasilanie', 'drogowy_siec_400V', 0.95)
+        elif _POWER_230_RE.search(text):
+            result.set('wymagania', 'zasilanie', 'drogowy_siec_230V', 0.95)
+        else:
+            result.set('wymagania', 'zasilanie', 'tylko_drogowy', DEFAULT_FIELD_CONFIDENCE)
+
+    def _extract_date(self, text, result):
+        match = _DATE_RE.search(text)
+        if match:
+            day, month, year = (int(g) for g in match.groups())
+            try:
+                result.set('data_oferty', None, datetime(year, month, day).strftime('%Y-%m-%d'), 0.9)
+                return
+            except ValueError:
+                pass
+        result.set('data_oferty', None, datetime.now().strftime('%Y-%m-%d'), 0.8)
@@ -0,0 +1,102 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalJSONParser:
+    """Parser strumienia JSON zwracający pola obiektu najwyższego poziomu, gdy tylko się domkną.
+
+    Tekst przed pierwszym "{" (np. znaczniki markdown) jest pomijany. Obiekty i listy
+    są zwracane w chwili zamknięcia, wartości proste - po napotkaniu "," lub "}".
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.fields = {}
+        self.complete = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._segment_start = None
+        self._value_start = None
+        self._key = None
+
+    def feed(self, chunk) -> list:
+        """Dodaje fragment odpowiedzi; zwraca listę nowych par (klucz, wartość)"""
+        if not chunk or self.complete:
+            return []
+        self.text += chunk
+        ready = []
+        text = self.text
+
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+                if self._depth == 1:
+                    if ch != '{':
+                        # Odpowiedź nie jest obiektem - zostawiamy pełnemu parserowi
+                        self._depth = 0
+                        continue
+                    self._segment_start = i + 1
+            elif ch in '}]':
+                if self._depth == 0:
+                    continue
+                self._depth -= 1
+                if self._depth == 1 and self._key is not None:
+                    # Domknięty obiekt lub lista na najwyższym poziomie
+                    self._emit(text[self._value_start:i + 1], ready)
+                elif self._depth == 0:
+                    if self._key is not None:
+                        self._emit(text[self._value_start:i], ready)
+                    self.complete = True
+                    self._pos = i + 1
+                    return ready
+            elif self._depth == 1:
+                if ch == ':' and self._key is None:
+                    self._key = self._loads(text[self._segment_start:i])
+                    self._value_start = i + 1
+                elif ch == ',':
+                    if self._key is not None:
+                        self._emit(text[self._value_start:i], ready)
+                    self._segment_start = i + 1
+
+        self._pos = len(text)
+        return ready
+
+    def _loads(self, raw):
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Niepoprawny fragment JSON w strumieniu: {str(e)}")
+            return None
+
+    def _emit(self, raw, ready):
+        key = self._key
+        self._key = None
+        self._segment_start = None
+        if not isinstance(key, str) or key in self.fields:
+            return
+        value = self._loads(raw)
+        if value is None and raw.strip() != 'null':
+            return
+        self.fields[key] = value
+        ready.append((key, value))
+
+    def result(self) -> dict:
+        """Pola odebrane do tej pory"""
+        return dict(self.fields)
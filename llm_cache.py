@@ -0,0 +1,192 @@
+import atexit
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+CACHE_DB_PATH = 'llm_cache.db'
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+CACHE_MAX_ENTRIES = 1000
+# Co ile sekund liczniki trafień i czasy dostępu z pamięci trafiają do bazy
+CACHE_FLUSH_INTERVAL = 30.0
+
+
+def normalize_offer_text(text: str) -> str:
+    """Normalizuje tekst oferty: forma NFC, bez nadmiarowych białych znaków"""
+    text = unicodedata.normalize('NFC', text or '')
+    return ' '.join(text.split())
+
+
+def catalog_fingerprint(*tables) -> str:
+    """Skrót zawartości tabel cennikowych - zmienia się przy każdej zmianie cen"""
+    digest = hashlib.sha256()
+    for rows in tables:
+        for row in rows:
+            digest.update(repr(tuple(row)).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()[:16]
+
+
+def make_cache_key(text: str, model: str, prompt_template: str, catalog_version: str) -> str:
+    """Klucz cache: tekst oferty, model, szablon promptu i wersja katalogu"""
+    parts = [
+        normalize_offer_text(text),
+        model,
+        hashlib.sha256(prompt_template.encode('utf-8')).hexdigest(),
+        catalog_version
+    ]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """Trwały cache sparsowanych odpowiedzi LLM (extracted_info) w SQLite"""
+
+    def __init__(self, db_path=CACHE_DB_PATH, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES,
+                 flush_interval=CACHE_FLUSH_INTERVAL):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Odczyt nie zapisuje do bazy: liczniki i czasy dostępu czekają w pamięci na _flush
+        self._pending = {'hits': 0, 'misses': 0}
+        self._accessed = {}
+        self._flushed_at = time.monotonic()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.create_tables()
+
+    def create_tables(self):
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    "key" TEXT PRIMARY KEY,
+                    "catalog_version" TEXT,
+                    "model" TEXT,
+                    "response" TEXT,
+                    "created_at" REAL,
+                    "accessed_at" REAL
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed
+                ON llm_cache ("accessed_at")
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache_stats (
+                    "name" TEXT PRIMARY KEY,
+                    "value" INTEGER
+                )
+            """)
+            self.conn.commit()
+
+    def _flush(self):
+        """Zapisuje zebrane w pamięci liczniki i czasy dostępu (wywołanie pod self._lock, bez commit)"""
+        self.conn.executemany("""
+            INSERT INTO llm_cache_stats ("name", "value") VALUES (?, ?)
+            ON CONFLICT("name") DO UPDATE SET "value" = "value" + excluded."value"
+        """, [(name, value) for name, value in self._pending.items() if value])
+        self.conn.executemany(
+            'UPDATE llm_cache SET "accessed_at" = ? WHERE "key" = ?',
+            [(accessed, key) for key, accessed in self._accessed.items()]
+        )
+        self._pending = dict.fromkeys(self._pending, 0)
+        self._accessed = {}
+        self._flushed_at = time.monotonic()
+
+    def flush(self):
+        """Zapisuje liczniki i czasy dostępu od razu (np. przy zamykaniu procesu)"""
+        with self._lock:
+            self._flush()
+            self.conn.commit()
+
+    def get(self, key: str):
+        """Zwraca zapisane extracted_info lub None"""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT "response", "created_at" FROM llm_cache WHERE "key" = ?', (key,)
+            ).fetchone()
+            hit = row is not None and now - row[1] <= self.ttl
+            self._pending['hits' if hit else 'misses'] += 1
+            if hit:
+                self._accessed[key] = now
+            if time.monotonic() - self._flushed_at >= self.flush_interval:
+                self._flush()
+                self.conn.commit()
+        if not hit:
+            return None
+
+        try:
+            return json.loads(row[0])
+        except json.JSONDecodeError:
+            logger.warning(f"Uszkodzony wpis cache {key[:12]}, pomijam")
+            return None
+
+    def put(self, key: str, catalog_version: str, model: str, extracted_info: dict):
+        """Zapisuje odpowiedź i usuwa wpisy nieaktualne lub nadmiarowe"""
+        now = time.time()
+        with self._lock:
+            # Czasy dostępu muszą być w bazie przed usuwaniem najdawniej używanych wpisów
+            self._flush()
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                INSERT OR REPLACE INTO llm_cache
+                    ("key", "catalog_version", "model", "response", "created_at", "accessed_at")
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (key, catalog_version, model,
+                  json.dumps(extracted_info, ensure_ascii=False), now, now))
+
+            # Zmiana cennika unieważnia wszystkie wcześniejsze wpisy
+            cursor.execute(
+                'DELETE FROM llm_cache WHERE "catalog_version" != ? OR "created_at" < ?',
+                (catalog_version, now - self.ttl)
+            )
+            cursor.execute("""
+                DELETE FROM llm_cache WHERE "key" IN (
+                    SELECT "key" FROM llm_cache
+                    ORDER BY "accessed_at" DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self.conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._accessed = {}
+            self.conn.execute('DELETE FROM llm_cache')
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        """Liczniki trafień/chybień oraz liczba wpisów"""
+        with self._lock:
+            counters = dict(self.conn.execute('SELECT "name", "value" FROM llm_cache_stats'))
+            entries = self.conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+            pending = dict(self._pending)
+        hits = counters.get('hits', 0) + pending['hits']
+        misses = counters.get('misses', 0) + pending['misses']
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+            'entries': entries
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Zwraca wspólną dla procesu instancję cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache()
+            atexit.register(_cache.flush)
+        return _cache
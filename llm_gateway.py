@@ -0,0 +1,367 @@
+"""Wspólna dla procesu brama do API OpenAI.
+
+Jeden klient z pulą połączeń keep-alive (httpx) zamiast nowego klienta i nowego połączenia TLS
+dla każdej oferty. Brama pilnuje limitu czasu całego wywołania (deadline), ponawia błędy
+przejściowe z losowym opóźnieniem, opcjonalnie wysyła drugie żądanie (hedging), gdy pierwsze
+trwa dłużej niż p95 ostatnich wywołań, i przestaje wołać API po serii błędów (circuit breaker).
+Interfejs chat.completions.create jest taki sam jak w kliencie OpenAI, więc OfferGenerator
+i testy mogą używać bramy, klienta OpenAI albo StubOpenAI zamiennie. Adres API można
+skierować na lokalny serwer (base_url).
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+
+import httpx
+import openai
+import streamlit as st
+from openai import OpenAI
+
+from config import OPENAI_API_KEY, OPENAI_BASE_URL
+from rate_limiter import INTERACTIVE, estimate_tokens, get_rate_limiter
+from telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+# Pula połączeń
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 60.0
+
+# Limity czasu: nawiązanie połączenia, jedna próba i całe wywołanie z ponowieniami
+CONNECT_TIMEOUT = 5.0
+ATTEMPT_TIMEOUT = 60.0
+DEFAULT_DEADLINE = 120.0
+
+# Ponowienia z losowym opóźnieniem (full jitter): uniform(0, min(cap, base * 2^próba))
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+# Drugie żądanie po czasie równym p95 ostatnich wywołań (LLM_HEDGE=1)
+HEDGE_ENABLED = os.environ.get('LLM_HEDGE') == '1'
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.5
+
+# Circuit breaker: po tylu kolejnych błędach wywołania są odrzucane przez BREAKER_RESET s
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = 30.0
+
+LATENCY_WINDOW = 500
+
+# Błędy przejściowe, po których warto ponowić żądanie
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # obejmuje APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+
+
+class LLMUnavailableError(RuntimeError):
+    """API niedostępne - circuit breaker otwarty"""
+
+
+class LLMDeadlineError(TimeoutError):
+    """Wyczerpany limit czasu całego wywołania (deadline) przed kolejną próbą"""
+
+
+class CircuitBreaker:
+    """Stany: zamknięty (wywołania przechodzą), otwarty (odrzucane), półotwarty (jedna próba)"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_after:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        """Czy wykonać wywołanie; w stanie półotwartym przepuszcza jedno wywołanie próbne"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self):
+        """Zwalnia wywołanie próbne, które nie doszło do API (np. brak miejsca w limicie)"""
+        with self._lock:
+            self._probing = False
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Circuit breaker LLM otwarty po {self._failures} błędach")
+                self._opened_at = time.monotonic()
+
+
+class LatencyStats:
+    """Czasy ostatnich wywołań i liczniki bramy"""
+
+    COUNTERS = ('calls', 'errors', 'retries', 'hedges', 'hedge_wins', 'rejected')
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def add(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def quantile(self, q):
+        """Kwantyl z okna ostatnich wywołań; None przy zbyt małej liczbie próbek"""
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            values = sorted(self._latencies)
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            values = sorted(self._latencies)
+            counters = dict(self.counters)
+        stats = {**counters, 'samples': len(values)}
+        for name, q in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+            stats[name] = round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 1) if values else None
+        return stats
+
+
+class LLMGateway:
+    """Klient OpenAI z pulą połączeń, deadline'em, ponowieniami, hedgingiem i circuit breakerem"""
+
+    def __init__(self, api_key=OPENAI_API_KEY, base_url=None, client=None, hedge=HEDGE_ENABLED,
+                 max_retries=MAX_RETRIES, deadline=DEFAULT_DEADLINE, breaker=None, limiter=None, lane=INTERACTIVE):
+        self.base_url = base_url or OPENAI_BASE_URL
+        # Wspólny limit RPM/TPM (rate_limiter); lane to domyślny pas wywołań tej bramy
+        self.limiter = limiter
+        self.lane = lane
+        self.hedge = hedge
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = LatencyStats()
+        self._http_client = None
+        if client is None:
+            self._http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(ATTEMPT_TIMEOUT, connect=CONNECT_TIMEOUT)
+            )
+            # Ponowieniami zarządza brama, nie biblioteka openai
+            client = OpenAI(api_key=api_key, base_url=self.base_url, http_client=self._http_client, max_retries=0)
+        self.client = client
+        self._hedge_pool = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix='llm-hedge')
+        # Interfejs zgodny z klientem OpenAI: gateway.chat.completions.create(...)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        # ...i z AsyncOpenAI dla kodu asyncio (OfferGenerator.create_offer_async)
+        self.async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self.create_async)))
+
+    def create(self, deadline=None, lane=None, **kwargs):
+        """chat.completions.create z deadline'em (s) dla całego wywołania wraz z ponowieniami.
+
+        Każda próba (także ponowienie i żądanie hedgingu) pobiera własny przydział limitu,
+        a czas oczekiwania na niego wlicza się do deadline'u. Wywołanie, które nie dotarło do API
+        (brak miejsca w limicie, wyczerpany deadline) albo zostało odrzucone jako błędne (np. 400),
+        zwalnia próbę circuit breakera, nie zamykając go.
+        """
+        if not self.breaker.allow():
+            self.stats.count('rejected')
+            raise LLMUnavailableError("API LLM chwilowo niedostępne (circuit breaker otwarty)")
+
+        self.stats.count('calls')
+        lane = lane or self.lane
+        expires = time.monotonic() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            if expires - time.monotonic() <= 0:
+                self.stats.count('errors')
+                self.breaker.release()
+                raise LLMDeadlineError(
+                    f"Przekroczony limit czasu wywołania LLM ({deadline or self.deadline:.1f} s)"
+                )
+            try:
+                if self.hedge and not kwargs.get('stream'):
+                    response = self._hedged(expires, lane, kwargs)
+                else:
+                    response = self._attempt(expires, lane, kwargs)
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                delay = self._retry_delay(attempt, e)
+                if attempt > self.max_retries or delay >= expires - time.monotonic():
+                    self.stats.count('errors')
+                    self.breaker.failure()
+                    raise
+                self.stats.count('retries')
+                logger.warning(f"Ponawiam wywołanie LLM ({attempt}/{self.max_retries}) za {delay:.2f} s: {str(e)}")
+                time.sleep(delay)
+                continue
+            except Exception:
+                # Brak miejsca w limicie, deadline albo błąd żądania (np. 400, 401) - nie świadczą
+                # ani o niedostępności, ani o sprawności API
+                self.stats.count('errors')
+                self.breaker.release()
+                raise
+            self.breaker.success()
+            return response
+
+    async def create_async(self, deadline=None, lane=None, **kwargs):
+        """create dla asyncio (bez strumieniowania) - wywołanie wraz z ponowieniami i oczekiwaniem
+        na limit wykonywane jest w wątku, bez blokowania pętli zdarzeń"""
+        return await asyncio.to_thread(self.create, deadline=deadline, lane=lane, **kwargs)
+
+    def _attempt(self, expires, lane, kwargs):
+        """Jedna próba z własnym przydziałem limitu, rozliczanym według usage odpowiedzi"""
+        ticket = None
+        if self.limiter is not None:
+            ticket = self.limiter.acquire(
+                estimate_tokens(kwargs.get('messages')), lane, timeout=max(expires - time.monotonic(), 0.0)
+            )
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            if ticket is not None:
+                # Żądanie nie zostało wysłane - oszacowane tokeny wracają do kubełka TPM
+                self.limiter.settle(ticket, 0)
+            raise LLMDeadlineError("Limit czasu wywołania LLM wyczerpany w oczekiwaniu na limit")
+        start = time.perf_counter()
+        response = self.client.chat.completions.create(timeout=min(remaining, ATTEMPT_TIMEOUT), **kwargs)
+        # Przy stream=True mierzony jest czas do rozpoczęcia odpowiedzi
+        self.stats.add(time.perf_counter() - start)
+        if ticket is None:
+            return response
+        # Przy stream=True usage przychodzi w ostatnim fragmencie - rozliczenie przy jego odbiorze
+        if kwargs.get('stream'):
+            return self._settle_stream(response, ticket)
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            self.limiter.settle(ticket, getattr(usage, 'total_tokens', None))
+        return response
+
+    def _settle_stream(self, stream, ticket):
+        """Przekazuje fragmenty strumienia; fragment z usage koryguje limit TPM o faktyczne zużycie"""
+        for chunk in stream:
+            usage = getattr(chunk, 'usage', None)
+            if usage is not None:
+                self.limiter.settle(ticket, getattr(usage, 'total_tokens', None))
+            yield chunk
+
+    def _hedged(self, expires, lane, kwargs):
+        """Wysyła drugie żądanie, gdy pierwsze trwa dłużej niż p95; zwraca pierwszą udaną odpowiedź"""
+        p95 = self.stats.quantile(HEDGE_QUANTILE)
+        if p95 is None:
+            return self._attempt(expires, lane, kwargs)
+
+        delay = max(p95, HEDGE_MIN_DELAY)
+        primary = self._hedge_pool.submit(self._attempt, expires, lane, kwargs)
+        done, _ = wait([primary], timeout=max(min(delay, expires - time.monotonic()), 0.0))
+        if done:
+            return primary.result()
+
+        # Drugie żądanie zużywa limit tak samo jak pierwsze - pobiera własny przydział
+        self.stats.count('hedges')
+        hedge = self._hedge_pool.submit(self._attempt, expires, lane, kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.stats.count('hedge_wins')
+                    # Wolniejsze żądanie kończy się w tle, jego wynik jest pomijany
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    @staticmethod
+    def _retry_delay(attempt, error) -> float:
+        """Opóźnienie z pełnym jitterem; dla 429 co najmniej Retry-After z odpowiedzi"""
+        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        try:
+            return max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            return delay
+
+    def snapshot(self) -> dict:
+        """Liczniki i czasy wywołań (ms) oraz stan circuit breakera"""
+        return {**self.stats.snapshot(), 'breaker': self.breaker.state}
+
+    def prometheus_lines(self) -> list:
+        """Liczniki i kwantyle czasu wywołań w formacie Prometheus"""
+        stats = self.snapshot()
+        lines = [
+            '# HELP offer_llm_gateway_events_total Wywołania, błędy, ponowienia i hedging bramy LLM',
+            '# TYPE offer_llm_gateway_events_total counter'
+        ]
+        lines += [f'offer_llm_gateway_events_total{{event="{name}"}} {stats[name]}' for name in LatencyStats.COUNTERS]
+        lines += [
+            '# HELP offer_llm_gateway_latency_seconds Czas ostatnich wywołań LLM',
+            '# TYPE offer_llm_gateway_latency_seconds summary'
+        ]
+        for name, q in (('p50_ms', '0.5'), ('p95_ms', '0.95'), ('p99_ms', '0.99')):
+            if stats[name] is not None:
+                lines.append(f'offer_llm_gateway_latency_seconds{{quantile="{q}"}} {stats[name] / 1000:.4f}')
+        lines += [
+            '# HELP offer_llm_gateway_breaker_open Circuit breaker otwarty (1) lub zamknięty (0)',
+            '# TYPE offer_llm_gateway_breaker_open gauge',
+            f'offer_llm_gateway_breaker_open {int(stats["breaker"] != "closed")}'
+        ]
+        return lines
+
+    def close(self):
+        self._hedge_pool.shutdown(wait=False)
+        if self._http_client is not None:
+            self._http_client.close()
+
+
+@st.cache_resource
+def get_llm_gateway() -> LLMGateway:
+    """Jedna brama LLM (i jedna pula połączeń) na proces"""
+    if not OPENAI_API_KEY and not OPENAI_BASE_URL:
+        logger.error("Brak klucza API OpenAI")
+        raise ValueError("Brak klucza API OpenAI. Sprawdź plik .env")
+    # Lokalny serwer zastępczy (OPENAI_BASE_URL) nie wymaga klucza
+    gateway = LLMGateway(api_key=OPENAI_API_KEY or 'local', limiter=get_rate_limiter())
+    get_telemetry().add_collector(gateway.prometheus_lines)
+    return gateway
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from types import SimpleNamespace
+
+from catalog_service import CatalogService
+from offer_schema import LLM_OUTPUT_STRUCTURE, empty_offer, vehicle_row_to_offer
+
+logger = logging.getLogger(__name__)
+
+
+def llm_output(offer) -> dict:
+    """Oferta przycięta do LLM_OUTPUT_STRUCTURE - bez pól, których LLM nie zwraca (np. ceny agregatu)"""
+    output = empty_offer(LLM_OUTPUT_STRUCTURE)
+    for section, default in output.items():
+        value = offer.get(section)
+        if isinstance(default, dict):
+            if isinstance(value, dict):
+                default.update({key: value[key] for key in default if key in value})
+        elif value is not None:
+            output[section] = value
+    return output
+
+
+def _completion(content, model, prompt_chars):
+    """Obiekt odpowiedzi o kształcie ChatCompletion z biblioteki openai"""
+    prompt_tokens = prompt_chars // 4
+    completion_tokens = len(content) // 4
+    return SimpleNamespace(
+        id=f"chatcmpl-stub-{uuid.uuid4().hex[:12]}",
+        model=model,
+        choices=[SimpleNamespace(
+            index=0,
+            finish_reason='stop',
+            message=SimpleNamespace(role='assistant', content=content)
+        )],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+    )
+
+
+def _stream(content, model, prompt_chars, chunk_size=16):
+    """Fragmenty odpowiedzi o kształcie ChatCompletionChunk (stream=True)"""
+    completion_id = f"chatcmpl-stub-{uuid.uuid4().hex[:12]}"
+    for start in range(0, len(content), chunk_size):
+        yield SimpleNamespace(
+            id=completion_id,
+            model=model,
+            choices=[SimpleNamespace(
+                index=0,
+                finish_reason=None,
+                delta=SimpleNamespace(role='assistant', content=content[start:start + chunk_size])
+            )],
+            usage=None
+        )
+    # Ostatni fragment ze statystykami użycia, jak przy stream_options={"include_usage": True}
+    yield SimpleNamespace(
+        id=completion_id, model=model, choices=[], usage=_completion(content, model, prompt_chars).usage
+    )
+
+
+class StubOpenAI:
+    """Lokalny zamiennik klienta OpenAI - generuje poprawne oferty z katalogu, bez sieci"""
+
+    def __init__(self, db_path='autoadaptacje.db', latency=0.0, jitter=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        catalog = CatalogService(db_path).snapshot()
+        self._extractor = catalog.fast_extractor
+        self._index = catalog.prompt_index
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def synthesize(self, messages) -> str:
+        """Buduje odpowiedź JSON zgodną ze schematem odpowiedzi LLM (offer_json_schema)"""
+        text = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+        result = self._extractor.extract(text)
+        offer = result.offer
+        if not result.is_resolved('pojazd', 'marka'):
+            ranked = self._index.search_vehicles(text, top_n=1)
+            if ranked:
+                offer['pojazd'] = vehicle_row_to_offer(self._index.vehicles[ranked[0][1]])
+        return json.dumps(llm_output(offer), ensure_ascii=False)
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        time.sleep(self._delay())
+        content = self.synthesize(messages)
+        prompt_chars = sum(len(m['content']) for m in messages)
+        if stream:
+            return _stream(content, model, prompt_chars)
+        return _completion(content, model, prompt_chars)
+
+
+class AsyncStubOpenAI(StubOpenAI):
+    """Asynchroniczny odpowiednik StubOpenAI (interfejs AsyncOpenAI)"""
+
+    async def _create(self, model, messages, **kwargs):
+        await asyncio.sleep(self._delay())
+        content = self.synthesize(messages)
+        return _completion(content, model, sum(len(m['content']) for m in messages))
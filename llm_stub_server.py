@@ -0,0 +1,316 @@
+"""Lokalny serwer zgodny z API OpenAI (POST /v1/chat/completions) do pomiarów bez prawdziwego LLM.
+
+Odpowiedzi pochodzą z nagrań (plik JSONL z odpowiedziami kluczowanymi skrótem promptu)
+albo są syntezowane z katalogu jak w llm_stub.StubOpenAI. Opóźnienie odpowiedzi losowane
+jest z zadanego rozkładu (ziarno --seed daje powtarzalne przebiegi), a przy stream=True
+fragmenty wysyłane są jako Server-Sent Events w tempie --tokens-per-second.
+
+Uruchomienie:
+    python llm_stub_server.py --port 8099 --latency lognormal:0.8,0.4 --seed 1
+    python llm_stub_server.py --replay recordings.jsonl --strict
+    python llm_stub_server.py --replay recordings.jsonl --record --upstream https://api.openai.com/v1
+Aplikację kieruje się na serwer zmienną OPENAI_BASE_URL=http://127.0.0.1:8099/v1.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8099
+STREAM_CHUNK_CHARS = 16
+CHARS_PER_TOKEN = 4
+
+
+class LatencyModel:
+    """Rozkład opóźnienia odpowiedzi: fixed:S, uniform:A,B, normal:MEAN,SD, lognormal:MEDIAN,SIGMA"""
+
+    KINDS = ('fixed', 'uniform', 'normal', 'lognormal')
+
+    def __init__(self, kind='fixed', params=(0.0,), seed=None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Nieznany rozkład opóźnienia: {kind}")
+        self.kind = kind
+        self.params = tuple(params)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec, seed=None):
+        kind, _, values = spec.partition(':')
+        return cls(kind, [float(v) for v in values.split(',') if v] or [0.0], seed)
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == 'fixed':
+                value = self.params[0]
+            elif self.kind == 'uniform':
+                value = self._random.uniform(*self.params[:2])
+            elif self.kind == 'normal':
+                value = self._random.gauss(*self.params[:2])
+            else:
+                value = self._random.lognormvariate(math.log(self.params[0]), self.params[1])
+        return max(0.0, value)
+
+
+def prompt_hash(body) -> str:
+    """Klucz nagrania: skrót modelu, wiadomości i formatu odpowiedzi"""
+    key = {k: body.get(k) for k in ('model', 'messages', 'response_format')}
+    return hashlib.sha256(json.dumps(key, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def estimate_usage(content, messages) -> dict:
+    prompt_tokens = sum(len(str(m.get('content') or '')) for m in messages) // CHARS_PER_TOKEN
+    completion_tokens = len(content) // CHARS_PER_TOKEN
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': prompt_tokens + completion_tokens
+    }
+
+
+class Recordings:
+    """Nagrane odpowiedzi w pliku JSONL: {"hash", "model", "content", "usage"} w każdej linii"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._items = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        item = json.loads(line)
+                        self._items[item['hash']] = item
+            logger.info(f"Wczytano {len(self._items)} nagranych odpowiedzi z {path}")
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        return self._items.get(key)
+
+    def add(self, key, model, content, usage):
+        item = {'hash': key, 'model': model, 'content': content, 'usage': usage}
+        with self._lock:
+            self._items[key] = item
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(item, ensure_ascii=False) + '\n')
+        return item
+
+
+class StubBackend:
+    """Źródło odpowiedzi: nagranie, nagranie nowej odpowiedzi z API albo synteza z katalogu"""
+
+    def __init__(self, recordings=None, strict=False, upstream=None, db_path='autoadaptacje.db'):
+        self.recordings = recordings if recordings is not None else Recordings()
+        self.strict = strict
+        self.upstream = upstream
+        self.db_path = db_path
+        self._synthesizer = None
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'replayed': 0, 'recorded': 0, 'synthesized': 0, 'missing': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _synthesize(self, messages) -> str:
+        if self._synthesizer is None:
+            from llm_stub import StubOpenAI
+            self._synthesizer = StubOpenAI(self.db_path)
+        return self._synthesizer.synthesize(messages)
+
+    def complete(self, body):
+        """(treść, usage) odpowiedzi albo None, gdy w trybie --strict brak nagrania"""
+        self._count('requests')
+        key = prompt_hash(body)
+        item = self.recordings.get(key)
+        if item is not None:
+            self._count('replayed')
+            return item['content'], item.get('usage') or estimate_usage(item['content'], body['messages'])
+
+        if self.upstream is not None:
+            response = self.upstream.chat.completions.create(
+                **{k: v for k, v in body.items() if k not in ('stream', 'stream_options')}
+            )
+            content = response.choices[0].message.content or ''
+            usage = response.usage.model_dump() if response.usage else estimate_usage(content, body['messages'])
+            self.recordings.add(key, body.get('model'), content, usage)
+            self._count('recorded')
+            return content, usage
+
+        if self.strict:
+            self._count('missing')
+            return None
+        content = self._synthesize(body['messages'])
+        self._count('synthesized')
+        return content, estimate_usage(content, body['messages'])
+
+
+def _completion_body(content, model, usage) -> dict:
+    return {
+        'id': f"chatcmpl-stub-{uuid.uuid4().hex[:12]}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'finish_reason': 'stop',
+            'message': {'role': 'assistant', 'content': content}
+        }],
+        'usage': usage
+    }
+
+
+def _chunk(completion_id, model, delta=None, finish_reason=None, usage=None) -> dict:
+    return {
+        'id': completion_id,
+        'object': 'chat.completion.chunk',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [] if usage is not None else [{'index': 0, 'delta': delta or {}, 'finish_reason': finish_reason}],
+        'usage': usage
+    }
+
+
+def make_handler(backend, latency, tokens_per_second=0.0):
+    """Klasa obsługi żądań dla serwera HTTP z danym źródłem odpowiedzi i rozkładem opóźnienia"""
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _write_chunk(self, payload):
+            """Jedno zdarzenie SSE jako fragment kodowania chunked"""
+            data = f"data: {payload}\n\n".encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.rstrip('/').endswith('/health'):
+                self._send_json(200, {'status': 'ok'})
+            elif self.path.rstrip('/').endswith('/stats'):
+                self._send_json(200, {**backend.counters, 'recordings': len(backend.recordings)})
+            else:
+                self._send_json(404, {'error': {'message': 'Not found'}})
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._send_json(404, {'error': {'message': 'Not found'}})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+                result = backend.complete(body)
+            except Exception as e:
+                logger.error(f"Błąd serwera zastępczego: {str(e)}")
+                self._send_json(500, {'error': {'message': str(e), 'type': 'server_error'}})
+                return
+            if result is None:
+                self._send_json(404, {'error': {'message': 'Brak nagranej odpowiedzi dla promptu', 'type': 'not_found'}})
+                return
+
+            content, usage = result
+            model = body.get('model') or 'stub'
+            time.sleep(latency.sample())
+            if not body.get('stream'):
+                if tokens_per_second:
+                    time.sleep(usage['completion_tokens'] / tokens_per_second)
+                self._send_json(200, _completion_body(content, model, usage))
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            completion_id = f"chatcmpl-stub-{uuid.uuid4().hex[:12]}"
+            pause = STREAM_CHUNK_CHARS / CHARS_PER_TOKEN / tokens_per_second if tokens_per_second else 0.0
+            for start in range(0, len(content), STREAM_CHUNK_CHARS):
+                delta = {'role': 'assistant', 'content': content[start:start + STREAM_CHUNK_CHARS]}
+                self._write_chunk(json.dumps(_chunk(completion_id, model, delta), ensure_ascii=False))
+                if pause:
+                    time.sleep(pause)
+            self._write_chunk(json.dumps(_chunk(completion_id, model, finish_reason='stop')))
+            if (body.get('stream_options') or {}).get('include_usage'):
+                self._write_chunk(json.dumps(_chunk(completion_id, model, usage=usage)))
+            self._write_chunk('[DONE]')
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, format, *args):
+            logger.debug(f"stub: {format % args}")
+
+    return StubHandler
+
+
+def start_stub_server(port=0, host='127.0.0.1', backend=None, latency=None, tokens_per_second=0.0):
+    """Uruchamia serwer w wątku tła; zwraca serwer (adres API: base_url(server))"""
+    handler = make_handler(backend or StubBackend(), latency or LatencyModel(), tokens_per_second)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='llm-stub-server', daemon=True).start()
+    logger.info(f"Serwer zastępczy LLM: {base_url(server)}")
+    return server
+
+
+def base_url(server) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--latency', default='fixed:0', help="rozkład opóźnienia, np. lognormal:0.8,0.4")
+    parser.add_argument('--tokens-per-second', type=float, default=0.0, help="tempo generowania odpowiedzi (0 - bez limitu)")
+    parser.add_argument('--seed', type=int, default=None, help="ziarno losowania opóźnień")
+    parser.add_argument('--replay', help="plik JSONL z nagranymi odpowiedziami")
+    parser.add_argument('--strict', action='store_true', help="bez syntezy - brak nagrania to błąd 404")
+    parser.add_argument('--record', action='store_true', help="brakujące odpowiedzi pobieraj z --upstream i nagrywaj")
+    parser.add_argument('--upstream', default='https://api.openai.com/v1', help="adres API do nagrywania")
+    parser.add_argument('--db', default='autoadaptacje.db', help="baza katalogu do syntezy odpowiedzi")
+    args = parser.parse_args()
+
+    setup_logging()
+    upstream = None
+    if args.record:
+        if not args.replay:
+            raise SystemExit("--record wymaga pliku --replay, do którego trafią nagrania")
+        from openai import OpenAI
+        from config import OPENAI_API_KEY
+        if not OPENAI_API_KEY:
+            raise SystemExit("Brak klucza API OpenAI (OPENAI_API_KEY) do nagrywania odpowiedzi")
+        upstream = OpenAI(api_key=OPENAI_API_KEY, base_url=args.upstream)
+
+    backend = StubBackend(Recordings(args.replay), strict=args.strict, upstream=upstream, db_path=args.db)
+    server = start_stub_server(
+        args.port, args.host, backend, LatencyModel.parse(args.latency, args.seed), args.tokens_per_second
+    )
+    print(f"OPENAI_BASE_URL={base_url(server)}", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,470 @@
+"""Test obciążenia strony generatora ofert: N równoczesnych handlowców w jednym procesie Streamlit.
+
+Każdy wirtualny użytkownik to osobna sesja AppTest na prawdziwej stronie pages/1_Generator_Ofert.py.
+Po otwarciu strony powtarza scenariusz: wpisanie treści zapytania i generowanie oferty, edycja pól
+cenowych, przejście do zakładki PDF i generowanie PDF. Treści zapytań odtwarzane są z pliku JSONL
+(pole "text", domyślnie loadtest/requests.jsonl). LLM zastępuje llm_stub_server uruchomiony w osobnym
+procesie (opóźnienie wg --latency, opcjonalnie odpowiedzi nagrane --replay), więc wywołania przechodzą
+przez bramkę LLM, limit RPM/TPM, pulę zadań i magazyn PDF tak jak w aplikacji, a CPU i pamięć serwera
+zastępczego nie wliczają się do pomiarów.
+
+Uproszczenia względem przeglądarki:
+- AgGrid to komponent przeglądarki, którego AppTest nie renderuje - edycja komórki odtwarzana jest jak
+  w create_editable_grid: Offer.apply_rows na modelu sesji i przeładowanie strony.
+- Zamiast odpytywania fragmentu co 0,5 s użytkownik czeka na zakończenie zadania w puli zadań
+  i przeładowuje stronę raz.
+- Każdy użytkownik dopisuje do treści zapytania swój podpis - równoczesne sesje z tym samym tekstem
+  trafiałyby inaczej w to samo zadanie i w cache LLM.
+
+Raport dla każdego poziomu współbieżności: percentyle czasu akcji (p50/p95/p99), przepustowość
+(scenariusze/s), czas CPU i przyrost RSS na sesję. Punkt nasycenia to ostatni poziom, po którym
+przepustowość rośnie jeszcze o co najmniej KNEE_MIN_GAIN.
+
+Uruchomienie:
+    python loadtest/run_loadtest.py [--users 1 2 4 8 16] [--duration 30] [--think 1.0]
+        [--latency lognormal:1.5,0.4] [--replay nagrania.jsonl] [--json raport.json]
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from unittest.mock import MagicMock
+
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from streamlit import config as st_config
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import app_test, local_script_runner
+
+PAGE = 'pages/1_Generator_Ofert.py'
+TEXTS_PATH = os.path.join(ROOT, 'loadtest', 'requests.jsonl')
+DEFAULT_USERS = (1, 2, 4, 8, 16)
+DEFAULT_LATENCY = 'lognormal:1.5,0.4'
+# Limit czasu jednego przebiegu strony i oczekiwania na zadanie w tle (s)
+RUN_TIMEOUT = 60
+JOB_TIMEOUT = 180
+JOB_POLL_INTERVAL = 0.05
+RSS_SAMPLE_INTERVAL = 0.25
+# Minimalny względny przyrost przepustowości, przy którym kolejny poziom jeszcze się opłaca
+KNEE_MIN_GAIN = 0.1
+PERCENTILES = (50, 95, 99)
+
+ACTIONS = ('otwarcie_strony', 'generowanie_oferty', 'edycja_tabeli', 'zakladka', 'generowanie_pdf')
+EDIT_TAB = 'Pojazd'
+EDIT_SECTION = 'pojazd'
+EDIT_FIELD = 'zabudowa_cena'
+EDITS_PER_OFFER = 2
+
+
+def install_shared_runtime():
+    """Jedno środowisko Runtime i jeden cache skompilowanego skryptu dla wszystkich sesji AppTest.
+
+    AppTest ustawia i zeruje globalny Runtime._instance przy każdym przebiegu - przy równoległych
+    sesjach jedna kasowałaby środowisko drugiej. Tu ustawiane jest raz, a przypisania AppTest są
+    pomijane; global.appTest jest włączone na stałe z tego samego powodu. Każdy przebieg AppTest
+    kompiluje też stronę od nowa, a równoległa kompilacja w Pythonie 3.11 potrafi zakończyć się
+    błędem "AST constructor recursion depth mismatch" - serwer Streamlit ma jeden ScriptCache
+    na proces i tak samo jest tutaj.
+    """
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage('/mock/media'))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+
+    class SharedRuntimeType(type):
+        def __setattr__(cls, name, value):
+            if name != '_instance':
+                super().__setattr__(name, value)
+
+    class SharedRuntime(Runtime, metaclass=SharedRuntimeType):
+        pass
+
+    app_test.Runtime = SharedRuntime
+    st_config.set_option('global.appTest', True)
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_process(latency, replay=None, seed=None):
+    """Uruchamia llm_stub_server w osobnym procesie; zwraca (proces, adres bazowy API)"""
+    port = free_port()
+    command = [sys.executable, 'llm_stub_server.py', '--port', str(port), '--latency', latency]
+    if replay:
+        command += ['--replay', replay]
+    if seed is not None:
+        command += ['--seed', str(seed)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'{url}/health', timeout=1):
+                return process, f'{url}/v1'
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Serwer zastępczy LLM nie wystartował")
+
+
+def load_texts(path) -> list:
+    """Treści zapytań z pliku JSONL (pole "text")"""
+    with open(path, encoding='utf-8') as f:
+        texts = [json.loads(line)['text'] for line in f if line.strip()]
+    if not texts:
+        raise ValueError(f"Brak treści zapytań w pliku {path}")
+    return texts
+
+
+def percentile(samples, q) -> float:
+    """Percentyl metodą najbliższej pozycji (samples posortowane)"""
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, max(0, round(q / 100 * len(samples)) - 1))]
+
+
+class Recorder:
+    """Czasy akcji wszystkich sesji jednego poziomu współbieżności"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {action: [] for action in ACTIONS}
+        self.errors = dict.fromkeys(ACTIONS, 0)
+        self.error_messages = []
+        self.scenarios = 0
+
+    def record(self, action, seconds, error=None):
+        with self._lock:
+            if error is None:
+                self.samples[action].append(seconds)
+            else:
+                self.errors[action] += 1
+                if len(self.error_messages) < 20:
+                    self.error_messages.append(f"{action}: {error}")
+
+    def scenario_done(self):
+        with self._lock:
+            self.scenarios += 1
+
+
+class ActionFailed(Exception):
+    """Akcja wirtualnego użytkownika nie dała oczekiwanego wyniku"""
+
+
+class VirtualUser:
+    """Jeden handlowiec: własna sesja AppTest i pętla scenariusza do upływu czasu"""
+
+    def __init__(self, user_id, texts, recorder, think, seed):
+        self.user_id = user_id
+        self.texts = texts
+        self.recorder = recorder
+        self.think = think
+        self.random = random.Random(seed)
+        self.at = None
+        self.iteration = 0
+
+    def _pause(self):
+        if self.think:
+            time.sleep(self.think * self.random.uniform(0.5, 1.5))
+
+    def _timed(self, action, fn) -> bool:
+        start = time.perf_counter()
+        try:
+            fn()
+            if self.at.exception:
+                raise ActionFailed(self.at.exception[0].value)
+        except Exception as e:
+            self.recorder.record(action, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+            return False
+        self.recorder.record(action, time.perf_counter() - start)
+        return True
+
+    def _wait_for_job(self, state_key):
+        """Czeka na zadanie w tle i przeładowuje stronę, która przenosi wynik do sesji"""
+        from offer_jobs import get_job_manager
+
+        job_id = self.at.session_state[state_key] if state_key in self.at.session_state else None
+        if job_id is None:
+            return
+        job = get_job_manager().get(job_id)
+        deadline = time.monotonic() + JOB_TIMEOUT
+        while job is not None and not job.finished:
+            if time.monotonic() > deadline:
+                raise ActionFailed(f"zadanie {job_id} trwa dłużej niż {JOB_TIMEOUT} s")
+            time.sleep(JOB_POLL_INTERVAL)
+        self.at.run()
+
+    def open_page(self):
+        self.at = AppTest.from_file(PAGE, default_timeout=RUN_TIMEOUT).run()
+
+    def generate_offer(self):
+        text = self.random.choice(self.texts)
+        # Podpis handlowca - każda sesja wysyła inny tekst
+        signature = f"\nHandlowiec {self.user_id}, zapytanie {self.iteration}"
+        self.at.text_area(key='offer_input').set_value(text + signature).run()
+        previous = self.at.session_state['offer_revision'] if 'offer_revision' in self.at.session_state else 0
+        next(b for b in self.at.button if b.label == "Generuj ofertę").click().run()
+        self._wait_for_job('offer_job_id')
+        revision = self.at.session_state['offer_revision'] if 'offer_revision' in self.at.session_state else 0
+        if revision == previous:
+            notice = self.at.session_state['job_notice'] if 'job_notice' in self.at.session_state else None
+            raise ActionFailed(f"oferta nie została wygenerowana ({notice})")
+
+    def edit_cell(self):
+        # To samo, co create_editable_grid robi z odpowiedzią AgGrid po edycji komórki
+        offer = self.at.session_state['offer_model']
+        rows = [
+            dict(row, **({'Wartość': str(self.random.randrange(8_000, 40_000))} if row['Pole'] == EDIT_FIELD else {}))
+            for row in offer.rows(EDIT_SECTION)
+        ]
+        _, rejected = offer.apply_rows(EDIT_SECTION, rows)
+        if rejected:
+            raise ActionFailed(f"odrzucone pola: {', '.join(rejected)}")
+        self.at.run()
+
+    def switch_tab(self, tab):
+        self.at.radio(key='offer_tab').set_value(tab).run()
+
+    def generate_pdf(self):
+        previous = self.at.session_state['last_pdf_id'] if 'last_pdf_id' in self.at.session_state else None
+        next(b for b in self.at.button if b.label == "Generuj PDF z aktualnych danych").click().run()
+        self._wait_for_job('pdf_job_id')
+        current = self.at.session_state['last_pdf_id'] if 'last_pdf_id' in self.at.session_state else None
+        if current is None or current == previous:
+            raise ActionFailed("PDF nie został wygenerowany")
+
+    def scenario(self) -> bool:
+        """Oferta z tekstu, edycja pól, PDF; zwraca True, gdy wszystkie kroki się powiodły"""
+        self.iteration += 1
+        self._pause()
+        if not self._timed('generowanie_oferty', self.generate_offer):
+            return False
+        self._pause()
+        if not self._timed('zakladka', lambda: self.switch_tab(EDIT_TAB)):
+            return False
+        if not all(self._timed('edycja_tabeli', self.edit_cell) for _ in range(EDITS_PER_OFFER)):
+            return False
+        self._pause()
+        if not self._timed('zakladka', lambda: self.switch_tab('PDF')):
+            return False
+        if not self._timed('generowanie_pdf', self.generate_pdf):
+            return False
+        self.recorder.scenario_done()
+        return True
+
+    def run(self, stop_at):
+        opened = False
+        while time.monotonic() < stop_at:
+            # Po nieudanym kroku handlowiec odświeża stronę - nowa sesja
+            if not opened:
+                opened = self._timed('otwarcie_strony', self.open_page)
+                if not opened:
+                    time.sleep(1.0)
+                    continue
+            opened = self.scenario()
+
+
+class ResourceMonitor:
+    """Czas CPU procesu i szczytowe RSS w trakcie jednego poziomu"""
+
+    def __init__(self):
+        self.process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = None
+        self.peak_rss = 0
+
+    def __enter__(self):
+        cpu = self.process.cpu_times()
+        self.cpu_start = cpu.user + cpu.system
+        self.rss_start = self.peak_rss = self.process.memory_info().rss
+        self.wall_start = time.monotonic()
+        self._thread = threading.Thread(target=self._sample, name='loadtest-rss', daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        cpu = self.process.cpu_times()
+        self.cpu_seconds = cpu.user + cpu.system - self.cpu_start
+        self.wall_seconds = time.monotonic() - self.wall_start
+        self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+
+
+def run_level(users, texts, duration, think, seed) -> dict:
+    """Jeden poziom współbieżności: users sesji przez duration sekund"""
+    recorder = Recorder()
+    stop_at = time.monotonic() + duration
+    virtual_users = [VirtualUser(i, texts, recorder, think, seed * 1000 + i) for i in range(users)]
+    threads = [
+        threading.Thread(target=user.run, args=(stop_at,), name=f'loadtest-user-{user.user_id}')
+        for user in virtual_users
+    ]
+    with ResourceMonitor() as monitor:
+        for thread in threads:
+            thread.start()
+            # Rozłożenie startu sesji - bez jednoczesnego otwarcia strony przez wszystkich
+            time.sleep(min(0.2, duration / 20))
+        for thread in threads:
+            thread.join()
+
+    actions = {}
+    for action, samples in recorder.samples.items():
+        samples.sort()
+        actions[action] = {
+            'count': len(samples),
+            'errors': recorder.errors[action],
+            'mean_ms': round(statistics.mean(samples) * 1000, 1) if samples else 0.0,
+            **{f'p{q}_ms': round(percentile(samples, q) * 1000, 1) for q in PERCENTILES}
+        }
+    mib = 1024 * 1024
+    return {
+        'users': users,
+        'wall_s': round(monitor.wall_seconds, 2),
+        'scenarios': recorder.scenarios,
+        'throughput_per_s': round(recorder.scenarios / monitor.wall_seconds, 4),
+        'cpu_s': round(monitor.cpu_seconds, 2),
+        'cpu_util': round(monitor.cpu_seconds / monitor.wall_seconds, 3),
+        'cpu_s_per_session': round(monitor.cpu_seconds / users, 3),
+        'cpu_s_per_scenario': round(monitor.cpu_seconds / recorder.scenarios, 3) if recorder.scenarios else None,
+        'rss_start_mib': round(monitor.rss_start / mib, 1),
+        'rss_peak_mib': round(monitor.peak_rss / mib, 1),
+        'rss_mib_per_session': round((monitor.peak_rss - monitor.rss_start) / mib / users, 2),
+        'actions': actions,
+        'errors': recorder.error_messages
+    }
+
+
+def find_knee(levels) -> int:
+    """Ostatni poziom, po którym przepustowość rosła jeszcze o co najmniej KNEE_MIN_GAIN; None - brak nasycenia"""
+    for previous, current in zip(levels, levels[1:]):
+        if current['throughput_per_s'] < previous['throughput_per_s'] * (1 + KNEE_MIN_GAIN):
+            return previous['users']
+    return None
+
+
+def print_level(level):
+    print(
+        f"\n== {level['users']} użytkowników: {level['scenarios']} scenariuszy w {level['wall_s']:.1f} s "
+        f"({level['throughput_per_s']:.3f}/s), CPU {level['cpu_util']:.0%} "
+        f"({level['cpu_s_per_session']:.2f} s/sesję), RSS {level['rss_peak_mib']:.0f} MiB "
+        f"(+{level['rss_mib_per_session']:.1f} MiB/sesję)"
+    )
+    print(f"{'akcja':<22}{'liczba':>8}{'błędy':>7}" + ''.join(f"{f'p{q} [ms]':>12}" for q in PERCENTILES))
+    for action, stats in level['actions'].items():
+        print(f"{action:<22}{stats['count']:>8}{stats['errors']:>7}"
+              + ''.join(f"{stats[f'p{q}_ms']:>12.1f}" for q in PERCENTILES))
+    for message in level['errors'][:5]:
+        print(f"  błąd: {message}")
+
+
+def print_summary(levels, knee):
+    print(f"\n{'użytkownicy':>12}{'scen./s':>10}{'CPU':>7}{'RSS [MiB]':>11}"
+          f"{'oferta p95':>12}{'edycja p95':>12}{'PDF p95':>10}")
+    for level in levels:
+        actions = level['actions']
+        print(f"{level['users']:>12}{level['throughput_per_s']:>10.3f}{level['cpu_util']:>7.0%}"
+              f"{level['rss_peak_mib']:>11.0f}{actions['generowanie_oferty']['p95_ms']:>12.0f}"
+              f"{actions['edycja_tabeli']['p95_ms']:>12.0f}{actions['generowanie_pdf']['p95_ms']:>10.0f}")
+    if len(levels) < 2:
+        print("\nPunkt nasycenia: potrzebne są co najmniej dwa poziomy współbieżności (--users)")
+    elif knee is None:
+        print("\nPunkt nasycenia: nie osiągnięty - przepustowość rośnie do ostatniego poziomu")
+    else:
+        print(f"\nPunkt nasycenia: {knee} użytkowników - dalej przepustowość rośnie o mniej niż {KNEE_MIN_GAIN:.0%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+', default=list(DEFAULT_USERS),
+                        help="poziomy współbieżności (liczby równoczesnych sesji)")
+    parser.add_argument('--duration', type=float, default=30.0, help="czas trwania poziomu (s)")
+    parser.add_argument('--think', type=float, default=1.0,
+                        help="średnia przerwa użytkownika między krokami scenariusza (s)")
+    parser.add_argument('--latency', default=DEFAULT_LATENCY, help="rozkład opóźnienia LLM (llm_stub_server)")
+    parser.add_argument('--replay', help="plik JSONL z nagranymi odpowiedziami LLM (llm_stub_server --replay)")
+    parser.add_argument('--texts', default=TEXTS_PATH, help="plik JSONL z treściami zapytań (pole text)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="zapisz raport JSON do pliku")
+    args = parser.parse_args(argv)
+
+    texts = load_texts(args.texts)
+    stub, api_url = start_stub_process(args.latency, args.replay, args.seed)
+    try:
+        # Przed importem modułów aplikacji - config i bramka LLM czytają adres przy starcie
+        os.environ['OPENAI_BASE_URL'] = api_url
+        install_shared_runtime()
+
+        import llm_cache
+        from logging_setup import setup_logging
+
+        # Logi aplikacji tylko do app.log - raport testu zostaje czytelny
+        setup_logging(console=False)
+        # Cache LLM w pamięci - test nie dopisuje wpisów do llm_cache.db
+        llm_cache._cache = llm_cache.LLMResponseCache(':memory:')
+
+        print(f"Serwer zastępczy LLM: {api_url} (opóźnienie {args.latency}), {len(texts)} treści zapytań")
+        # Rozgrzewka poza pomiarem: import modułów strony, migawka katalogu, zasoby PDF
+        warmup = VirtualUser(-1, texts, Recorder(), 0.0, args.seed)
+        if not (warmup._timed('otwarcie_strony', warmup.open_page) and warmup.scenario()):
+            print(f"Rozgrzewka nie powiodła się: {warmup.recorder.error_messages}")
+            return 1
+        levels = []
+        for users in args.users:
+            level = run_level(users, texts, args.duration, args.think, args.seed)
+            print_level(level)
+            levels.append(level)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+    knee = find_knee(levels)
+    print_summary(levels, knee)
+    if args.json:
+        report = {
+            'meta': {
+                'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'cpu_count': os.cpu_count(),
+                'duration_s': args.duration,
+                'think_s': args.think,
+                'latency': args.latency
+            },
+            'levels': levels,
+            'knee_users': knee
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"Zapisano raport: {args.json}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Jedna konfiguracja logowania dla aplikacji i narzędzi wsadowych.
+
+Wpisy trafiają do ograniczonej kolejki w pamięci, a zapis do pliku (z rotacją) i na konsolę
+wykonuje wątek QueueListener - wątek obsługujący żądanie nie czeka na dysk.
+Poziomy można nadpisać zmiennymi LOG_LEVEL (poziom główny) oraz LOG_LEVELS
+(np. "offer_generator=DEBUG,httpx=INFO").
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FILE = 'app.log'
+LOG_MAX_BYTES = 1_000_000
+LOG_BACKUP_COUNT = 3
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_LEVEL = 'INFO'
+CONSOLE_LEVEL = logging.WARNING
+# Przy pełnej kolejce nowe wpisy są odrzucane zamiast blokować wątek
+LOG_QUEUE_SIZE = 10_000
+
+# Poziomy dla modułów i bibliotek (nadpisywane przez LOG_LEVELS)
+MODULE_LEVELS = {
+    'PIL': logging.WARNING,
+    'streamlit': logging.WARNING,
+    'urllib3': logging.WARNING,
+    'httpx': logging.WARNING,
+    'httpcore': logging.WARNING,
+    'openai': logging.WARNING,
+    'watchdog': logging.WARNING,
+    'fontTools': logging.WARNING
+}
+
+# Dane (JSON ofert, odpowiedzi LLM) logowane są w części żądań i do ograniczonej długości
+PAYLOAD_SAMPLE_RATE = 0.1
+PAYLOAD_MAX_CHARS = 2000
+
+_listener = None
+_lock = threading.Lock()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler, który przy pełnej kolejce odrzuca wpis zamiast czekać"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def module_levels() -> dict:
+    """Poziomy modułów: MODULE_LEVELS uzupełnione o LOG_LEVELS ze środowiska"""
+    levels = dict(MODULE_LEVELS)
+    for item in os.environ.get('LOG_LEVELS', '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level=None, log_file=LOG_FILE, console=True) -> QueueListener:
+    """Konfiguruje logowanie przez kolejkę; kolejne wywołania (np. przy przeładowaniu strony) nic nie zmieniają"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+
+        formatter = logging.Formatter(LOG_FORMAT)
+        file_handler = RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True
+        )
+        file_handler.setFormatter(formatter)
+        handlers = [file_handler]
+        if console:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setLevel(CONSOLE_LEVEL)
+            console_handler.setFormatter(formatter)
+            handlers.append(console_handler)
+
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(DroppingQueueHandler(log_queue))
+        root.setLevel(level or os.environ.get('LOG_LEVEL', DEFAULT_LEVEL).upper())
+        for name, module_level in module_levels().items():
+            logging.getLogger(name).setLevel(module_level)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        os.register_at_fork(after_in_child=_after_fork)
+        return _listener
+
+
+def _after_fork():
+    """W procesie potomnym nie działa wątek QueueListener - wpisy idą bezpośrednio na stderr"""
+    global _listener
+    _listener = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setLevel(CONSOLE_LEVEL)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root.addHandler(handler)
+
+
+def dropped_records() -> int:
+    """Liczba wpisów odrzuconych przez pełną kolejkę"""
+    return sum(h.dropped for h in logging.getLogger().handlers if isinstance(h, DroppingQueueHandler))
+
+
+def log_payload(logger, message, payload, level=logging.DEBUG, sample_rate=PAYLOAD_SAMPLE_RATE,
+                max_chars=PAYLOAD_MAX_CHARS):
+    """Loguje dane (np. JSON oferty) w części wywołań i skrócone do max_chars.
+
+    Serializacja odbywa się tylko wtedy, gdy wpis faktycznie zostanie zapisany.
+    """
+    if not logger.isEnabledFor(level) or (sample_rate < 1.0 and random.random() >= sample_rate):
+        return
+    if isinstance(payload, str):
+        text = payload
+    else:
+        text = json.dumps(payload, ensure_ascii=False, default=str)
+    if len(text) > max_chars:
+        text = f"{text[:max_chars]}... (+{len(text) - max_chars} znaków)"
+    logger.log(level, f"{message}: {text}")
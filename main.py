@@ -1,31 +1,23 @@
 import streamlit as st
-from database import OfferDatabase
+from database import get_shared_database
 from st_aggrid import AgGrid, GridOptionsBuilder
 import pandas as pd
 import json
+from rerun_profiler import get_profile_buffer, is_enabled, profile_rerun, profile_section
+from logging_setup import setup_logging
+from llm_gateway import get_llm_gateway
+from rate_limiter import get_rate_limiter
+
+setup_logging()
+
+# Nazwa strony w profilu przeładowań
+PAGE_NAME = "Panel administracyjny"
 
 def load_vehicle_data():
-    """Ładuje wszystkie dane o pojazdach z bazy"""
-    db = OfferDatabase()
+    """Ładuje wszystkie dane o pojazdach z migawki katalogu"""
     try:
-        cursor = db.conn.cursor()
-        cursor.execute("""
-            SELECT 
-                "Marka", "Model", "Kubatura (m³)",
-                "Zabudowy izotermiczne Cena (zł netto)",
-                "Sklejki Cena (zł netto)",
-                "Nadkola sklejka 12mm Cena zł netto"
-            FROM samochody
-        """)
-        
-        columns = ["Marka", "Model", "Kubatura (m³)", 
-                  "Zabudowy izotermiczne Cena (zł netto)",
-                  "Sklejki Cena (zł netto)",
-                  "Nadkola sklejka 12mm Cena zł netto"]
-        data = cursor.fetchall()
-
-        df = pd.DataFrame(data, columns=columns)
-        return df
+        # Kopia, aby filtry jednej sesji nie zmieniały wspólnej migawki
+        return get_shared_database().catalog().vehicles_frame.copy()
         
     except Exception as e:
         st.error(f"Błąd podczas ładowania danych: {str(e)}")
@@ -77,6 +69,71 @@ def show_statistics(df):
     st.bar_chart(brand_counts)
     
 
+def show_profiler_panel():
+    """Panel profilu przeładowań stron - najdroższe sekcje i eksport do JSON"""
+    st.subheader("Profil przeładowań")
+    if not is_enabled():
+        st.info("Profilowanie jest wyłączone - uruchom aplikację z PROFILE_RERUNS=1 "
+                "albo otwórz stronę z parametrem ?profile=1")
+    
+    buffer = get_profile_buffer()
+    records = buffer.records()
+    if not records:
+        st.write("Brak zapisanych przeładowań")
+        return
+    
+    st.write("Czas sekcji (ms)")
+    st.dataframe(pd.DataFrame(buffer.summary()), use_container_width=True)
+    
+    st.write("Ostatnie przeładowania")
+    recent = [
+        {
+            'czas': record['time'],
+            'sesja': record['session'],
+            'strona': record['page'],
+            'zakres': record['scope'],
+            'widżet': ', '.join(record['trigger']),
+            'całość_ms': record['total_ms'],
+            'sekcje': json.dumps(record['sections'], ensure_ascii=False),
+            'klucze_stanu': record.get('state_keys'),
+            'rozmiar_stanu_B': record.get('state_bytes')
+        }
+        for record in reversed(records[-100:])
+    ]
+    st.dataframe(pd.DataFrame(recent), use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="Eksportuj profil (JSON)",
+            data=buffer.to_json(),
+            file_name="rerun_profile.json",
+            mime="application/json"
+        )
+    with col2:
+        if st.button("Wyczyść profil"):
+            buffer.clear()
+            st.rerun()
+
+def show_llm_gateway_panel():
+    """Liczniki i czasy wywołań wspólnej bramy LLM"""
+    st.subheader("Brama LLM")
+    try:
+        stats = get_llm_gateway().snapshot()
+    except ValueError as e:
+        st.info(str(e))
+        return
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Wywołania", stats['calls'])
+    col2.metric("Błędy", stats['errors'])
+    col3.metric("Ponowienia", stats['retries'])
+    col4.metric("Circuit breaker", stats['breaker'])
+    st.dataframe(pd.DataFrame([stats]), use_container_width=True)
+    
+    st.write("Limit wywołań (kolejka według pasa)")
+    st.dataframe(pd.DataFrame(get_rate_limiter().snapshot()), use_container_width=True)
+
 def main():
     st.set_page_config(
         page_title="AutoAdaptacje - Panel administracyjny",
@@ -88,12 +145,12 @@ def main():
     st.title("AutoAdaptacje - Statystyki")
     
     # Ładowanie danych
-    with st.spinner("Ładowanie danych..."):
+    with st.spinner("Ładowanie danych..."), profile_section("dane"):
         df = load_vehicle_data()
     
     if not df.empty:
         # Zakładki
-        tabs = st.tabs(["Baza pojazdów", "Statystyki"])
+        tabs = st.tabs(["Baza pojazdów", "Statystyki", "Profil przeładowań"])
         
         with tabs[0]:
             # Filtry
@@ -112,10 +169,15 @@ def main():
                 filtered_df = filtered_df[filtered_df['Marka'].isin(selected_brand)]
             
             # Wyświetlanie danych z unikalnym kluczem
-            create_grid(filtered_df, "Baza pojazdów", "main")
+            with profile_section("grid:baza_pojazdow"):
+                create_grid(filtered_df, "Baza pojazdów", "main")
 
-        with tabs[1]:
+        with tabs[1], profile_section("statystyki"):
             show_statistics(df)
+
+        with tabs[2]:
+            show_profiler_panel()
+            show_llm_gateway_panel()
     else:
         st.warning("Brak danych w bazie")
     
@@ -124,4 +186,5 @@ def main():
     st.markdown("Panel administracyjny AutoAdaptacje © 2025")
 
 if __name__ == "__main__":
-    main()
+    with profile_rerun(PAGE_NAME):
+        main()
@@ -1,172 +1,221 @@
-from database import OfferDatabase
-from openai import OpenAI
+from database import OfferDatabase, get_shared_database
+from aggregate_solver import DEFAULT_POWER_MODE, DEFAULT_TEMPERATURE, POWER_MODES, TEMPERATURES
+from catalog_retrieval import TOP_VEHICLES, RetrievalResult, catalog_schema
+from catalog_service import CatalogSnapshot
+from incremental_json import IncrementalJSONParser
+from llm_cache import LLMResponseCache, get_llm_cache, make_cache_key
+from llm_gateway import get_llm_gateway
+from rate_limiter import BATCH, estimate_tokens
+from pdf_assets import place_image
+from pdf_store import get_pdf_store
+from pricing import offer_total
+from telemetry import record, span, usage_attrs
+from logging_setup import log_payload
+from offer_schema import LLM_OUTPUT_STRUCTURE, OFFER_RESPONSE_FORMAT, empty_offer
 import json
-from config import OPENAI_API_KEY
 from fpdf import FPDF
-import tempfile
 import streamlit as st
 import logging
 import os
 import traceback
-from datetime import datetime
-
-# Konfiguracja logowania
-logging.basicConfig(
-    level=logging.WARNING,  # Zmiana z DEBUG/INFO na WARNING
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        # Ograniczenie rozmiaru pliku logów do 1MB z max 3 backupami
-        logging.handlers.RotatingFileHandler(
-            'app.log',
-            maxBytes=1_000_000,  # 1MB
-            backupCount=3
-        )
-    ]
-)
+import hashlib
+import time
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
-# Wyłączenie niepotrzebnych logów z bibliotek
-logging.getLogger('PIL').setLevel(logging.WARNING)
-logging.getLogger('streamlit').setLevel(logging.WARNING)
-logging.getLogger('urllib3').setLevel(logging.WARNING)
+# Szablon promptu systemowego. Stałe instrukcje i nagłówki tabel katalogu ({catalog_schema}) tworzą
+# identyczny dla każdego zapytania prefiks, dzięki czemu działa cache promptów dostawcy.
+# Wiersze katalogu wybrane dla danego tekstu idą w kolejnej wiadomości (CATALOG_ROWS_PROMPT)
+ANALYSIS_PROMPT = """
+Przeanalizuj tekst oferty i wybierz odpowiednie dane z bazy danych.
+
+Jeśli w tekście znajduje się nazwa firmy lub NIP, wyszukaj dodatkowe informacje o firmie w publicznie dostępnych źródłach, w tym na stronie https://aleo.com/pl/.
+Wykorzystaj te informacje do uzupełnienia danych firmy w ofercie.
+
+WAŻNE ZASADY DOTYCZĄCE POJAZDÓW:
+1. Nazwy pojazdów w bazie są zapisane w formacie "Opel Combo", "Opel Vivaro" itp.
+2. Podczas wyszukiwania:
+   - Traktuj całą nazwę (np. "Opel Vivaro") jako markę pojazdu
+   - Model to odpowiedni wariant (np. "L1H1", "L2H2")
+3. Przykład:
+   - Dla "Opel Vivaro L2H1":
+     * marka: "Opel Vivaro"
+     * model: "L2H1"
+
+
+WAŻNE: Zwróć TYLKO czysty JSON, bez żadnego dodatkowego tekstu czy formatowania markdown.
+
+Format odpowiedzi:
+{{
+    "dane_klienta": {{
+        "nazwa": "",
+        "adres": "",
+        "nip": "",
+        "osoba_odpowiedzialna": "",
+        "telefon": "",
+        "email": ""
+    }},
+    "data_oferty": "",
+    "numer_oferty": "",
+    "pojazd": {{
+        "marka": "",  # np. "Opel Vivaro"
+        "model": "",  # np. "L2H1"
+        "kubatura": null,
+        "zabudowa_cena": null,
+        "sklejki_cena": null,
+        "nadkola_cena": null
+    }},
+    "wymagania": {{
+        "temperatura": 0,  # 0 lub -20
+        "zasilanie": "tylko_drogowy"  # "tylko_drogowy", "drogowy_siec_230V" lub "drogowy_siec_400V"
+    }},
+    "agregat": {{
+        "model": ""  # tylko jeśli klient wskazał konkretny model, np. "Z350"
+    }},
+    "grzanie": {{
+        "model_jednostki": "",
+        "model_opcji": "",
+        "cena": null
+    }},
+    "zestaw_podgrzewacza": {{
+        "grzatki_elektryczne": "",
+        "model_opcji": "",
+        "cena": null
+    }}
+}}
+
+Podczas wyszukiwania danych:
+1. Dopasuj pojazd na podstawie pełnej nazwy marki (np. "Opel Vivaro") i modelu (np. "L2H1")
+2. Ustal wymagania klienta: temperaturę w zabudowie (0 lub -20 st.C) oraz sposób zasilania agregatu
+   (tylko drogowy, drogowy + sieć 230V, drogowy + sieć 400V) - agregat zostanie dobrany automatycznie
+3. Dobierz opcje grzania i podgrzewacza jeśli są wymagane
+4. Upewnij się, że wszystkie ceny są poprawnie skopiowane z bazy danych
+5. Jeśli jakieś pole nie jest wymagane lub nie ma danych, zostaw je puste lub null
+
+Dane z bazy dostaniesz w kolejnej wiadomości: pojazdy najlepiej pasujące do tekstu albo,
+przy niepewnym dopasowaniu, pełny katalog. Tabele mają postać: nazwa i kolumny w nawiasie,
+potem wiersze z polami oddzielonymi "|". Kolumny tabel:
+{catalog_schema}
+"""
+
+# Pola ustalone lokalnie przez FastExtractor, przekazywane jako osobna wiadomość
+RESOLVED_FIELDS_PROMPT = """
+Poniższe pola zostały już ustalone na podstawie tekstu i bazy danych - przepisz je bez zmian:
+{resolved}
+
+Skup się na ustaleniu pozostałych pól: {unresolved}
+"""
+
+# Wiersze katalogu z wyszukiwania (lub pełny katalog przy niskiej pewności dopasowania)
+CATALOG_ROWS_PROMPT = """
+Dostępne dane w bazie ({scope}):
+{catalog_block}
+"""
+
+LLM_MODEL = "gpt-4o-mini"
+
+# Odpowiedź LLM ograniczona schematem JSON i odbierana strumieniowo
+STRUCTURED_OUTPUT = True
+
 
-def calculate_attachments_cost(prefix="", render_ui=True):
-    """Oblicza koszt dodatkowego wyposażenia i zapisuje wybrane opcje w session_state"""
-    total_cost = 0
+class OfferError(ValueError):
+    """Oczekiwany błąd generowania oferty z komunikatem dla użytkownika"""
+
+
+@lru_cache(maxsize=1)
+def build_analysis_prompt() -> str:
+    """Stały prompt systemowy - wspólny prefiks wszystkich zapytań"""
+    return ANALYSIS_PROMPT.format(catalog_schema=catalog_schema())
+
+def calculate_attachments_cost(prefix="", render_ui=True, container=None, price_list=None):
+    """Oblicza koszt dodatkowego wyposażenia i zapisuje wybrane opcje w session_state.
+
+    Domyślnie rysuje w sidebarze; fragment Streamlit przekazuje własny kontener (container).
+    Ceny pochodzą z tabeli cen wyposażenia (price_list).
+    """
+    if price_list is None:
+        price_list = get_shared_database().get_price_list()
     selected_options = {}
-    
-    with st.sidebar:
+
+    def option(label, code):
+        """Checkbox pozycji wyposażenia; klucz widżetu to kod pozycji"""
+        checked = st.checkbox(label, value=False, key=f"{prefix}{code}")
+        if checked:
+            selected_options[code] = True
+        return checked
+
+    with st.sidebar if container is None else container:
         st.header("Dodatkowe wyposażenie")
         
         # Sekcja: Izolacja
         st.subheader("Izolacja")
-        if st.checkbox("Izoterma 0st.C", value=False, key=f"{prefix}izoterma_0st_c"):
-            total_cost += 100
-            selected_options['izoterma_0st_c'] = True
-        if st.checkbox("Chłodnia -20st.C", value=False, key=f"{prefix}chlodnia_-20st_c"):
-            total_cost += 100
-            selected_options['chlodnia_-20st_c'] = True
-        if st.checkbox("Atest PZH", value=False, key=f"{prefix}atest_pzh"):
-            total_cost += 100
-            selected_options['atest_pzh'] = True
+        option("Izoterma 0st.C", 'izoterma_0st_c')
+        option("Chłodnia -20st.C", 'chlodnia_-20st_c')
+        option("Atest PZH", 'atest_pzh')
 
         # Sekcja: Materiały
         st.subheader("Materiały")
-        materiał_izolacyjny = st.checkbox("Materiał izolacyjny", key=f"{prefix}material_izolacyjny")
-        if materiał_izolacyjny:
-            selected_options['material_izolacyjny'] = True
-            if st.checkbox("Pianka poliuretanowa 40mm", key=f"{prefix}pianka_40mm"):
-                total_cost += 100
-                selected_options['pianka_40mm'] = True
-            if st.checkbox("Pianka poliuretanowa 80mm", key=f"{prefix}pianka_80mm"):
-                total_cost += 100
-                selected_options['pianka_80mm'] = True
+        if option("Materiał izolacyjny", 'material_izolacyjny'):
+            option("Pianka poliuretanowa 40mm", 'pianka_40mm')
+            option("Pianka poliuretanowa 80mm", 'pianka_80mm')
 
         # Sekcja: Wykończenie
         st.subheader("Wykończenie")
-        if st.checkbox("Ściany, sufity: laminat gładki biały", key=f"{prefix}laminat_bialy"):
-            total_cost += 100
-            selected_options['laminat_bialy'] = True
+        option("Ściany, sufity: laminat gładki biały", 'laminat_bialy')
 
         # Sekcja: Podłoga
         st.subheader("Podłoga")
-        podloga = st.checkbox("Podłoga", key=f"{prefix}podloga")
-        if podloga:
-            selected_options['podloga'] = True
-            if st.checkbox("Wylewka antypoślizgowa", key=f"{prefix}wylewka_anty_slizgowa"):
-                total_cost += 100
-                selected_options['wylewka_anty_slizgowa'] = True
-            if st.checkbox("Blacha aluminiowa ryflowana", key=f"{prefix}blacha_ryflowana"):
-                total_cost += 100
-                selected_options['blacha_ryflowana'] = True
+        if option("Podłoga", 'podloga'):
+            option("Wylewka antypoślizgowa", 'wylewka_anty_slizgowa')
+            option("Blacha aluminiowa ryflowana", 'blacha_ryflowana')
 
         # Sekcja: Listwy
         st.subheader("Listwy")
-        listwa_przypodlogowa = st.checkbox("Listwa przypodłogowa na ścianach", key=f"{prefix}listwa_przypodlogowa")
-        if listwa_przypodlogowa:
-            selected_options['listwa_przypodlogowa'] = True
-            if st.checkbox("Aluminiowa biała", key=f"{prefix}aluminiowa_biala"):
-                total_cost += 100
-                selected_options['aluminiowa_biala'] = True
-            if st.checkbox("Aluminiowa srebrna", key=f"{prefix}aluminiowa_srebrna"):
-                total_cost += 100
-                selected_options['aluminiowa_srebrna'] = True
-            if st.checkbox("Stal nierdzewna", key=f"{prefix}stal_nierdzewna"):
-                total_cost += 100
-                selected_options['stal_nierdzewna'] = True
-            if st.checkbox("Blacha aluminiowa ryflowana", key=f"{prefix}blacha_aluminiowa_ryflowana"):
-                total_cost += 100
-                selected_options['blacha_ryflowana'] = True
-            if st.checkbox("Brak", key=f"{prefix}brak"):
-                total_cost += 0
-                selected_options['brak'] = True
+        if option("Listwa przypodłogowa na ścianach", 'listwa_przypodlogowa'):
+            option("Aluminiowa biała", 'aluminiowa_biala')
+            option("Aluminiowa srebrna", 'aluminiowa_srebrna')
+            option("Stal nierdzewna", 'stal_nierdzewna')
+            option("Blacha aluminiowa ryflowana", 'blacha_aluminiowa_ryflowana')
+            option("Brak", 'brak')
 
         # Sekcja: Oświetlenie
         st.subheader("Oświetlenie")
-        if st.checkbox("Oświetlenie LED standard (01702)", key=f"{prefix}oswietlenie_led_standard"):
-            total_cost += 100
-            selected_options['oswietlenie_led_standard'] = True
-        if st.checkbox("Oświetlenie LED wzmocnione (01660)", key=f"{prefix}oswietlenie_led_wzmocnione"):
-            total_cost += 100
-            selected_options['oswietlenie_led_wzmocnione'] = True
+        option("Oświetlenie LED standard (01702)", 'oswietlenie_led_standard')
+        option("Oświetlenie LED wzmocnione (01660)", 'oswietlenie_led_wzmocnione')
 
         # Sekcja: Drzwi
         st.subheader("Drzwi")
-        drzwi_boczne = st.checkbox("Drzwi boczne", key=f"{prefix}drzwi_boczne")
-        if drzwi_boczne:
-            selected_options['drzwi_boczne'] = True
-            if st.checkbox("Wewnętrzne", key=f"{prefix}drzwi_boczne_wewnetrzne"):
-                total_cost += 100
-                selected_options['drzwi_boczne_wewnetrzne'] = True
-            if st.checkbox("Normalnie otwierane", key=f"{prefix}drzwi_boczne_normalnie"):
-                total_cost += 100
-                selected_options['drzwi_boczne_normalnie'] = True
-            if st.checkbox("Brak", key=f"{prefix}brak"):
-                total_cost += 0
-                selected_options['brak'] = True
-
-        if st.checkbox("Drzwi tylne grube", key=f"{prefix}drzwi_tylne_grube"):
-            total_cost += 100
-            selected_options['drzwi_tylne_grube'] = True
-        if st.checkbox("Futryna drzwi tylnych", key=f"{prefix}futryna_drzwi_tylnych"):
-            total_cost += 100
-            selected_options['futryna_drzwi_tylnych'] = True
+        if option("Drzwi boczne", 'drzwi_boczne'):
+            option("Wewnętrzne", 'drzwi_boczne_wewnetrzne')
+            option("Normalnie otwierane", 'drzwi_boczne_normalnie')
+            option("Brak", 'drzwi_boczne_brak')
+
+        option("Drzwi tylne grube", 'drzwi_tylne_grube')
+        option("Futryna drzwi tylnych", 'futryna_drzwi_tylnych')
 
         # Sekcja: Nadkola
         st.subheader("Nadkola")
-        nadkola = st.checkbox("Nadkola", key=f"{prefix}nadkola")
-        if nadkola:
-            selected_options['nadkola'] = True
-            if st.checkbox("Odlew z laminatu", key=f"{prefix}nadkola_odlew_laminat"):
-                total_cost += 100
-                selected_options['nadkola_odlew_laminat'] = True
-            if st.checkbox("Kwadratowe wzmocnienie kątownikami", key=f"{prefix}nadkola_wzmocnienie"):
-                total_cost += 100
-                selected_options['nadkola_wzmocnienie'] = True
-            if st.checkbox("Blacha aluminiowa ryflowana", key=f"{prefix}nadkola_blacha_ryflowana"):
-                total_cost += 100
-                selected_options['nadkola_blacha_ryflowana'] = True
+        if option("Nadkola", 'nadkola'):
+            option("Odlew z laminatu", 'nadkola_odlew_laminat')
+            option("Kwadratowe wzmocnienie kątownikami", 'nadkola_wzmocnienie')
+            option("Blacha aluminiowa ryflowana", 'nadkola_blacha_ryflowana')
 
         # Sekcja: Inne
         st.subheader("Inne")
-        if st.checkbox("Listwa airline", key=f"{prefix}listwa_airline"):
-            total_cost += 100
-            selected_options['listwa_airline'] = True
-        if st.checkbox("Drążek rozporowy", key=f"{prefix}drazek_rozporowy"):
-            total_cost += 100
-            selected_options['drazek_rozporowy'] = True
-        if st.checkbox("Przygotowanie do montażu agregatu chłodniczego", key=f"{prefix}przygotowanie_agregatu"):
-            total_cost += 100
-            selected_options['przygotowanie_agregatu'] = True
+        option("Listwa airline", 'listwa_airline')
+        option("Drążek rozporowy", 'drazek_rozporowy')
+        option("Przygotowanie do montażu agregatu chłodniczego", 'przygotowanie_agregatu')
 
         inne = st.text_input("Inne (opisz)", key=f"{prefix}inne")
         if inne:
             selected_options['inne'] = inne
 
+        total_cost = price_list.attachments_cost(selected_options)
+
         # Podsumowanie
         st.subheader("Podsumowanie")
-        st.write(f"Koszt dodatkowego wyposażenia: {total_cost} zł")
+        st.write(f"Koszt dodatkowego wyposażenia: {total_cost:.2f} zł")
 
     # Zapisz wybrane opcje w session_state
     if render_ui:
@@ -176,364 +225,490 @@ def calculate_attachments_cost(prefix="", render_ui=True):
     return total_cost
 
 class OfferGenerator:
-    def __init__(self, db: OfferDatabase):
+    def __init__(self, db: OfferDatabase, cache: LLMResponseCache = None, client=None, async_client=None,
+                 structured_output: bool = STRUCTURED_OUTPUT, rate_limiter=None):
         self.db = db
-        if not OPENAI_API_KEY:
-            logger.error("Brak klucza API OpenAI")
-            raise ValueError("Brak klucza API OpenAI. Sprawdź plik .env")
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
-
-    def calculate_total_cost(self, offer_data: dict) -> float:
-        """Oblicza całkowity koszt na podstawie wszystkich składników"""
-        total = 0.0
-        
-        try:
-            # Koszt pojazdu i zabudowy
-            pojazd = offer_data.get('pojazd', {})
-            total += float(pojazd.get('zabudowa_cena') or 0)
-            total += float(pojazd.get('sklejki_cena') or 0)
-            total += float(pojazd.get('nadkola_cena') or 0)
-            
-            # Koszt agregatu
-            agregat = offer_data.get('agregat', {})
-            total += float(agregat.get('cena_cennikowa') or 0)
-            
-            # Koszt grzania
-            grzanie = offer_data.get('grzanie', {})
-            total += float(grzanie.get('cena') or 0)
-            
-            # Koszt zestawu podgrzewacza
-            zestaw = offer_data.get('zestaw_podgrzewacza', {})
-            total += float(zestaw.get('cena') or 0)
+        self.structured_output = structured_output
+        self.cache = cache or get_llm_cache()
+        self.async_client = async_client
+        # Limit dla wywołań przez async_client (pas wsadowy); klient synchroniczny limituje brama LLM
+        self.rate_limiter = rate_limiter
+        # Domyślnie wspólna dla procesu brama LLM (jedna pula połączeń dla wszystkich generatorów)
+        self.client = client if client is not None else get_llm_gateway()
 
-            # Dodaj koszt dodatkowego wyposażenia
-            if 'attachments_cost' in st.session_state:
-                total += st.session_state['attachments_cost']
-            
-            return total
+    def calculate_total_cost(self, offer_data: dict, attachments_cost: float = None) -> float:
+        """Oblicza całkowity koszt na podstawie wszystkich składników (pricing.price_offer)"""
+        try:
+            return offer_total(offer_data, attachments_cost or 0)
         except (ValueError, TypeError) as e:
             logger.error(f"Błąd podczas obliczania kosztu całkowitego: {str(e)}")
             return 0.0
 
-    def create_offer(self, text: str) -> tuple:
+    def create_offer(self, text: str, selected_attachments: dict = None, attachments_cost: float = None,
+                     on_partial=None) -> tuple:
+        """Generuje ofertę z tekstu w skrypcie Streamlit; wyposażenie dodatkowe domyślnie z session_state.
+
+        Błędy wyświetlane są jako komunikaty st.error / st.warning, a wynikiem jest wtedy (None, None).
+        Poza wątkiem skryptu (zadania w tle) należy używać generate_offer.
+        """
         if not text:
             logger.warning("Otrzymano pusty tekst")
             st.error("Tekst nie może być pusty")
             return 0, 0 
-            
-        # Pobieranie danych z bazy
+
+        if selected_attachments is None:
+            selected_attachments = st.session_state.get('selected_attachments')
+        if attachments_cost is None:
+            attachments_cost = st.session_state.get('attachments_cost', 0)
         try:
-            cursor = self.db.conn.cursor()
+            return self.generate_offer(text, selected_attachments, attachments_cost, on_partial)
+        except OfferError as e:
+            st.warning(str(e))
+        except Exception as e:
+            st.error(f"Wystąpił błąd: {str(e)}")
+        return None, None
+
+    def generate_offer(self, text: str, selected_attachments: dict = None, attachments_cost: float = 0,
+                       on_partial=None) -> tuple:
+        """Generuje ofertę z tekstu bez odwołań do Streamlit - bezpieczne w wątkach roboczych.
+
+        Wyposażenie przekazywane jest jawnie; błędy zgłaszane są wyjątkami (OfferError dla
+        oczekiwanych przypadków, np. pojazdu spoza bazy). on_partial(sekcja, wartość) wywoływane
+        jest dla każdej sekcji odpowiedzi LLM, gdy tylko zostanie odebrana w trybie strumieniowym.
+        """
+        if not text:
+            raise OfferError("Tekst nie może być pusty")
+
+        with span('create_offer', input_bytes=len(text.encode('utf-8'))) as root:
+            try:
+                with span('catalog_fetch') as stage:
+                    catalog = self._load_catalog()
+                    stage.set(catalog_version=catalog.version, vehicles=len(catalog.vehicles))
+                with span('fast_extract'):
+                    fast = self._fast_extract(text, catalog)
+                if fast.unresolved():
+                    extracted_info = self._extract_with_llm(text, catalog, fast, on_partial)
+                    if extracted_info is None:
+                        raise OfferError("Błąd podczas analizy tekstu. Spróbuj ponownie.")
+                else:
+                    extracted_info = fast.offer
+
+                offer_data, missing_data = self._build_offer(
+                    extracted_info, catalog, selected_attachments, attachments_cost or 0
+                )
+                if offer_data is None:
+                    raise OfferError("Błąd podczas przetwarzania danych oferty")
+                return offer_data, missing_data
+
+            except OfferError as e:
+                root.error = str(e)
+                logger.warning(f"Nie wygenerowano oferty: {str(e)}")
+                raise
+            except Exception as e:
+                root.error = f"{type(e).__name__}: {str(e)}"
+                logger.error(f"Błąd podczas generowania oferty: {str(e)}")
+                logger.error(f"Szczegóły błędu:\n{traceback.format_exc()}")
+                raise
+
+    async def create_offer_async(self, text: str, selected_attachments: dict = None,
+                                 attachments_cost: float = None) -> tuple:
+        """Wersja create_offer dla asyncio - wywołanie LLM przez async_client, bez UI"""
+        if not text:
+            raise ValueError("Tekst nie może być pusty")
+
+        with span('create_offer', input_bytes=len(text.encode('utf-8')), mode='async'):
+            with span('catalog_fetch') as stage:
+                catalog = self._load_catalog()
+                stage.set(catalog_version=catalog.version, vehicles=len(catalog.vehicles))
+            with span('fast_extract'):
+                fast = self._fast_extract(text, catalog)
+            if fast.unresolved():
+                messages, cache_key = self._build_llm_request(text, catalog, fast)
+                with span('llm_call', model=LLM_MODEL) as call:
+                    extracted_info = self.cache.get(cache_key)
+                    call.set(cache='hit' if extracted_info is not None else 'miss')
+                    if extracted_info is None:
+                        if self.async_client is None:
+                            raise OfferError("Brak klienta asynchronicznego LLM (async_client)")
+                        ticket = None
+                        if self.rate_limiter is not None:
+                            ticket = await self.rate_limiter.acquire_async(estimate_tokens(messages), BATCH)
+                            call.set(queue_wait_ms=round(ticket.waited * 1000, 1))
+                        response = await self.async_client.chat.completions.create(
+                            model=LLM_MODEL,
+                            messages=messages,
+                            **self._response_format()
+                        )
+                        if ticket is not None and response.usage is not None:
+                            self.rate_limiter.settle(ticket, response.usage.total_tokens)
+                        content = response.choices[0].message.content or ''
+                        call.set(response_bytes=len(content.encode('utf-8')), **usage_attrs(response.usage))
+                if extracted_info is None:
+                    with span('json_parse'):
+                        extracted_info = self._store_llm_response(content, cache_key, catalog)
+                    if extracted_info is None:
+                        raise ValueError("Nie udało się sparsować odpowiedzi LLM")
+                extracted_info = fast.merge_into(extracted_info)
+            else:
+                extracted_info = fast.offer
+
+            offer_data, missing_data = self._build_offer(
+                extracted_info, catalog, selected_attachments, attachments_cost or 0
+            )
+            if offer_data is None:
+                raise OfferError("Błąd podczas przetwarzania danych oferty")
+            return offer_data, missing_data
+
+    def _load_catalog(self) -> CatalogSnapshot:
+        """Pobiera migawkę tabel cennikowych wraz z ich wersją"""
+        return self.db.catalog()
+
+    def _fast_extract(self, text, catalog):
+        """Szybka, lokalna ekstrakcja pól możliwych do ustalenia bez LLM"""
+        fast = catalog.fast_extractor.extract(text)
+        unresolved = fast.unresolved()
+        if unresolved:
+            logger.info(f"Pola do ustalenia przez LLM: {', '.join(unresolved)}")
+        else:
+            logger.info("Wszystkie wymagane pola ustalone lokalnie, pomijam wywołanie LLM")
+        return fast
+
+    def _build_offer(self, extracted_info, catalog, selected_attachments=None, attachments_cost=0) -> tuple:
+        """Uzupełnia dane z LLM o dane z bazy, dobiera agregat i liczy koszt.
+
+        Pojazd spoza bazy zgłaszany jest jako OfferError; inne błędy dają (None, None).
+        """
+        # Po sparsowaniu JSON, sprawdzamy i uzupełniamy brakujące pola
+        try:
+            if 'zabudowa' in extracted_info:
+                zabudowa = extracted_info['zabudowa']
+                if not isinstance(zabudowa.get('wykonczenia'), list):
+                    zabudowa['wykonczenia'] = []
+                
+                # Upewniamy się, że wszystkie wymagane pola istnieją
+                required_fields = {
+                    'typ': '', 'temperatura': '', 'cena_netto': 0,
+                    'atest_pzh': True, 'gwarancja': '',
+                    'material_izolacyjny': {'typ': '', 'grubosc': ''},
+                    'sciany_sufit': '', 'podloga': '', 'wykonczenia': []
+                }
+                
+                for field, default_value in required_fields.items():
+                    if field not in zabudowa:
+                        zabudowa[field] = default_value
+                        
+                if 'material_izolacyjny' not in zabudowa:
+                    zabudowa['material_izolacyjny'] = {'typ': '', 'grubosc': ''}
+                
+            # Pobieranie informacji o pojeździe z bazy
+            with span('vehicle_lookup') as stage:
+                db_vehicle_info = self.db.get_vehicle_info(
+                    marka=extracted_info['pojazd']['marka'],
+                    model=extracted_info['pojazd']['model']
+                )
+                stage.set(found=bool(db_vehicle_info))
             
-            # Pobierz dane o samochodach
-            cursor.execute("""
-                SELECT 
-                    "Marka", "Model", "Kubatura (m³)",
-                    "Zabudowy izotermiczne Cena (zł netto)",
-                    "Sklejki Cena (zł netto)",
-                    "Nadkola sklejka 12mm Cena zł netto"
-                FROM samochody
-            """)
-            vehicles = cursor.fetchall()
+            if not db_vehicle_info:
+                logger.warning(f"Nie znaleziono pojazdu {extracted_info['pojazd']['marka']} {extracted_info['pojazd']['model']} w bazie")
+                raise OfferError("Wybrany pojazd nie jest dostępny w bazie")
             
-            # Pobierz dane o agregatach
-            cursor.execute("""
-                SELECT *
-                FROM "Agregaty Daikin"
-            """)
-            agregaty = cursor.fetchall()
+            logger.info(f"Znaleziono pojazd w bazie: {db_vehicle_info['marka']} {db_vehicle_info['model']}")
+            log_payload(logger, "Dane pojazdu z bazy", db_vehicle_info)
             
-            # Pobierz dane o opcjach grzania
-            cursor.execute('SELECT * FROM "Grzanie"')
-            grzanie = cursor.fetchall()
+            # Dobór agregatu na podstawie kubatury pojazdu i wymagań klienta
+            with span('aggregate_select'):
+                extracted_info['agregat'] = self._select_aggregate(
+                    catalog, float(db_vehicle_info.get('kubatura') or 0), extracted_info
+                )
+            
+            # Obliczanie całkowitego kosztu
+            with span('total_computation'):
+                total_cost = self.calculate_total_cost(extracted_info, attachments_cost)
+            extracted_info['cena_calkowita_netto'] = total_cost
             
-            # Przygotuj dane dla LLM
-            db_context = {
-                "dostepne_samochody": [
-                    {
-                        "marka": v[0],
-                        "model": v[1],
-                        "kubatura": v[2],
-                        "zabudowa_cena": float(v[3] if v[3] is not None else 0),
-                        "sklejki_cena": float(v[4] if v[4] is not None else 0),
-                        "nadkola_cena": float(v[5] if v[5] is not None else 0)
-                    } for v in vehicles
-                ],
-                "dostepne_agregaty": [
-                    {
-                        "model": a[1],
-                        "daikin_product_line": a[0],
-                        "refrigerant": a[2],
-                        "instalacja_elektryczna": a[3],
-                        "cena_cennikowa": float(a[7] if a[7] is not None else 0),
-                        "cooling_capacity_0C": float(a[8] if a[8] is not None else 0),
-                        "cooling_capacity_-20C": float(a[9] if a[9] is not None else 0),
-                        "recommended_van_size_0C": float(a[10] if a[10] is not None else 0),
-                        "recommended_van_size_-20C": float(a[11] if a[11] is not None else 0)
-                    } for a in agregaty
-                ],
-                "opcje_grzania": [
-                    {
-                        "model": g[0],
-                        "opcja": g[1],
-                        "cena": float(g[2] if g[2] is not None else 0)
-                    } for g in grzanie
-                ]
+            # Tworzenie finalnej oferty
+            offer_data = {
+                "dane_klienta": extracted_info['dane_klienta'],
+                "data_oferty": extracted_info['data_oferty'],
+                "numer_oferty": extracted_info['numer_oferty'],
+                "pojazd": {
+                    **extracted_info['pojazd'],
+                    # Nazwa i kubatura z katalogu - LLM mógł zwrócić nazwę w innym zapisie
+                    "marka": db_vehicle_info['marka'],
+                    "model": db_vehicle_info['model'],
+                    "kubatura": db_vehicle_info['kubatura'],
+                    "zabudowa_cena": float(db_vehicle_info.get('zabudowa_cena') or 0),
+                    "sklejki_cena": float(db_vehicle_info.get('sklejki_cena') or 0),
+                    "nadkola_cena": float(db_vehicle_info.get('nadkola_cena') or 0)
+                },
+                "agregat": {
+                    **extracted_info['agregat'],
+                    "cena_cennikowa": float(extracted_info['agregat'].get('cena_cennikowa') or 0)
+                },
+                "grzanie": {
+                    **extracted_info.get('grzanie', {}),
+                    "cena": float(extracted_info.get('grzanie', {}).get('cena') or 0)
+                },
+                "zestaw_podgrzewacza": {
+                    **extracted_info.get('zestaw_podgrzewacza', {}),
+                    "cena": float(extracted_info.get('zestaw_podgrzewacza', {}).get('cena') or 0)
+                },
+                "cena_calkowita_netto": extracted_info['cena_calkowita_netto']
             }
-
-            # Zaktualizowany prompt z instrukcjami wyszukiwania danych firmy
-            analysis_prompt = f"""
-            Przeanalizuj tekst oferty i wybierz odpowiednie dane z bazy danych.
             
-            Jeśli w tekście znajduje się nazwa firmy lub NIP, wyszukaj dodatkowe informacje o firmie w publicznie dostępnych źródłach, w tym na stronie https://aleo.com/pl/.
-            Wykorzystaj te informacje do uzupełnienia danych firmy w ofercie.
+            # Dodaj informacje o wybranym dodatkowym wyposażeniu
+            if selected_attachments is not None:
+                offer_data['dodatkowe_wyposazenie'] = selected_attachments
             
-            WAŻNE ZASADY DOTYCZĄCE POJAZDÓW:
-            1. Nazwy pojazdów w bazie są zapisane w formacie "Opel Combo", "Opel Vivaro" itp.
-            2. Podczas wyszukiwania:
-               - Traktuj całą nazwę (np. "Opel Vivaro") jako markę pojazdu
-               - Model to odpowiedni wariant (np. "L1H1", "L2H2")
-            3. Przykład:
-               - Dla "Opel Vivaro L2H1":
-                 * marka: "Opel Vivaro"
-                 * model: "L2H1"
+            logger.info(f"Wygenerowano ofertę {offer_data.get('numer_oferty') or ''}: {offer_data['cena_calkowita_netto']:.2f} zł")
+            log_payload(logger, "Dane oferty", offer_data)
             
-            Dostępne dane w bazie:
-            {json.dumps(db_context, indent=2, ensure_ascii=False)}
+            # Sprawdzenie wymaganych danych
+            missing_data = []
             
-            WAŻNE: Zwróć TYLKO czysty JSON, bez żadnego dodatkowego tekstu czy formatowania markdown.
+            # Sprawdź dane klienta
+            required_company_data = ['nazwa', 'adres', 'nip']
+            for field in required_company_data:
+                if not offer_data.get('dane_klienta', {}).get(field):
+                    missing_data.append(f"Dane Klienta - {field}")
             
-            Format odpowiedzi:
-            {{
-                "dane_klienta": {{
-                    "nazwa": "",
-                    "adres": "",
-                    "nip": "",
-                    "osoba_odpowiedzialna": "",
-                    "telefon": "",
-                    "email": ""
-                }},
-                "data_oferty": "",
-                "numer_oferty": "",
-                "pojazd": {{
-                    "marka": "",  # np. "Opel Vivaro"
-                    "model": "",  # np. "L2H1"
-                    "kubatura": null,
-                    "zabudowa_cena": null,
-                    "sklejki_cena": null,
-                    "nadkola_cena": null
-                }},
-                "agregat": {{
-                    "model": "",
-                    "daikin_product_line": "",
-                    "refrigerant": "",
-                    "instalacja_elektryczna": "",
-                    "tylko_drogowy": "",
-                    "drogowy_siec_230V": "",
-                    "drogowy_siec_400V": "",
-                    "cena_cennikowa": null,
-                    "cooling_capacity_0C": null,
-                    "cooling_capacity_-20C": null,
-                    "recommended_van_size_0C": null,
-                    "recommended_van_size_-20C": null,
-                    "uwagi": "",
-                    "temperature_range": ""
-                }},
-                "grzanie": {{
-                    "model_jednostki": "",
-                    "model_opcji": "",
-                    "cena": null
-                }},
-                "zestaw_podgrzewacza": {{
-                    "grzatki_elektryczne": "",
-                    "model_opcji": "",
-                    "cena": null
-                }}
-            }}
+            # Sprawdź dane pojazdu
+            required_vehicle_data = ['marka', 'model', 'kubatura']
+            for field in required_vehicle_data:
+                if not offer_data.get('pojazd', {}).get(field):
+                    missing_data.append(f"Pojazd - {field}")
             
-            Podczas wyszukiwania danych:
-            1. Dopasuj pojazd na podstawie pełnej nazwy marki (np. "Opel Vivaro") i modelu (np. "L2H1")
-            2. Wybierz odpowiedni agregat Daikin na podstawie wymagań klienta i rekomendowanej wielkości pojazdu
-            3. Dobierz opcje grzania i podgrzewacza jeśli są wymagane
-            4. Upewnij się, że wszystkie ceny są poprawnie skopiowane z bazy danych
-            5. Jeśli jakieś pole nie jest wymagane lub nie ma danych, zostaw je puste lub null
+            # Sprawdź dane agregatu
+            required_aggregate_data = ['model', 'cena_cennikowa']
+            for field in required_aggregate_data:
+                if not offer_data.get('agregat', {}).get(field):
+                    missing_data.append(f"Agregat - {field}")
+
+            # Zwróć dane oferty wraz z listą brakujących danych
+            return offer_data, missing_data
             
-            Pamiętaj o:
-            - Sprawdzeniu czy wybrany agregat jest kompatybilny z pojazdem (na podstawie Recommended Van size)
-            - Uwzględnieniu wymagań dot. instalacji elektrycznej pojazdu
-            - Sprawdzeniu dostępnych opcji grzania dla wybranego modelu
-            """
+        except OfferError:
+            raise
+        except Exception as e:
+            logger.error(f"Błąd podczas przetwarzania danych: {str(e)}")
+            logger.error(f"Szczegóły błędu:\n{traceback.format_exc()}")
+            return None, None
+
+    def _select_aggregate(self, catalog, kubatura: float, extracted_info: dict) -> dict:
+        """Dobiera agregat lokalnie; agregat wskazany kodem wersji w tekście pozostaje bez zmian"""
+        agregat = extracted_info.get('agregat') or {}
+        if agregat.get('daikin_product_line'):
+            return agregat
+
+        wymagania = extracted_info.get('wymagania') or {}
+        try:
+            temperature = int(float(wymagania.get('temperatura') or 0))
+        except (ValueError, TypeError):
+            temperature = DEFAULT_TEMPERATURE
+        if temperature not in TEMPERATURES:
+            temperature = DEFAULT_TEMPERATURE
+        power_mode = wymagania.get('zasilanie')
+        if power_mode not in POWER_MODES:
+            power_mode = DEFAULT_POWER_MODE
+
+        solver = catalog.aggregate_solver
+        candidates = solver.solve(kubatura, temperature, power_mode, model=agregat.get('model'), top_n=1)
+        if not candidates and agregat.get('model'):
+            logger.warning(f"Agregat {agregat.get('model')} nie pasuje do pojazdu, dobieram inny")
+            candidates = solver.solve(kubatura, temperature, power_mode, top_n=1)
+
+        if not candidates:
+            logger.warning(
+                f"Brak agregatu dla kubatury {kubatura} m3, temperatury {temperature} st.C "
+                f"i zasilania {power_mode}"
+            )
+            return agregat
 
+        logger.info(f"Dobrany agregat: {candidates[0]['model']} ({power_mode}, {temperature} st.C)")
+        return candidates[0]
+
+    def _catalog_context(self, text, catalog) -> RetrievalResult:
+        """Wiersze katalogu dla tekstu oferty; przy niskiej pewności pełny katalog"""
+        retrieval = catalog.prompt_index.select_context(text, TOP_VEHICLES)
+        if retrieval.fallback:
+            logger.info(
+                f"Niska pewność dopasowania ({retrieval.confidence:.2f}), "
+                f"wysyłam pełny katalog ({retrieval.full_size} znaków)"
+            )
+        else:
+            logger.info(
+                f"Katalog w promptcie: {retrieval.selected_size} z {retrieval.full_size} znaków "
+                f"(-{retrieval.reduction:.1f}%), pewność {retrieval.confidence:.2f}"
+            )
+        return retrieval
+
+    def _prepare_llm_request(self, text, catalog, fast) -> tuple:
+        """Buduje wiadomości dla LLM oraz klucz cache odpowiedzi"""
+        # Zmienne części promptu trafiają za stały prefiks (instrukcje + nagłówki tabel)
+        retrieval = self._catalog_context(text, catalog)
+        context_prompt = CATALOG_ROWS_PROMPT.format(
+            scope="pełny katalog" if retrieval.fallback else "pojazdy najlepiej pasujące do tekstu",
+            catalog_block=retrieval.block
+        ) + RESOLVED_FIELDS_PROMPT.format(
+            resolved=json.dumps(fast.resolved_fields(), indent=2, ensure_ascii=False),
+            unresolved=', '.join(fast.unresolved())
+        )
+        messages = [
+            {"role": "system", "content": build_analysis_prompt()},
+            {"role": "system", "content": context_prompt},
+            {"role": "user", "content": text}
+        ]
+
+        cache_key = make_cache_key(
+            text, LLM_MODEL, ANALYSIS_PROMPT + CATALOG_ROWS_PROMPT + RESOLVED_FIELDS_PROMPT, catalog.version
+        )
+        return messages, cache_key
+
+    def _store_llm_response(self, response_content, cache_key, catalog):
+        """Parsuje odpowiedź LLM i zapisuje ją w cache"""
+        extracted_info = self._parse_response(response_content)
+        if extracted_info is not None:
+            self.cache.put(cache_key, catalog.version, LLM_MODEL, extracted_info)
+        return extracted_info
+
+    def _response_format(self) -> dict:
+        """Parametry żądania dla trybu structured output"""
+        if not self.structured_output:
+            return {}
+        return {'response_format': OFFER_RESPONSE_FORMAT}
+
+    def _build_llm_request(self, text, catalog, fast) -> tuple:
+        """_prepare_llm_request mierzone jako etap budowy promptu"""
+        with span('prompt_build') as stage:
+            messages, cache_key = self._prepare_llm_request(text, catalog, fast)
+            stage.set(prompt_bytes=sum(len(m['content'].encode('utf-8')) for m in messages))
+        return messages, cache_key
+
+    def _extract_with_llm(self, text, catalog, fast, on_partial=None):
+        """Ustala przez LLM pola, których nie rozpoznała szybka ekstrakcja"""
+        messages, cache_key = self._build_llm_request(text, catalog, fast)
+
+        # Odpowiedź z cache, jeśli ten sam tekst był już analizowany dla tej wersji cennika
+        extracted_info = self.cache.get(cache_key)
+        if extracted_info is not None:
+            logger.info(f"Odpowiedź LLM z cache ({cache_key[:12]})")
+            record('llm_call', 0.0, model=LLM_MODEL, cache='hit')
+        elif self.structured_output:
+            logger.info("Analizowanie tekstu oferty (strumieniowo)...")
+            extracted_info = self._stream_structured(messages, cache_key, catalog, on_partial)
+            if extracted_info is None:
+                return None
+        else:
             # Analiza tekstu oferty
             logger.info("Analizowanie tekstu oferty...")
-            analysis_response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": analysis_prompt},
-                    {"role": "user", "content": text}
-                ]
-            )
-            
-            # Sanityzacja i parsowanie odpowiedzi JSON
-            try:
-                response_content = analysis_response.choices[0].message.content
-                
-                # Wyciągnięcie JSON z odpowiedzi
-                json_start = response_content.find('{')
-                json_end = response_content.rfind('}') + 1
-                
-                if json_start >= 0 and json_end > json_start:
-                    json_content = response_content[json_start:json_end]
-                    
-                    # Próba sparsowania JSON
-                    try:
-                        extracted_info = json.loads(json_content)
-                        logger.info(f"Wyodrębnione informacje: {json.dumps(extracted_info, indent=2, ensure_ascii=False)}")
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Błąd parsowania wyciągniętego JSON: {str(e)}")
-                        logger.error(f"Wyciągnięty JSON: {json_content}")
-                        return None, None
-                else:
-                    logger.error("Nie znaleziono prawidłowej struktury JSON w odpowiedzi")
-                    logger.error(f"Otrzymana odpowiedź: {response_content}")
-                    return None, None
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"Błąd parsowania JSON: {str(e)}")
-                logger.error(f"Otrzymana odpowiedź: {response_content}")
-                st.error("Błąd podczas analizy tekstu. Spróbuj ponownie.")
-                return None, None
-            
-            # Po sparsowaniu JSON, sprawdzamy i uzupełniamy brakujące pola
-            try:
-                if 'zabudowa' in extracted_info:
-                    zabudowa = extracted_info['zabudowa']
-                    if not isinstance(zabudowa.get('wykonczenia'), list):
-                        zabudowa['wykonczenia'] = []
-                    
-                    # Upewniamy się, że wszystkie wymagane pola istnieją
-                    required_fields = {
-                        'typ': '', 'temperatura': '', 'cena_netto': 0,
-                        'atest_pzh': True, 'gwarancja': '',
-                        'material_izolacyjny': {'typ': '', 'grubosc': ''},
-                        'sciany_sufit': '', 'podloga': '', 'wykonczenia': []
-                    }
-                    
-                    for field, default_value in required_fields.items():
-                        if field not in zabudowa:
-                            zabudowa[field] = default_value
-                            
-                    if 'material_izolacyjny' not in zabudowa:
-                        zabudowa['material_izolacyjny'] = {'typ': '', 'grubosc': ''}
-                    
-                # Obliczanie całkowitego kosztu
-                total_cost = self.calculate_total_cost(extracted_info)
-                extracted_info['cena_calkowita_netto'] = total_cost
-                
-                # Pobieranie informacji o pojeździe z bazy
-                db_vehicle_info = self.db.get_vehicle_info(
-                    marka=extracted_info['pojazd']['marka'],
-                    model=extracted_info['pojazd']['model']
+            with span('llm_call', model=LLM_MODEL, cache='miss') as call:
+                analysis_response = self.client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=messages
                 )
-                
-                if not db_vehicle_info:
-                    logger.warning(f"Nie znaleziono pojazdu {extracted_info['pojazd']['marka']} {extracted_info['pojazd']['model']} w bazie")
-                    st.warning("Wybrany pojazd nie jest dostępny w bazie")
-                    return None, None
-                
-                logger.info(f"Znaleziono pojazd w bazie: {json.dumps(db_vehicle_info, indent=2, ensure_ascii=False)}")
-                
-                # Dodaj koszt dodatkowego wyposażenia do ceny całkowitej
-                if 'attachments_cost' in st.session_state:
-                    extracted_info['cena_calkowita_netto'] = (
-                        float(extracted_info.get('cena_calkowita_netto', 0)) + 
-                        float(st.session_state['attachments_cost'])
-                    )
-                
-                # Tworzenie finalnej oferty
-                offer_data = {
-                    "dane_klienta": extracted_info['dane_klienta'],
-                    "data_oferty": extracted_info['data_oferty'],
-                    "numer_oferty": extracted_info['numer_oferty'],
-                    "pojazd": {
-                        **extracted_info['pojazd'],
-                        "zabudowa_cena": float(db_vehicle_info.get('zabudowa_cena') or 0),
-                        "sklejki_cena": float(db_vehicle_info.get('sklejki_cena') or 0),
-                        "nadkola_cena": float(db_vehicle_info.get('nadkola_cena') or 0)
-                    },
-                    "agregat": {
-                        **extracted_info['agregat'],
-                        "cena_cennikowa": float(extracted_info['agregat'].get('cena_cennikowa') or 0)
-                    },
-                    "grzanie": {
-                        **extracted_info.get('grzanie', {}),
-                        "cena": float(extracted_info.get('grzanie', {}).get('cena') or 0)
-                    },
-                    "zestaw_podgrzewacza": {
-                        **extracted_info.get('zestaw_podgrzewacza', {}),
-                        "cena": float(extracted_info.get('zestaw_podgrzewacza', {}).get('cena') or 0)
-                    },
-                    "cena_calkowita_netto": extracted_info['cena_calkowita_netto']
-                }
-                
-                # Dodaj informacje o wybranym dodatkowym wyposażeniu
-                if 'selected_attachments' in st.session_state:
-                    offer_data['dodatkowe_wyposazenie'] = st.session_state['selected_attachments']
-                
-                logger.info(f"Wygenerowano ofertę: {json.dumps(offer_data, indent=2, ensure_ascii=False)}")
-                
-                # Sprawdzenie wymaganych danych
-                missing_data = []
-                
-                # Sprawdź dane klienta
-                required_company_data = ['nazwa', 'adres', 'nip']
-                for field in required_company_data:
-                    if not offer_data.get('dane_klienta', {}).get(field):
-                        missing_data.append(f"Dane Klienta - {field}")
-                
-                # Sprawdź dane pojazdu
-                required_vehicle_data = ['marka', 'model', 'kubatura']
-                for field in required_vehicle_data:
-                    if not offer_data.get('pojazd', {}).get(field):
-                        missing_data.append(f"Pojazd - {field}")
-                
-                # Sprawdź dane agregatu
-                required_aggregate_data = ['model', 'cena_cennikowa']
-                for field in required_aggregate_data:
-                    if not offer_data.get('agregat', {}).get(field):
-                        missing_data.append(f"Agregat - {field}")
+                content = analysis_response.choices[0].message.content or ''
+                call.set(response_bytes=len(content.encode('utf-8')),
+                         **usage_attrs(getattr(analysis_response, 'usage', None)))
 
-                # Zwróć dane oferty wraz z listą brakujących danych
-                return offer_data, missing_data
-                
-            except Exception as e:
-                logger.error(f"Błąd podczas przetwarzania danych: {str(e)}")
-                logger.error(f"Szczegóły błędu:\n{traceback.format_exc()}")
-                return None, None
-            
+            with span('json_parse'):
+                extracted_info = self._store_llm_response(content, cache_key, catalog)
+            if extracted_info is None:
+                return None
+
+        return fast.merge_into(extracted_info)
+
+    def _stream_structured(self, messages, cache_key, catalog, on_partial=None):
+        """Odbiera odpowiedź strumieniowo i przekazuje sekcje oferty, gdy tylko się domkną"""
+        parser = IncrementalJSONParser()
+        parse_time = 0.0
+        with span('llm_call', model=LLM_MODEL, cache='miss', stream=True) as call:
+            stream = self.client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **self._response_format()
+            )
+            for chunk in stream:
+                # Ostatni fragment zawiera tylko statystyki użycia
+                if not chunk.choices:
+                    call.set(**usage_attrs(getattr(chunk, 'usage', None)))
+                    continue
+                if 'first_token_ms' not in call.attrs:
+                    call.set(first_token_ms=round((time.time() - call.start) * 1000, 1))
+                parse_start = time.perf_counter()
+                sections = parser.feed(chunk.choices[0].delta.content)
+                parse_time += time.perf_counter() - parse_start
+                for section, value in sections:
+                    self._on_section(section, value, catalog, on_partial)
+            call.set(response_bytes=len(parser.text.encode('utf-8')))
+        # Parsowanie odbywa się przyrostowo w trakcie strumienia - zapisujemy jego łączny czas
+        record('json_parse', parse_time, complete=parser.complete, sections=len(parser.fields))
+
+        if parser.complete:
+            extracted_info = parser.result()
+            self.cache.put(cache_key, catalog.version, LLM_MODEL, extracted_info)
+            return extracted_info
+
+        if 'pojazd' in parser.fields:
+            # Odpowiedź urwana - używamy odebranych sekcji zamiast ponawiać całe zapytanie
+            logger.warning(f"Niepełna odpowiedź LLM, odebrane sekcje: {', '.join(parser.fields)}")
+            return {**empty_offer(LLM_OUTPUT_STRUCTURE), **parser.result()}
+
+        return self._parse_response(parser.text)
+
+    def _on_section(self, section, value, catalog, on_partial=None):
+        """Obsługa sekcji odebranej ze strumienia: wstępne dopasowanie pojazdu i podgląd w UI"""
+        if section == 'pojazd' and isinstance(value, dict):
+            vehicle = catalog.vehicle_info(value.get('marka'), value.get('model'))
+            if vehicle:
+                value = {**value, **vehicle}
+        if on_partial is None:
+            return
+        try:
+            on_partial(section, value)
         except Exception as e:
-            logger.error(f"Błąd podczas generowania oferty: {str(e)}")
-            logger.error(f"Szczegóły błędu:\n{traceback.format_exc()}")
-            st.error(f"Wystąpił błąd: {str(e)}")
-            return None, None
+            logger.warning(f"Błąd podglądu sekcji {section}: {str(e)}")
 
-    def _generate_pdf(self, offer_data, missing_data) -> str:
-        def remove_pl_chars(text):
-            """Usuwa polskie znaki z tekstu"""
-            if not isinstance(text, str):
-                text = str(text)
+    def _parse_response(self, response_content: str):
+        """Wyciąga i parsuje JSON z odpowiedzi modelu; zwraca None przy błędzie"""
+        # Sanityzacja i parsowanie odpowiedzi JSON
+        try:
+            response_content = response_content or ''
             
-            chars_map = {
-                'ą': 'a', 'ć': 'c', 'ę': 'e', 'ł': 'l', 'ń': 'n', 
-                'ó': 'o', 'ś': 's', 'ź': 'z', 'ż': 'z',
-                'Ą': 'A', 'Ć': 'C', 'Ę': 'E', 'Ł': 'L', 'Ń': 'N', 
-                'Ó': 'O', 'Ś': 'S', 'Ź': 'Z', 'Ż': 'Z'
-            }
+            # Wyciągnięcie JSON z odpowiedzi
+            json_start = response_content.find('{')
+            json_end = response_content.rfind('}') + 1
             
-            for pl, en in chars_map.items():
-                text = text.replace(pl, en)
-            return text
+            if json_start >= 0 and json_end > json_start:
+                json_content = response_content[json_start:json_end]
+                
+                # Próba sparsowania JSON
+                try:
+                    extracted_info = json.loads(json_content)
+                    log_payload(logger, "Wyodrębnione informacje", extracted_info)
+                except json.JSONDecodeError as e:
+                    logger.error(f"Błąd parsowania wyciągniętego JSON: {str(e)}")
+                    log_payload(logger, "Wyciągnięty JSON", json_content, level=logging.ERROR, sample_rate=1.0)
+                    return None
+            else:
+                logger.error("Nie znaleziono prawidłowej struktury JSON w odpowiedzi")
+                log_payload(logger, "Otrzymana odpowiedź", response_content, level=logging.ERROR, sample_rate=1.0)
+                return None
+            
+        except json.JSONDecodeError as e:
+            logger.error(f"Błąd parsowania JSON: {str(e)}")
+            log_payload(logger, "Otrzymana odpowiedź", response_content, level=logging.ERROR, sample_rate=1.0)
+            return None
+        
+        return extracted_info
 
+    def _generate_pdf(self, offer_data, missing_data, selected_attachments=None,
+                      attachments_cost=None, images=None) -> str:
+        """Renderuje PDF w pamięci i zwraca jego identyfikator w magazynie PDF.
+
+        Wyposażenie, jego koszt i zdjęcia domyślnie pobierane są z session_state.
+        """
         try:
             # Usuwamy polskie znaki z komunikatów błędów
             if missing_data:
@@ -542,82 +717,13 @@ class OfferGenerator:
                 st.error(error_message)
                 return None
             
-            # Usuwamy polskie znaki ze wszystkich danych
-            sanitized_data = {
-                'dane_klienta': {remove_pl_chars(k): remove_pl_chars(v) for k, v in offer_data['dane_klienta'].items()},
-                'pojazd': {remove_pl_chars(k): remove_pl_chars(str(v)) for k, v in offer_data['pojazd'].items()},
-                'agregat': {remove_pl_chars(k): remove_pl_chars(str(v)) for k, v in offer_data['agregat'].items()},
-                'data_oferty': remove_pl_chars(str(offer_data.get('data_oferty', ''))),
-                'numer_oferty': remove_pl_chars(str(offer_data.get('numer_oferty', '')))
-            }
-            
-            if 'grzanie' in offer_data:
-                sanitized_data['grzanie'] = {remove_pl_chars(k): remove_pl_chars(str(v)) for k, v in offer_data['grzanie'].items()}
-            
-            if 'zestaw_podgrzewacza' in offer_data:
-                sanitized_data['zestaw_podgrzewacza'] = {remove_pl_chars(k): remove_pl_chars(str(v)) for k, v in offer_data['zestaw_podgrzewacza'].items()}
-            
-            pdf = OfferTemplate()
-            
-            # Sekcje z tekstem (bez polskich znaków)
-            pdf.create_section('Dane Klienta', sanitized_data['dane_klienta'])
-            pdf.create_section('Informacje o pojezdzie', sanitized_data['pojazd'])
-            pdf.create_section('Agregat', {k: v for k, v in sanitized_data['agregat'].items() if 'cena' not in k.lower()})
-            
-            if 'grzanie' in sanitized_data:
-                pdf.create_section('Grzanie', sanitized_data['grzanie'])
-            
-            if 'zestaw_podgrzewacza' in sanitized_data:
-                pdf.create_section('Zestaw podgrzewacza', sanitized_data['zestaw_podgrzewacza'])
-            
-            # Sekcja dodatkowego wyposażenia
-            if 'selected_attachments' in st.session_state and st.session_state['selected_attachments']:
-                # Przygotuj dane o wyposażeniu
-                equipment_data = {}
-                for key, value in st.session_state['selected_attachments'].items():
-                    if value and key != 'inne':  # Pomijamy pole 'inne'
-                        sanitized_key = remove_pl_chars(key.replace('_', ' ').title())
-                        equipment_data[sanitized_key] = 'Tak'
-                
-                # Dodaj pole 'inne' jeśli istnieje
-                if 'inne' in st.session_state['selected_attachments']:
-                    inne = st.session_state['selected_attachments']['inne']
-                    if inne:
-                        equipment_data['Inne'] = remove_pl_chars(str(inne))
-                
-                # Dodaj sekcję do PDF
-                if equipment_data:
-                    pdf.create_section(remove_pl_chars('Dodatkowe wyposazenie'), equipment_data)
-            
-            # Obliczanie całkowitej kwoty
-            total_cost = sum([
-                float(offer_data['pojazd'].get('zabudowa_cena') or 0),
-                float(offer_data['pojazd'].get('sklejki_cena') or 0),
-                float(offer_data['pojazd'].get('nadkola_cena') or 0),
-                float(offer_data['agregat'].get('cena_cennikowa') or 0),
-                float(offer_data.get('grzanie', {}).get('cena') or 0),
-                float(offer_data.get('zestaw_podgrzewacza', {}).get('cena') or 0)
-            ])
-            
-            # Dodaj koszt dodatkowego wyposażenia do sumy
-            if 'attachments_cost' in st.session_state:
-                total_cost += float(st.session_state['attachments_cost'])
-            
-            # Sekcja podsumowania kosztów
-            pdf.create_section(remove_pl_chars('Podsumowanie kosztow'), {
-                remove_pl_chars('Cena calkowita netto'): f"{total_cost:.2f} PLN"
-            })
-            
-            # Dodaj zdjęcia w prawej kolumnie
-            if 'offer_images' in st.session_state and st.session_state['offer_images']:
-                pdf.add_images_column(st.session_state['offer_images'])
-            
-            # Zapisanie PDF
-            pdf_path = f"temp/oferta_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
-            pdf.output(pdf_path)
-            
-            return pdf_path
+            if selected_attachments is None:
+                selected_attachments = st.session_state.get('selected_attachments')
+            if attachments_cost is None:
+                attachments_cost = st.session_state.get('attachments_cost', 0)
+            if images is None:
+                images = st.session_state.get('offer_images')
+            return render_offer_pdf_cached(offer_data, selected_attachments, attachments_cost, images)
             
         except Exception as e:
             error_message = f"Blad podczas generowania PDF: {str(e)}"
@@ -627,6 +733,149 @@ class OfferGenerator:
             return None
 
 
+def remove_pl_chars(text):
+    """Usuwa polskie znaki z tekstu"""
+    if not isinstance(text, str):
+        text = str(text)
+    
+    chars_map = {
+        'ą': 'a', 'ć': 'c', 'ę': 'e', 'ł': 'l', 'ń': 'n', 
+        'ó': 'o', 'ś': 's', 'ź': 'z', 'ż': 'z',
+        'Ą': 'A', 'Ć': 'C', 'Ę': 'E', 'Ł': 'L', 'Ń': 'N', 
+        'Ó': 'O', 'Ś': 'S', 'Ź': 'Z', 'Ż': 'Z'
+    }
+    
+    for pl, en in chars_map.items():
+        text = text.replace(pl, en)
+    return text
+
+
+def sanitize_offer(offer_data) -> dict:
+    """Dane oferty w postaci umieszczanej w PDF (bez polskich znaków, wartości jako tekst)"""
+    sanitized_data = {
+        'dane_klienta': {remove_pl_chars(k): remove_pl_chars(v) for k, v in offer_data['dane_klienta'].items()},
+        'pojazd': {remove_pl_chars(k): remove_pl_chars(str(v)) for k, v in offer_data['pojazd'].items()},
+        'agregat': {remove_pl_chars(k): remove_pl_chars(str(v)) for k, v in offer_data['agregat'].items()},
+        'data_oferty': remove_pl_chars(str(offer_data.get('data_oferty', ''))),
+        'numer_oferty': remove_pl_chars(str(offer_data.get('numer_oferty', '')))
+    }
+    
+    if 'grzanie' in offer_data:
+        sanitized_data['grzanie'] = {remove_pl_chars(k): remove_pl_chars(str(v)) for k, v in offer_data['grzanie'].items()}
+    
+    if 'zestaw_podgrzewacza' in offer_data:
+        sanitized_data['zestaw_podgrzewacza'] = {remove_pl_chars(k): remove_pl_chars(str(v)) for k, v in offer_data['zestaw_podgrzewacza'].items()}
+
+    return sanitized_data
+
+
+def pdf_cache_key(offer_data, selected_attachments=None, attachments_cost=0, images=None) -> str:
+    """Kanoniczny skrót wszystkiego, co wpływa na wygląd PDF - klucz cache wyrenderowanych plików"""
+    image_keys = []
+    for image_path in images or []:
+        mtime = os.stat(image_path).st_mtime_ns if os.path.exists(image_path) else None
+        image_keys.append([image_path, mtime])
+    payload = json.dumps({
+        'template': TEMPLATE_VERSION,
+        'offer': sanitize_offer(offer_data),
+        'attachments': selected_attachments or {},
+        'attachments_cost': float(attachments_cost or 0),
+        'images': image_keys
+    }, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def build_offer_pdf(offer_data, selected_attachments=None, attachments_cost=0, images=None):
+    """Składa dokument PDF oferty; nie korzysta ze stanu sesji Streamlit"""
+    # Usuwamy polskie znaki ze wszystkich danych
+    sanitized_data = sanitize_offer(offer_data)
+
+    pdf = OfferTemplate()
+    
+    # Sekcje z tekstem (bez polskich znaków)
+    pdf.create_section('Dane Klienta', sanitized_data['dane_klienta'])
+    pdf.create_section('Informacje o pojezdzie', sanitized_data['pojazd'])
+    pdf.create_section('Agregat', {k: v for k, v in sanitized_data['agregat'].items() if 'cena' not in k.lower()})
+    
+    if 'grzanie' in sanitized_data:
+        pdf.create_section('Grzanie', sanitized_data['grzanie'])
+    
+    if 'zestaw_podgrzewacza' in sanitized_data:
+        pdf.create_section('Zestaw podgrzewacza', sanitized_data['zestaw_podgrzewacza'])
+    
+    # Sekcja dodatkowego wyposażenia
+    if selected_attachments:
+        # Przygotuj dane o wyposażeniu
+        equipment_data = {}
+        for key, value in selected_attachments.items():
+            if value and key != 'inne':  # Pomijamy pole 'inne'
+                sanitized_key = remove_pl_chars(key.replace('_', ' ').title())
+                equipment_data[sanitized_key] = 'Tak'
+        
+        # Dodaj pole 'inne' jeśli istnieje
+        if 'inne' in selected_attachments:
+            inne = selected_attachments['inne']
+            if inne:
+                equipment_data['Inne'] = remove_pl_chars(str(inne))
+        
+        # Dodaj sekcję do PDF
+        if equipment_data:
+            pdf.create_section(remove_pl_chars('Dodatkowe wyposazenie'), equipment_data)
+    
+    # Obliczanie całkowitej kwoty (wraz z kosztem dodatkowego wyposażenia)
+    total_cost = offer_total(offer_data, attachments_cost or 0)
+    
+    # Sekcja podsumowania kosztów
+    pdf.create_section(remove_pl_chars('Podsumowanie kosztow'), {
+        remove_pl_chars('Cena calkowita netto'): f"{total_cost:.2f} PLN"
+    })
+    
+    # Dodaj zdjęcia w prawej kolumnie
+    if images:
+        pdf.add_images_column(images)
+    
+    return pdf
+
+
+def render_offer_pdf_bytes(offer_data, selected_attachments=None, attachments_cost=0, images=None) -> bytes:
+    """Renderuje PDF oferty w pamięci, bez zapisu na dysk"""
+    pdf = build_offer_pdf(offer_data, selected_attachments, attachments_cost, images)
+    # FPDF 1.7 zwraca dokument jako str z bajtami w kodowaniu latin-1
+    return pdf.output(dest='S').encode('latin-1')
+
+
+def render_offer_pdf_cached(offer_data, selected_attachments=None, attachments_cost=0, images=None,
+                            store=None) -> str:
+    """Zwraca identyfikator PDF w magazynie; renderuje tylko, gdy oferta zmieniła się od ostatniego razu"""
+    store = store or get_pdf_store()
+    with span('pdf_render') as stage:
+        key = pdf_cache_key(offer_data, selected_attachments, attachments_cost, images)
+        cached = store.get(key)
+        if cached is not None:
+            logger.info(f"PDF z cache ({key[:12]})")
+            stage.set(cache='hit', pdf_bytes=len(cached))
+            return key
+        data = render_offer_pdf_bytes(offer_data, selected_attachments, attachments_cost, images)
+        stage.set(cache='miss', pdf_bytes=len(data), images=len(images or []))
+        return store.put(data, key)
+
+
+def render_offer_pdf(offer_data, pdf_path, selected_attachments=None, attachments_cost=0, images=None) -> str:
+    """Zapisuje PDF oferty do pliku; funkcja modułu, więc może działać w puli procesów"""
+    data = render_offer_pdf_bytes(offer_data, selected_attachments, attachments_cost, images)
+    if os.path.dirname(pdf_path):
+        os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+    with open(pdf_path, 'wb') as f:
+        f.write(data)
+    return pdf_path
+
+
+# Wersja szablonu - zmiana wyglądu PDF wymaga jej podniesienia (unieważnia cache PDF)
+TEMPLATE_VERSION = '1'
+LOGO_PATH = 'images/logo.png'
+HEADER_COLOR = (158, 197, 215)
+
+
 class OfferTemplate(FPDF):
     def __init__(self):
         # Najpierw definiujemy wszystkie stałe
@@ -692,11 +941,11 @@ class OfferTemplate(FPDF):
 
     def header(self):
         # Logo i nagłówek
-        self.set_fill_color(158, 197, 215)
+        self.set_fill_color(*HEADER_COLOR)
         self.rect(0, 0, 210, self.header_height, 'F')
         
-        # Logo
-        self.image('images/logo.png', 10, 10, 40)
+        # Logo (przygotowane raz na proces, przezroczystość spłaszczona na kolor nagłówka)
+        place_image(self, LOGO_PATH, 10, 10, 40, background=HEADER_COLOR)
         
         # Ustawienie pozycji Y po nagłówku
         self.set_y(self.header_height + self.top_margin_after_header)
@@ -803,8 +1052,8 @@ class OfferTemplate(FPDF):
                     current_y = self.header_height + self.top_margin_after_header
                 
                 try:
-                    self.image(image_path, x=self.image_x, y=current_y, 
-                              w=self.image_width, h=image_height)
+                    place_image(self, image_path, x=self.image_x, y=current_y,
+                                w=self.image_width, h=image_height)
                     current_y += image_height + self.image_margin
                 except Exception as e:
                     logger.error(f"Błąd podczas dodawania zdjęcia {image_path}: {str(e)}") 
\ No newline at end of file
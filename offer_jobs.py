@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# Liczba równoległych zadań (wywołania LLM i renderowanie PDF)
+JOB_WORKERS = 4
+# Jak długo (w sekundach) przechowywać zakończone zadania
+JOB_RETENTION = 3600
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Zadanie zostało anulowane przez użytkownika"""
+
+
+@dataclass
+class Job:
+    """Zadanie wykonywane w tle wraz ze stanem widocznym dla interfejsu"""
+    id: str
+    kind: str
+    key: str
+    status: str = PENDING
+    progress: float = 0.0
+    message: str = ''
+    partial: dict = field(default_factory=dict)
+    result: object = None
+    error: str = ''
+    created_at: float = field(default_factory=time.time)
+    finished_at: float = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def update(self, progress=None, message=None):
+        """Aktualizacja postępu; przerywa zadanie, jeśli zażądano anulowania"""
+        if progress is not None:
+            self.progress = progress
+        if message is not None:
+            self.message = message
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+
+def job_key(kind, *parts) -> str:
+    """Klucz deduplikacji zadania na podstawie jego rodzaju i danych wejściowych"""
+    payload = json.dumps([kind, *parts], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class JobManager:
+    """Pula wątków z tabelą zadań, deduplikacją identycznych zadań i anulowaniem"""
+
+    def __init__(self, max_workers=JOB_WORKERS, retention=JOB_RETENTION):
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='offer-job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._in_flight = {}
+
+    def submit(self, kind, key, fn, *args, **kwargs) -> Job:
+        """Uruchamia fn(job, *args, **kwargs) w tle; identyczne zadanie w toku jest zwracane ponownie"""
+        with self._lock:
+            self._purge()
+            existing = self._jobs.get(self._in_flight.get(key))
+            if existing is not None and not existing.finished:
+                logger.info(f"Zadanie {kind} już w toku ({existing.id}), pomijam duplikat")
+                return existing
+
+            job = Job(id=uuid.uuid4().hex, kind=kind, key=key)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job.id
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id) -> bool:
+        """Anuluje zadanie; uruchomione zadanie zatrzymuje się na najbliższym etapie"""
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._cancel.set()
+        if job.status == PENDING:
+            self._finish(job, CANCELLED)
+        return True
+
+    def stats(self) -> dict:
+        """Liczba zadań w poszczególnych stanach"""
+        counts = {}
+        for job in list(self._jobs.values()):
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def _run(self, job, fn, args, kwargs):
+        if job.finished:
+            return
+        job.status = RUNNING
+        start = time.perf_counter()
+        try:
+            result = fn(job, *args, **kwargs)
+            job.check_cancelled()
+            job.result = result
+            job.progress = 1.0
+            self._finish(job, DONE)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            job.error = str(e)
+            logger.error(f"Błąd zadania {job.kind} ({job.id}): {str(e)}")
+            logger.error(f"Szczegóły błędu:\n{traceback.format_exc()}")
+            self._finish(job, FAILED)
+        logger.info(f"Zadanie {job.kind} ({job.id}) - {job.status} w {time.perf_counter() - start:.2f} s")
+
+    def _finish(self, job, status):
+        with self._lock:
+            if job.finished:
+                return
+            job.status = status
+            job.finished_at = time.time()
+            if self._in_flight.get(job.key) == job.id:
+                del self._in_flight[job.key]
+
+    def _purge(self):
+        """Usuwa zakończone zadania starsze niż retention"""
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    """Jedna pula zadań na proces (wspólna dla sesji Streamlit)"""
+    return JobManager()
+
+
+def generate_offer_job(job, text, selected_attachments, attachments_cost):
+    """Zadanie: generowanie oferty z tekstu (wyposażenie przekazywane jawnie, bez session_state)"""
+    from database import get_shared_database
+    from offer_generator import OfferGenerator
+
+    job.update(0.05, "Analiza tekstu oferty")
+    sections = ('dane_klienta', 'pojazd', 'wymagania', 'agregat', 'grzanie', 'zestaw_podgrzewacza')
+
+    def on_partial(section, value):
+        job.partial[section] = value
+        received = sum(1 for s in sections if s in job.partial)
+        job.progress = 0.1 + 0.8 * received / len(sections)
+        job.message = f"Odebrano sekcję: {section}"
+
+    # generate_offer nie korzysta ze Streamlit - błędy trafiają do job.error jako wyjątki
+    generator = OfferGenerator(get_shared_database())
+    return generator.generate_offer(
+        text, selected_attachments=selected_attachments, attachments_cost=attachments_cost,
+        on_partial=on_partial
+    )
+
+
+def generate_pdf_job(job, offer_data, selected_attachments, attachments_cost, images):
+    """Zadanie: renderowanie PDF oferty w pamięci; zwraca identyfikator w magazynie PDF"""
+    from offer_generator import render_offer_pdf_cached
+
+    job.update(0.1, "Renderowanie PDF")
+    return render_offer_pdf_cached(offer_data, selected_attachments, attachments_cost, images)
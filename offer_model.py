@@ -0,0 +1,274 @@
+import logging
+from dataclasses import dataclass, field, fields
+from typing import ClassVar
+
+logger = logging.getLogger(__name__)
+
+
+def parse_amount(value) -> float:
+    """Kwota z liczby albo tekstu (np. "1 200,50 zł"); pusta wartość to 0"""
+    number = parse_number(value)
+    return 0.0 if number is None else number
+
+
+def parse_number(value):
+    """Liczba z wartości z tabelki; pusta wartość to None, niepoprawna - ValueError"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).replace('zł', '').replace('PLN', '').replace('\xa0', '').replace(' ', '').replace(',', '.')
+    if not text or text in ('-', 'None', 'nan'):
+        return None
+    return float(text)
+
+
+def format_amount(value) -> str:
+    return f"{value:.2f} zł"
+
+
+@dataclass(slots=True)
+class OfferSection:
+    """Sekcja oferty; pola cenowe przechowywane są jako liczby"""
+    # Pola wliczane do ceny całkowitej
+    PRICE_FIELDS: ClassVar[tuple] = ()
+    # Pola liczbowe, które mogą być puste
+    NUMBER_FIELDS: ClassVar[tuple] = ()
+    # Klucze w słowniku oferty różne od nazw atrybutów (np. "cooling_capacity_-20C")
+    KEYS: ClassVar[dict] = {}
+
+    @classmethod
+    def field_names(cls) -> tuple:
+        return tuple(f.name for f in fields(cls))
+
+    @classmethod
+    def key(cls, name) -> str:
+        return cls.KEYS.get(name, name)
+
+    @classmethod
+    def from_dict(cls, data):
+        section = cls()
+        for name in cls.field_names():
+            value = (data or {}).get(cls.key(name))
+            try:
+                setattr(section, name, section._coerce(name, value))
+            except ValueError:
+                logger.warning(f"{cls.__name__}.{name}: niepoprawna wartość {value!r}")
+        return section
+
+    def to_dict(self) -> dict:
+        return {self.key(name): getattr(self, name) for name in self.field_names()}
+
+    def subtotal(self) -> float:
+        return sum(getattr(self, name) for name in self.PRICE_FIELDS)
+
+    def display(self, name) -> str:
+        """Wartość pola w postaci pokazywanej w tabelce"""
+        value = getattr(self, name)
+        if name in self.PRICE_FIELDS:
+            return format_amount(value)
+        return '' if value is None else str(value)
+
+    def set(self, name, value) -> float:
+        """Ustawia pole z wartości wpisanej w tabelce; zwraca zmianę ceny sekcji"""
+        new = self._coerce(name, value)
+        old = getattr(self, name)
+        setattr(self, name, new)
+        return new - old if name in self.PRICE_FIELDS else 0.0
+
+    def _coerce(self, name, value):
+        if name in self.PRICE_FIELDS:
+            return parse_amount(value)
+        if name in self.NUMBER_FIELDS:
+            return parse_number(value)
+        return '' if value is None else str(value)
+
+
+@dataclass(slots=True)
+class DaneKlienta(OfferSection):
+    nazwa: str = ''
+    adres: str = ''
+    nip: str = ''
+    osoba_odpowiedzialna: str = ''
+    telefon: str = ''
+    email: str = ''
+
+
+@dataclass(slots=True)
+class Pojazd(OfferSection):
+    PRICE_FIELDS: ClassVar[tuple] = ('zabudowa_cena', 'sklejki_cena', 'nadkola_cena')
+    NUMBER_FIELDS: ClassVar[tuple] = ('kubatura',)
+
+    marka: str = ''
+    model: str = ''
+    kubatura: float | None = None
+    zabudowa_cena: float = 0.0
+    sklejki_cena: float = 0.0
+    nadkola_cena: float = 0.0
+
+
+@dataclass(slots=True)
+class Agregat(OfferSection):
+    PRICE_FIELDS: ClassVar[tuple] = ('cena_cennikowa',)
+    NUMBER_FIELDS: ClassVar[tuple] = ('cooling_capacity_0C', 'cooling_capacity_m20C',
+                                      'recommended_van_size_0C', 'recommended_van_size_m20C')
+    KEYS: ClassVar[dict] = {
+        'cooling_capacity_m20C': 'cooling_capacity_-20C',
+        'recommended_van_size_m20C': 'recommended_van_size_-20C'
+    }
+
+    model: str = ''
+    daikin_product_line: str = ''
+    refrigerant: str = ''
+    instalacja_elektryczna: str = ''
+    tylko_drogowy: str = ''
+    drogowy_siec_230V: str = ''
+    drogowy_siec_400V: str = ''
+    cena_cennikowa: float = 0.0
+    cooling_capacity_0C: float | None = None
+    cooling_capacity_m20C: float | None = None
+    recommended_van_size_0C: float | None = None
+    recommended_van_size_m20C: float | None = None
+    uwagi: str = ''
+    temperature_range: str = ''
+
+
+@dataclass(slots=True)
+class Grzanie(OfferSection):
+    PRICE_FIELDS: ClassVar[tuple] = ('cena',)
+
+    model_jednostki: str = ''
+    model_opcji: str = ''
+    cena: float = 0.0
+
+
+@dataclass(slots=True)
+class ZestawPodgrzewacza(OfferSection):
+    PRICE_FIELDS: ClassVar[tuple] = ('cena',)
+
+    grzatki_elektryczne: str = ''
+    model_opcji: str = ''
+    cena: float = 0.0
+
+
+@dataclass(slots=True)
+class Szczegoly(OfferSection):
+    data_oferty: str = ''
+    numer_oferty: str = ''
+
+
+# Sekcje oferty w kolejności tabelek; grzanie i zestaw podgrzewacza są opcjonalne
+SECTION_TYPES = {
+    'dane_klienta': DaneKlienta,
+    'pojazd': Pojazd,
+    'agregat': Agregat,
+    'grzanie': Grzanie,
+    'zestaw_podgrzewacza': ZestawPodgrzewacza,
+    'szczegoly': Szczegoly
+}
+OPTIONAL_SECTIONS = ('grzanie', 'zestaw_podgrzewacza')
+
+
+@dataclass(slots=True)
+class Offer:
+    """Oferta edytowana na stronie - źródło prawdy dla tabelek i PDF.
+
+    Cena całkowita aktualizowana jest przyrostowo przy każdej zmianie pola cenowego,
+    a wiersze tabelek budowane są ponownie tylko dla zmienionych sekcji.
+    """
+    sections: dict
+    attachments_cost: float = 0.0
+    # Pozostałe pola oferty (np. dodatkowe_wyposazenie) przekazywane bez zmian
+    extra: dict = field(default_factory=dict)
+    dirty: set = field(default_factory=set)
+    version: int = 0
+    _subtotal: float = 0.0
+    _rows: dict = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_dict(cls, offer_data, attachments_cost=0.0):
+        """Model oferty ze słownika zwracanego przez OfferGenerator"""
+        sections = {}
+        for name, section_type in SECTION_TYPES.items():
+            if name == 'szczegoly':
+                sections[name] = Szczegoly.from_dict(offer_data)
+            elif name not in OPTIONAL_SECTIONS or offer_data.get(name):
+                sections[name] = section_type.from_dict(offer_data.get(name))
+        known = set(SECTION_TYPES) | set(Szczegoly.field_names()) | {'cena_calkowita_netto'}
+        extra = {k: v for k, v in offer_data.items() if k not in known}
+        offer = cls(sections=sections, attachments_cost=float(attachments_cost or 0), extra=extra)
+        offer._subtotal = sum(section.subtotal() for section in sections.values())
+        offer.dirty = set(sections)
+        return offer
+
+    @property
+    def total(self) -> float:
+        """Cena całkowita netto wraz z dodatkowym wyposażeniem"""
+        return self._subtotal + self.attachments_cost
+
+    def has(self, section) -> bool:
+        return section in self.sections
+
+    def set(self, section, name, value) -> bool:
+        """Zmienia jedno pole; zwraca True, gdy wartość się zmieniła"""
+        target = self.sections[section]
+        old = getattr(target, name)
+        self._subtotal += target.set(name, value)
+        if getattr(target, name) == old:
+            return False
+        self.dirty.add(section)
+        self.version += 1
+        return True
+
+    def set_attachments_cost(self, cost):
+        cost = float(cost or 0)
+        if cost != self.attachments_cost:
+            self.attachments_cost = cost
+            self.version += 1
+
+    def rows(self, section) -> list:
+        """Wiersze Pole/Wartość dla tabelki; budowane ponownie tylko po zmianie sekcji"""
+        if section in self.dirty or section not in self._rows:
+            target = self.sections[section]
+            self._rows[section] = [
+                {'Pole': target.key(name), 'Wartość': target.display(name)}
+                for name in target.field_names()
+            ]
+            self.dirty.discard(section)
+        return self._rows[section]
+
+    def apply_rows(self, section, rows) -> tuple:
+        """Przenosi do modelu wartości zmienione w tabelce; zwraca (zmienione pola, odrzucone pola).
+
+        Parsowane są tylko komórki, których tekst różni się od bieżącej wartości.
+        """
+        target = self.sections[section]
+        names = {target.key(name): name for name in target.field_names()}
+        current = {row['Pole']: row['Wartość'] for row in self.rows(section)}
+        changed, rejected = [], []
+        for row in rows:
+            key = row.get('Pole')
+            value = row.get('Wartość')
+            if key not in names or value == current.get(key):
+                continue
+            try:
+                if self.set(section, names[key], value):
+                    changed.append(key)
+                    continue
+            except ValueError:
+                logger.warning(f"Niepoprawna wartość pola {section}.{key}: {value!r}")
+                rejected.append(key)
+            # Tabelka pokaże ponownie wartość z modelu
+            self.dirty.add(section)
+        return changed, rejected
+
+    def to_dict(self) -> dict:
+        """Słownik oferty w formacie OfferGenerator (dla PDF i klucza cache)"""
+        offer_data = dict(self.extra)
+        for name, section in self.sections.items():
+            if name == 'szczegoly':
+                offer_data.update(section.to_dict())
+            else:
+                offer_data[name] = section.to_dict()
+        offer_data['cena_calkowita_netto'] = self.total
+        return offer_data
@@ -0,0 +1,127 @@
+import copy
+
+# Struktura danych oferty zwracana przez LLM (zgodna z formatem w ANALYSIS_PROMPT)
+OFFER_STRUCTURE = {
+    "dane_klienta": {
+        "nazwa": "",
+        "adres": "",
+        "nip": "",
+        "osoba_odpowiedzialna": "",
+        "telefon": "",
+        "email": ""
+    },
+    "data_oferty": "",
+    "numer_oferty": "",
+    "pojazd": {
+        "marka": "",
+        "model": "",
+        "kubatura": None,
+        "zabudowa_cena": None,
+        "sklejki_cena": None,
+        "nadkola_cena": None
+    },
+    "wymagania": {
+        "temperatura": 0,
+        "zasilanie": "tylko_drogowy"
+    },
+    "agregat": {
+        "model": "",
+        "daikin_product_line": "",
+        "refrigerant": "",
+        "instalacja_elektryczna": "",
+        "tylko_drogowy": "",
+        "drogowy_siec_230V": "",
+        "drogowy_siec_400V": "",
+        "cena_cennikowa": None,
+        "cooling_capacity_0C": None,
+        "cooling_capacity_-20C": None,
+        "recommended_van_size_0C": None,
+        "recommended_van_size_-20C": None,
+        "uwagi": "",
+        "temperature_range": ""
+    },
+    "grzanie": {
+        "model_jednostki": "",
+        "model_opcji": "",
+        "cena": None
+    },
+    "zestaw_podgrzewacza": {
+        "grzatki_elektryczne": "",
+        "model_opcji": "",
+        "cena": None
+    }
+}
+
+# Pola oferty ustalane przez LLM - agregat dobierany jest lokalnie, LLM podaje tylko model
+LLM_OUTPUT_STRUCTURE = {**OFFER_STRUCTURE, "agregat": {"model": ""}}
+
+
+def _value_schema(value) -> dict:
+    """Schemat JSON pola na podstawie wartości domyślnej w strukturze oferty"""
+    if isinstance(value, dict):
+        return {
+            "type": "object",
+            "properties": {key: _value_schema(item) for key, item in value.items()},
+            "required": list(value),
+            "additionalProperties": False
+        }
+    if isinstance(value, bool):
+        return {"type": "boolean"}
+    if isinstance(value, int):
+        return {"type": "integer"}
+    if value is None or isinstance(value, float):
+        return {"type": ["number", "null"]}
+    return {"type": ["string", "null"]}
+
+
+def offer_json_schema(structure=LLM_OUTPUT_STRUCTURE) -> dict:
+    """Schemat JSON odpowiedzi LLM wygenerowany ze struktury oferty"""
+    return _value_schema(structure)
+
+
+# Parametr response_format dla trybu structured output (schemat ścisły)
+OFFER_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "oferta",
+        "strict": True,
+        "schema": offer_json_schema()
+    }
+}
+
+
+def empty_offer(structure=OFFER_STRUCTURE) -> dict:
+    """Zwraca pustą strukturę oferty"""
+    return copy.deepcopy(structure)
+
+
+def vehicle_row_to_offer(v) -> dict:
+    """Zamienia wiersz tabeli samochody na sekcję "pojazd" oferty"""
+    return {
+        "marka": v[0],
+        "model": v[1],
+        "kubatura": v[2],
+        "zabudowa_cena": v[3],
+        "sklejki_cena": v[4],
+        "nadkola_cena": v[5]
+    }
+
+
+def aggregate_row_to_offer(a) -> dict:
+    """Zamienia wiersz tabeli "Agregaty Daikin" na sekcję "agregat" oferty"""
+    return {
+        "model": ' '.join((a[1] or '').split()),
+        "daikin_product_line": ' '.join((a[0] or '').split()),
+        "refrigerant": a[2] or '',
+        "instalacja_elektryczna": a[3] or '',
+        "tylko_drogowy": a[4] or '',
+        "drogowy_siec_230V": a[5] or '',
+        "drogowy_siec_400V": a[6] or '',
+        "cena_cennikowa": a[7],
+        "cooling_capacity_0C": a[8],
+        "cooling_capacity_-20C": a[9],
+        "recommended_van_size_0C": a[10],
+        "recommended_van_size_-20C": a[11],
+        "uwagi": a[12] or '',
+        "temperature_range": a[13] or ''
+    }
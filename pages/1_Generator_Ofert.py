@@ -1,129 +1,70 @@
 import streamlit as st
-from database import OfferDatabase
-from offer_generator import OfferGenerator
 import os
 import json
-from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode
-import pandas as pd
+from st_aggrid import AgGrid, GridUpdateMode, JsCode
 import logging
-import sys
 import traceback
 from datetime import datetime
 from offer_generator import calculate_attachments_cost
+from offer_generator import pdf_cache_key
+from offer_model import Offer, format_amount
+from pdf_store import get_pdf_store
+from offer_jobs import DONE, generate_offer_job, generate_pdf_job, get_job_manager, job_key
+from rerun_profiler import profile_rerun, profile_section, profiled
+from logging_setup import setup_logging
 
-# Konfiguracja logowania
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Konfiguracja logowania (kolejka + wątek zapisu; ponowne wywołanie nic nie zmienia)
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
+# Nazwa strony w profilu przeładowań
+PAGE_NAME = "Generator ofert"
+
 def calculate_total_cost():
-    """Oblicza cenę całkowitą na podstawie aktualnych danych w tabelkach"""
-    try:
-        total = 0.0
-        
-        # Koszty pojazdu
-        if 'data_dane_pojazdu_grid' in st.session_state:
-            pojazd_df = st.session_state['data_dane_pojazdu_grid']
-            for _, row in pojazd_df.iterrows():
-                if 'cena' in row['Pole'].lower():
-                    try:
-                        value = row['Wartość'].replace('zł', '').strip()
-                        if value:
-                            total += float(value)
-                    except (ValueError, TypeError):
-                        logger.warning(f"Nie można przekonwertować wartości: {row['Wartość']}")
-        
-        # Koszt agregatu
-        if 'data_agregat_grid' in st.session_state:
-            agregat_df = st.session_state['data_agregat_grid']
-            cena_row = agregat_df[agregat_df['Pole'] == 'cena_cennikowa']
-            if not cena_row.empty:
-                try:
-                    value = cena_row.iloc[0]['Wartość'].replace('zł', '').strip()
-                    if value:
-                        total += float(value)
-                except (ValueError, TypeError):
-                    logger.warning(f"Nie można przekonwertować ceny agregatu: {cena_row.iloc[0]['Wartość']}")
-        
-        # Koszt grzania
-        if 'data_grzanie_grid' in st.session_state:
-            grzanie_df = st.session_state['data_grzanie_grid']
-            cena_row = grzanie_df[grzanie_df['Pole'] == 'cena']
-            if not cena_row.empty:
-                try:
-                    value = cena_row.iloc[0]['Wartość'].replace('zł', '').strip()
-                    if value:
-                        total += float(value)
-                except (ValueError, TypeError):
-                    logger.warning(f"Nie można przekonwertować ceny grzania: {cena_row.iloc[0]['Wartość']}")
-        
-        # Koszt zestawu podgrzewacza
-        if 'data_zestaw_podgrzewacza_grid' in st.session_state:
-            zestaw_df = st.session_state['data_zestaw_podgrzewacza_grid']
-            cena_row = zestaw_df[zestaw_df['Pole'] == 'cena']
-            if not cena_row.empty:
-                try:
-                    value = cena_row.iloc[0]['Wartość'].replace('zł', '').strip()
-                    if value:
-                        total += float(value)
-                except (ValueError, TypeError):
-                    logger.warning(f"Nie można przekonwertować ceny zestawu: {cena_row.iloc[0]['Wartość']}")
-        
-        logger.info(f"Obliczona cena całkowita: {total}")
-        return total
-        
-    except Exception as e:
-        logger.error(f"Błąd podczas obliczania ceny całkowitej: {str(e)}")
-        return 0.0
+    """Cena całkowita z modelu oferty - utrzymywana przyrostowo przy edycji pól cenowych"""
+    offer = st.session_state.get('offer_model')
+    return offer.total if offer is not None else 0.0
 
-def create_editable_grid(data, key, title):
-    """Tworzy edytowalną tabelkę AgGrid"""
+def create_editable_grid(offer, section, key, title):
+    """Tworzy edytowalną tabelkę AgGrid - widok sekcji modelu oferty"""
     try:
-        gb = GridOptionsBuilder.from_dataframe(data)
-        gb.configure_default_column(
-            editable=True,
-            resizable=True,
-            sorteable=True,
-            filterable=True
-        )
-        gb.configure_grid_options(domLayout='normal')
-        gb.configure_selection('single')
-        grid_options = gb.build()
+        grid_options = {
+            'columnDefs': [
+                {'field': 'Pole', 'editable': False},
+                {'field': 'Wartość', 'editable': True}
+            ],
+            'defaultColDef': {'resizable': True, 'sortable': True, 'filter': True},
+            'domLayout': 'normal',
+            'rowSelection': 'single',
+            'autoSizeStrategy': {'type': 'fitGridWidth'},
+            'getRowId': JsCode("function(params) { return params.data.Pole; }"),
+            # Wiersze z modelu - budowane ponownie tylko po zmianie sekcji
+            'rowData': offer.rows(section)
+        }
         
         st.write(f"### {title}")
         grid_response = AgGrid(
-            data,
+            None,
             gridOptions=grid_options,
             update_mode=GridUpdateMode.VALUE_CHANGED,
-            fit_columns_on_grid_load=True,
             allow_unsafe_jscode=True,
-            key=key
+            key=f"{key}_{st.session_state.get('offer_revision', 0)}"
         )
         
-        # Aktualizacja danych w sesji
-        st.session_state[f'data_{key}'] = grid_response['data']
-        
-        # Aktualizacja ceny całkowitej po każdej edycji
-        if any('cena' in str(col).lower() for col in data['Pole']):
-            total_cost = calculate_total_cost()
-            if 'data_szczegoly_grid' in st.session_state:
-                szczegoly_df = st.session_state['data_szczegoly_grid']
-                szczegoly_df.loc[szczegoly_df['Pole'] == 'Cena calkowita netto', 'Wartość'] = f"{total_cost:.2f} zł"
-                st.session_state['data_szczegoly_grid'] = szczegoly_df
-        
-        return grid_response['data']
+        # Do modelu trafiają tylko komórki zmienione od ostatniego przebiegu
+        nodes = grid_response.grid_response.get('nodes')
+        if nodes and nodes != st.session_state.get(f'seen_{key}'):
+            st.session_state[f'seen_{key}'] = nodes
+            changed, rejected = offer.apply_rows(section, [node.get('data', {}) for node in nodes])
+            if changed:
+                logger.info(f"Zmienione pola ({section}): {', '.join(changed)}, cena całkowita: {offer.total:.2f}")
+            if rejected:
+                st.warning(f"Niepoprawne wartości pól: {', '.join(rejected)}")
         
     except Exception as e:
         logger.error(f"Błąd podczas tworzenia tabelki {title}: {str(e)}")
         st.error(f"Wystąpił błąd podczas tworzenia tabelki: {str(e)}")
-        return pd.DataFrame()
 
 def clear_session_data():
     """Czyści dane sesji związane z tabelkami"""
@@ -133,95 +74,13 @@ def clear_session_data():
             del st.session_state[key]
 
 def save_to_session(offer_data):
-    """Zapisuje dane oferty do sesji"""
+    """Zapisuje dane oferty do sesji jako model oferty"""
     try:
-        # Dane firmy
-        dane_klienta_data = [
-            {'Pole': 'nazwa', 'Wartość': str(offer_data['dane_klienta'].get('nazwa', ''))},
-            {'Pole': 'adres', 'Wartość': str(offer_data['dane_klienta'].get('adres', ''))},
-            {'Pole': 'nip', 'Wartość': str(offer_data['dane_klienta'].get('nip', ''))},
-            {'Pole': 'osoba_odpowiedzialna', 'Wartość': str(offer_data['dane_klienta'].get('osoba_odpowiedzialna', ''))},
-            {'Pole': 'telefon', 'Wartość': str(offer_data['dane_klienta'].get('telefon', ''))},
-            {'Pole': 'email', 'Wartość': str(offer_data['dane_klienta'].get('email', ''))}
-        ]
-        st.session_state['data_dane_klienta_grid'] = pd.DataFrame(dane_klienta_data)
-        
-        # Dane pojazdu
-        pojazd = offer_data.get('pojazd', {})
-        pojazd_data = [
-            {'Pole': 'marka', 'Wartość': str(pojazd.get('marka', ''))},
-            {'Pole': 'model', 'Wartość': str(pojazd.get('model', ''))},
-            {'Pole': 'kubatura', 'Wartość': str(pojazd.get('kubatura', ''))},
-            {'Pole': 'zabudowa_cena', 'Wartość': f"{str(pojazd.get('zabudowa_cena', '0'))} zł"},
-            {'Pole': 'sklejki_cena', 'Wartość': f"{str(pojazd.get('sklejki_cena', '0'))} zł"},
-            {'Pole': 'nadkola_cena', 'Wartość': f"{str(pojazd.get('nadkola_cena', '0'))} zł"}
-        ]
-        st.session_state['data_dane_pojazdu_grid'] = pd.DataFrame(pojazd_data)
-        
-        # Dane agregatu
-        agregat = offer_data.get('agregat', {})
-        agregat_data = [
-            {'Pole': 'model', 'Wartość': str(agregat.get('model', ''))},
-            {'Pole': 'daikin_product_line', 'Wartość': str(agregat.get('daikin_product_line', ''))},
-            {'Pole': 'refrigerant', 'Wartość': str(agregat.get('refrigerant', ''))},
-            {'Pole': 'instalacja_elektryczna', 'Wartość': str(agregat.get('instalacja_elektryczna', ''))},
-            {'Pole': 'tylko_drogowy', 'Wartość': str(agregat.get('tylko_drogowy', ''))},
-            {'Pole': 'drogowy_siec_230V', 'Wartość': str(agregat.get('drogowy_siec_230V', ''))},
-            {'Pole': 'drogowy_siec_400V', 'Wartość': str(agregat.get('drogowy_siec_400V', ''))},
-            {'Pole': 'cena_cennikowa', 'Wartość': f"{str(agregat.get('cena_cennikowa', '0'))} zł"},
-            {'Pole': 'cooling_capacity_0C', 'Wartość': str(agregat.get('cooling_capacity_0C', ''))},
-            {'Pole': 'cooling_capacity_-20C', 'Wartość': str(agregat.get('cooling_capacity_-20C', ''))},
-            {'Pole': 'recommended_van_size_0C', 'Wartość': str(agregat.get('recommended_van_size_0C', ''))},
-            {'Pole': 'recommended_van_size_-20C', 'Wartość': str(agregat.get('recommended_van_size_-20C', ''))},
-            {'Pole': 'uwagi', 'Wartość': str(agregat.get('uwagi', ''))},
-            {'Pole': 'temperature_range', 'Wartość': str(agregat.get('temperature_range', ''))}
-        ]
-        st.session_state['data_agregat_grid'] = pd.DataFrame(agregat_data)
-        
-        # Dane grzania
-        if 'grzanie' in offer_data and offer_data['grzanie']:
-            grzanie = offer_data['grzanie']
-            grzanie_data = [
-                {'Pole': 'model_jednostki', 'Wartość': str(grzanie.get('model_jednostki', ''))},
-                {'Pole': 'model_opcji', 'Wartość': str(grzanie.get('model_opcji', ''))},
-                {'Pole': 'cena', 'Wartość': f"{str(grzanie.get('cena', '0'))} zł"}
-            ]
-            st.session_state['data_grzanie_grid'] = pd.DataFrame(grzanie_data)
-        
-        # Dane zestawu podgrzewacza
-        if 'zestaw_podgrzewacza' in offer_data and offer_data['zestaw_podgrzewacza']:
-            zestaw = offer_data['zestaw_podgrzewacza']
-            zestaw_data = [
-                {'Pole': 'Grzatki elektryczne', 'Wartość': str(zestaw.get('grzatki_elektryczne', ''))},
-                {'Pole': 'Model opcji', 'Wartość': str(zestaw.get('model_opcji', ''))},
-                {'Pole': 'cena', 'Wartość': f"{str(zestaw.get('cena', '0'))} zł"}
-            ]
-            st.session_state['data_zestaw_podgrzewacza_grid'] = pd.DataFrame(zestaw_data)
-        
-        # Szczegóły oferty
-        szczegoly_data = [
-            {'Pole': 'Data oferty', 'Wartość': str(offer_data.get('data_oferty', ''))},
-            {'Pole': 'Numer oferty', 'Wartość': str(zestaw.get('numer_oferty', ''))},
-            {'Pole': 'Cena calkowita netto', 'Wartość': f"{str(zestaw.get('cena_calkowita_netto', '0'))} zł"}
-        ]
-        st.session_state['data_szczegoly_grid'] = pd.DataFrame(szczegoly_data)
-        
-        # Dodaj informacje o dodatkowym wyposażeniu
-        if 'selected_attachments' in st.session_state:
-            attachments_data = [
-                {'Pole': key, 'Wartość': 'Tak' if value else 'Nie'}
-                for key, value in st.session_state['selected_attachments'].items()
-            ]
-            st.session_state['data_attachments_grid'] = pd.DataFrame(attachments_data)
-        
-        # Zaktualizuj cenę całkowitą
-        if 'data_szczegoly_grid' in st.session_state:
-            szczegoly_df = st.session_state['data_szczegoly_grid']
-            total_cost = float(offer_data.get('cena_calkowita_netto', 0))
-            if 'attachments_cost' in st.session_state:
-                total_cost += st.session_state['attachments_cost']
-            szczegoly_df.loc[szczegoly_df['Pole'] == 'Cena calkowita netto', 'Wartość'] = f"{total_cost:.2f} zł"
-            st.session_state['data_szczegoly_grid'] = szczegoly_df
+        st.session_state['offer_model'] = Offer.from_dict(
+            offer_data, st.session_state.get('attachments_cost', 0)
+        )
+        # Nowa oferta - tabelki dostają nowe klucze, więc stan poprzednich edycji nie jest przenoszony
+        st.session_state['offer_revision'] = st.session_state.get('offer_revision', 0) + 1
             
     except Exception as e:
         logger.error(f"Błąd podczas zapisywania danych do sesji: {str(e)}")
@@ -234,50 +93,11 @@ def load_from_session():
     return None
 
 def update_offer_from_grids():
-    """Aktualizuje dane oferty na podstawie edytowanych tabelek"""
+    """Zwraca dane oferty z modelu aktualizowanego przez tabelki"""
     try:
-        if all(key in st.session_state for key in ['data_dane_klienta_grid', 'data_dane_pojazdu_grid', 'data_agregat_grid']):
-            # Konwersja danych z tabelek z powrotem do struktury oferty
-            updated_offer = {
-                'dane_klienta': dict(zip(
-                    st.session_state['data_dane_klienta_grid']['Pole'],
-                    st.session_state['data_dane_klienta_grid']['Wartość']
-                )),
-                'pojazd': dict(zip(
-                    st.session_state['data_dane_pojazdu_grid']['Pole'],
-                    st.session_state['data_dane_pojazdu_grid']['Wartość'].str.replace(' zł', '')
-                )),
-                'agregat': dict(zip(
-                    st.session_state['data_agregat_grid']['Pole'],
-                    st.session_state['data_agregat_grid']['Wartość'].str.replace(' zł', '')
-                ))
-            }
-            
-            # Dodaj opcjonalne sekcje jeśli istnieją
-            if 'data_grzanie_grid' in st.session_state:
-                updated_offer['grzanie'] = dict(zip(
-                    st.session_state['data_grzanie_grid']['Pole'],
-                    st.session_state['data_grzanie_grid']['Wartość'].str.replace(' zł', '')
-                ))
-            
-            if 'data_zestaw_podgrzewacza_grid' in st.session_state:
-                updated_offer['zestaw_podgrzewacza'] = dict(zip(
-                    st.session_state['data_zestaw_podgrzewacza_grid']['Pole'],
-                    st.session_state['data_zestaw_podgrzewacza_grid']['Wartość'].str.replace(' zł', '')
-                ))
-            
-            # Dodaj szczegóły oferty
-            szczegoly = dict(zip(
-                st.session_state['data_szczegoly_grid']['Pole'],
-                st.session_state['data_szczegoly_grid']['Wartość'].str.replace(' zł', '')
-            ))
-            updated_offer.update({
-                'data_oferty': szczegoly.get('data_oferty', ''),
-                'numer_oferty': szczegoly.get('numer_oferty', ''),
-                'cena_calkowita_netto': float(szczegoly.get('cena_calkowita_netto', '0'))
-            })
-            
-            return updated_offer
+        offer = st.session_state.get('offer_model')
+        if offer is not None:
+            return offer.to_dict()
             
     except Exception as e:
         logger.error(f"Błąd podczas aktualizacji oferty: {str(e)}")
@@ -294,30 +114,165 @@ def show_pdf_buttons():
                 # Pobierz aktualne dane z tabelek
                 updated_offer = update_offer_from_grids()
                 if updated_offer:
-                    # Generowanie nowego PDF
-                    generator = OfferGenerator(OfferDatabase())
-                    new_pdf_path = generator._generate_pdf(updated_offer, [])  # Puste missing_data
-                    
-                    if new_pdf_path:
-                        st.session_state['last_pdf_path'] = new_pdf_path
-                        st.session_state['current_offer'] = updated_offer
+                    # Generowanie nowego PDF w tle
+                    selected_attachments = st.session_state.get('selected_attachments')
+                    attachments_cost = st.session_state.get('attachments_cost', 0)
+                    images = st.session_state.get('offer_images')
+                    st.session_state['current_offer'] = updated_offer
+
+                    # Niezmieniona oferta - PDF od razu z cache, bez renderowania
+                    cache_key = pdf_cache_key(updated_offer, selected_attachments, attachments_cost, images)
+                    if get_pdf_store().get(cache_key) is not None:
+                        st.session_state['last_pdf_id'] = cache_key
                         st.success("PDF został wygenerowany!")
+                    else:
+                        job = get_job_manager().submit(
+                            'pdf',
+                            job_key('pdf', updated_offer, selected_attachments, attachments_cost, images),
+                            generate_pdf_job, updated_offer, selected_attachments, attachments_cost, images
+                        )
+                        st.session_state['pdf_job_id'] = job.id
+                        # Postęp zadania odpytuje fragment na najwyższym poziomie strony
+                        st.rerun()
                 else:
                     st.error("Nie można wygenerować PDF - brak wymaganych danych")
             except Exception as e:
                 logger.error(f"Błąd podczas generowania PDF: {str(e)}")
                 st.error("Nie udało się wygenerować PDF")
-    
+
     with col2:
-        if 'last_pdf_path' in st.session_state and os.path.exists(st.session_state['last_pdf_path']):
-            with open(st.session_state['last_pdf_path'], "rb") as pdf_file:
-                pdf_bytes = pdf_file.read()
+        if 'last_pdf_id' in st.session_state:
+            # PDF serwowany z pamięci - bez odczytu pliku przy każdym przeładowaniu
+            pdf_bytes = get_pdf_store().get(st.session_state['last_pdf_id'], record_stats=False)
+            if pdf_bytes is None:
+                st.info("PDF wygasł z pamięci - wygeneruj go ponownie")
+            else:
                 st.download_button(
                     label="Pobierz ofertę (PDF)",
                     data=pdf_bytes,
-                    file_name=f"oferta_autoadaptacje_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+                    file_name=f"oferta_autoadaptacje_{st.session_state['last_pdf_id'][:12]}.pdf",
                     mime="application/pdf"
                 )
+            stats = get_pdf_store().stats()
+            st.caption(f"Cache PDF: {stats['items']} plików, trafienia {stats['hit_rate']:.0%}")
+
+def on_offer_ready(result):
+    """Zapisuje w sesji ofertę wygenerowaną w tle"""
+    offer_data, missing_data = result
+    save_to_session(offer_data)
+    st.session_state['missing_data'] = missing_data
+    st.session_state['job_notice'] = ('success', "Pomyślnie wygenerowano ofertę!")
+
+def on_pdf_ready(pdf_id):
+    """Zapisuje w sesji identyfikator PDF wygenerowanego w tle"""
+    st.session_state['last_pdf_id'] = pdf_id
+    st.session_state['job_notice'] = ('success', "PDF został wygenerowany!")
+
+@st.fragment(run_every=0.5)
+def show_job_progress(state_key, on_done):
+    """Odpytuje zadanie w tle i pokazuje jego postęp; po zakończeniu odświeża stronę"""
+    manager = get_job_manager()
+    job = manager.get(st.session_state.get(state_key))
+    if job is None:
+        st.session_state.pop(state_key, None)
+        st.rerun()
+
+    if not job.finished:
+        st.progress(job.progress, text=job.message or "Oczekiwanie w kolejce...")
+        if job.partial:
+            st.caption(f"Odebrane sekcje: {', '.join(job.partial)}")
+            st.json(job.partial, expanded=False)
+        if st.button("Anuluj", key=f"cancel_{state_key}"):
+            manager.cancel(job.id)
+        return
+
+    del st.session_state[state_key]
+    if job.status == DONE:
+        on_done(job.result)
+    elif job.error:
+        st.session_state['job_notice'] = ('error', f"Wystąpił błąd: {job.error}")
+    else:
+        st.session_state['job_notice'] = ('warning', "Zadanie zostało anulowane")
+    st.rerun()
+
+def show_job_notice():
+    """Wyświetla komunikat o wyniku ostatniego zadania w tle"""
+    notice = st.session_state.pop('job_notice', None)
+    if notice:
+        level, message = notice
+        getattr(st, level)(message)
+
+# Tabelki w zakładkach oferty: (sekcja modelu, klucz tabelki, tytuł)
+OFFER_TABS = {
+    "Dane Klienta": [('dane_klienta', 'dane_klienta_grid', "Dane Klienta")],
+    "Pojazd": [('pojazd', 'dane_pojazdu_grid', "Dane pojazdu")],
+    "Agregat": [('agregat', 'agregat_grid', "Agregat")],
+    "Grzanie": [('grzanie', 'grzanie_grid', "Grzanie"),
+                ('zestaw_podgrzewacza', 'zestaw_podgrzewacza_grid', "Zestaw podgrzewacza")],
+    "Szczegóły": [('szczegoly', 'szczegoly_grid', "Szczegóły oferty")],
+    "PDF": []
+}
+
+# Zadania w tle: (klucz w sesji, obsługa wyniku)
+JOB_POLLERS = [('offer_job_id', on_offer_ready), ('pdf_job_id', on_pdf_ready)]
+
+def show_total(total, offer):
+    """Cena całkowita w jednym miejscu strony - nadpisywana przez każdy fragment, który ją zmienia"""
+    total.metric("Cena całkowita netto", format_amount(offer.total))
+
+@st.fragment
+@profiled("sidebar", PAGE_NAME)
+def show_attachments_form(total):
+    """Fragment: dodatkowe wyposażenie; zmiana opcji nie odświeża tabelek"""
+    total_attachments_cost = calculate_attachments_cost(prefix="main_", render_ui=True, container=st.container())
+    offer = st.session_state.get('offer_model')
+    if offer is not None:
+        offer.set_attachments_cost(total_attachments_cost)
+        show_total(total, offer)
+
+@st.fragment
+@profiled("zakładka", PAGE_NAME)
+def show_grid_tab(grids, total):
+    """Fragment: tabelki jednej zakładki; edycja komórki odświeża tylko tę zakładkę i sumę"""
+    offer = st.session_state['offer_model']
+    columns = st.columns(len(grids))
+    for column, (section, key, title) in zip(columns, grids):
+        with column:
+            if offer.has(section):
+                with profile_section(f"grid:{key}"):
+                    create_editable_grid(offer, section, key, title)
+    show_total(total, offer)
+
+@st.fragment
+@profiled("zakładka PDF", PAGE_NAME)
+def show_pdf_tab():
+    """Fragment: generowanie PDF i zdjęcia oferty"""
+    st.write("### Generowanie PDF")
+    
+    # Dodaj informację o brakujących danych
+    if 'missing_data' in st.session_state and st.session_state['missing_data']:
+        st.warning("Uwaga: Brakujące dane w ofercie:")
+        for field in st.session_state['missing_data']:
+            st.warning(f"- {field}")
+    
+    # Przyciski do obsługi PDF
+    with profile_section("pdf_buttons"):
+        show_pdf_buttons()
+    
+    # Zdjęcia
+    st.subheader("Zdjęcia")
+    if 'offer_images' not in st.session_state:
+        st.session_state['offer_images'] = [
+            'images/test1.jpeg',
+            'images/test2.jpeg',
+            'images/test3.jpeg',
+        ]
+    
+    with profile_section("galeria"):
+        cols = st.columns(2)
+        for idx, image_path in enumerate(st.session_state['offer_images']):
+            with cols[idx % 2]:
+                st.image(image_path, caption=f"Zdjęcie {idx + 1}")
 
 def show_filters(df):
     with st.container():
@@ -357,9 +312,12 @@ def main():
         
         st.image("images/logo.png", width=100)
         st.title("Generator ofert")
+        # Jedna cena całkowita w głównej części strony (fragment zakładki nie może pisać do sidebaru)
+        total = st.empty()
         
-        # Renderuj checkboxy w sidebarze i oblicz koszt dodatkowego wyposażenia
-        total_attachments_cost = calculate_attachments_cost(prefix="main_", render_ui=True)
+        # Formularz wyposażenia w sidebarze - zmiana opcji odświeża tylko ten fragment
+        with st.sidebar:
+            show_attachments_form(total)
         
         # Pole tekstowe do wprowadzania treści oferty
         offer_text = st.text_area(
@@ -372,109 +330,51 @@ def main():
         if st.button("Generuj ofertę"):
             logger.info("Rozpoczęto generowanie oferty")
             if offer_text:
-                with st.spinner("Generuję ofertę..."):
-                    try:
-                        db = OfferDatabase()
-                        generator = OfferGenerator(db)
-                        logger.debug("Inicjalizacja generatora zakończona")
-                        
-                        offer_data, missing_data = generator.create_offer(offer_text)
-                        
-                        if offer_data:
-                            save_to_session(offer_data)
-                            st.session_state['missing_data'] = missing_data
-                            st.success("Pomyślnie wygenerowano ofertę!")
-                    except Exception as e:
-                        logger.error(f"Błąd podczas generowania oferty: {str(e)}")
-                        st.error(f"Wystąpił błąd: {str(e)}")
+                # Generowanie w tle - kolejne interakcje nie przerywają ani nie powielają zadania
+                # Wyposażenie odczytywane tutaj - wątek zadania nie ma dostępu do session_state
+                selected_attachments = st.session_state.get('selected_attachments') or {}
+                attachments_cost = st.session_state.get('attachments_cost') or 0
+                job = get_job_manager().submit(
+                    'offer',
+                    job_key('offer', offer_text, selected_attachments, attachments_cost),
+                    generate_offer_job, offer_text, selected_attachments, attachments_cost
+                )
+                st.session_state['offer_job_id'] = job.id
             else:
                 st.warning("Proszę wprowadzić treść oferty")
 
+        # Miejsce na postęp zadań w tle i komunikat o ich wyniku
+        jobs = st.container()
+
         # Wyświetlanie tabelek (tylko jeśli są dane w sesji)
-        if any(key.startswith('data_') for key in st.session_state.keys()):
+        if 'offer_model' in st.session_state:
             st.subheader("Wygenerowana oferta")
-            tabs = st.tabs(["Dane Klienta", "Pojazd", "Agregat", "Grzanie", "Szczegóły", "PDF"])
-            
-            with tabs[0]:
-                if 'data_dane_klienta_grid' in st.session_state:
-                    create_editable_grid(
-                        st.session_state['data_dane_klienta_grid'],
-                        'dane_klienta_grid',
-                        "Dane Klienta"
-                    )
-            
-            with tabs[1]:
-                if 'data_dane_pojazdu_grid' in st.session_state:
-                    create_editable_grid(
-                        st.session_state['data_dane_pojazdu_grid'],
-                        'dane_pojazdu_grid',
-                        "Dane pojazdu"
-                    )
-            
-            with tabs[2]:
-                if 'data_agregat_grid' in st.session_state:
-                    create_editable_grid(
-                        st.session_state['data_agregat_grid'],
-                        'agregat_grid',
-                        "Agregat"
-                    )
-            
-            with tabs[3]:
-                col1, col2 = st.columns(2)
-                with col1:
-                    if 'data_grzanie_grid' in st.session_state:
-                        create_editable_grid(
-                            st.session_state['data_grzanie_grid'],
-                            'grzanie_grid',
-                            "Grzanie"
-                        )
-                
-                with col2:
-                    if 'data_zestaw_podgrzewacza_grid' in st.session_state:
-                        create_editable_grid(
-                            st.session_state['data_zestaw_podgrzewacza_grid'],
-                            'zestaw_podgrzewacza_grid',
-                            "Zestaw podgrzewacza"
-                        )
-            
-            with tabs[4]:
-                if 'data_szczegoly_grid' in st.session_state:
-                    create_editable_grid(
-                        st.session_state['data_szczegoly_grid'],
-                        'szczegoly_grid',
-                        "Szczegóły oferty"
-                    )
-            
-            with tabs[5]:
-                st.write("### Generowanie PDF")
-                
-                # Dodaj informację o brakujących danych
-                if 'missing_data' in st.session_state and st.session_state['missing_data']:
-                    st.warning("Uwaga: Brakujące dane w ofercie:")
-                    for field in st.session_state['missing_data']:
-                        st.warning(f"- {field}")
-                
-                # Przyciski do obsługi PDF
-                show_pdf_buttons()
-                
-                # Zdjęcia
-                st.subheader("Zdjęcia")
-                if 'offer_images' not in st.session_state:
-                    st.session_state['offer_images'] = [
-                        'images/test1.jpeg',
-                        'images/test2.jpeg',
-                        'images/test3.jpeg',
-                    ]
-                
-                cols = st.columns(2)
-                for idx, image_path in enumerate(st.session_state['offer_images']):
-                    with cols[idx % 2]:
-                        st.image(image_path, caption=f"Zdjęcie {idx + 1}")
+            # Renderowana jest tylko otwarta zakładka - pozostałe nie tworzą komponentów AgGrid
+            tab = st.radio(
+                "Sekcja oferty",
+                list(OFFER_TABS),
+                horizontal=True,
+                label_visibility="collapsed",
+                key="offer_tab"
+            )
+            if tab == "PDF":
+                show_pdf_tab()
+            else:
+                show_grid_tab(OFFER_TABS[tab], total)
 
+        # Odpytywanie zadań na najwyższym poziomie strony (nie wewnątrz innych fragmentów)
+        # i na końcu przebiegu - st.rerun() po zakończeniu zadania nie gubi stanu widżetów
+        # narysowanych niżej, np. wybranej zakładki
+        with jobs:
+            for state_key, on_done in JOB_POLLERS:
+                if state_key in st.session_state:
+                    show_job_progress(state_key, on_done)
+            show_job_notice()
 
     except Exception as e:
         logger.error(f"Krytyczny błąd aplikacji: {str(e)}")
         st.error("Wystąpił krytyczny błąd aplikacji")
 
 if __name__ == "__main__":
-    main()
+    with profile_rerun(PAGE_NAME):
+        main()
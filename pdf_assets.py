@@ -0,0 +1,114 @@
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+
+from fpdf import FPDF
+
+logger = logging.getLogger(__name__)
+
+# Rozdzielczość druku, do której zmniejszane są obrazy
+PRINT_DPI = 300
+JPEG_QUALITY = 88
+
+_cache = {}
+_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ImageAsset:
+    """Obraz przygotowany do osadzenia w PDF: nazwa w dokumencie i sparsowane dane FPDF"""
+    name: str
+    info: dict
+    size: int
+
+
+def _target_width_px(width_mm) -> int:
+    return max(1, round(width_mm / 25.4 * PRINT_DPI))
+
+
+def _parse(path, image_type) -> dict:
+    """Parsuje plik obrazu parserem FPDF (raz na proces dla danego zasobu)"""
+    parser = FPDF()
+    return parser._parsepng(path) if image_type == 'png' else parser._parsejpg(path)
+
+
+def _prepare(path, width_mm, background) -> tuple:
+    """Zmniejsza obraz do rozdzielczości druku; przezroczystość spłaszcza na kolor tła.
+
+    Zwraca (sparsowane dane, rozmiar w bajtach). Bez Pillow używany jest plik źródłowy.
+    """
+    image_type = 'png' if path.lower().endswith('.png') else 'jpg'
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("Brak biblioteki Pillow - obrazy osadzane bez przetwarzania")
+        return _parse(path, image_type), os.path.getsize(path)
+
+    with Image.open(path) as image:
+        target = _target_width_px(width_mm)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        if image.width <= target and not has_alpha:
+            return _parse(path, image_type), os.path.getsize(path)
+
+        image.load()
+        if has_alpha:
+            # Parser PNG w FPDF rozdziela kanał alfa w czystym Pythonie - spłaszczamy go wcześniej
+            flat = Image.new('RGB', image.size, background)
+            flat.paste(image, mask=image.convert('RGBA').getchannel('A'))
+            image = flat
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        if image.width > target:
+            height = max(1, round(image.height * target / image.width))
+            image = image.resize((target, height), Image.LANCZOS)
+
+        suffix = '.png' if image_type == 'png' else '.jpg'
+        fd, tmp_path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        try:
+            if image_type == 'png':
+                image.save(tmp_path, 'PNG', optimize=True)
+            else:
+                image.save(tmp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+            return _parse(tmp_path, image_type), os.path.getsize(tmp_path)
+        finally:
+            os.remove(tmp_path)
+
+
+def get_image_asset(path, width_mm, background=(255, 255, 255)) -> ImageAsset:
+    """Przygotowany obraz z pamięci podręcznej procesu (klucz: ścieżka, mtime, szerokość, tło)"""
+    mtime = os.stat(path).st_mtime_ns
+    key = (os.path.abspath(path), mtime, width_mm, tuple(background))
+    asset = _cache.get(key)
+    if asset is not None:
+        return asset
+
+    with _lock:
+        asset = _cache.get(key)
+        if asset is None:
+            # Starsze wersje tego samego pliku nie są już potrzebne
+            for stale in [k for k in _cache if k[0] == key[0] and k[1] != mtime]:
+                del _cache[stale]
+            info, size = _prepare(path, width_mm, background)
+            asset = ImageAsset(name=f"{path}@{width_mm}mm", info=info, size=size)
+            _cache[key] = asset
+            logger.info(f"Przygotowano obraz {path}: {info['w']}x{info['h']} px, {size} B")
+    return asset
+
+
+def place_image(pdf: FPDF, path, x, y, w, h=0, background=(255, 255, 255)):
+    """Osadza obraz w dokumencie, korzystając z danych przygotowanych raz na proces"""
+    asset = get_image_asset(path, w, background)
+    if asset.name not in pdf.images:
+        # FPDF usuwa dane obrazu po zapisie dokumentu, więc każdy dokument dostaje płytką kopię
+        info = dict(asset.info)
+        info['i'] = len(pdf.images) + 1
+        pdf.images[asset.name] = info
+    pdf.image(asset.name, x, y, w, h)
+
+
+def clear_asset_cache():
+    with _lock:
+        _cache.clear()
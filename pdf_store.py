@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# Limit pamięci na przechowywane pliki PDF
+PDF_STORE_MAX_BYTES = 64 * 1024 * 1024
+PDF_STORE_MAX_ITEMS = 256
+
+# Retencja kopii PDF zapisanych na dysku
+TEMP_DIR = 'temp'
+TEMP_MAX_AGE = 24 * 3600
+TEMP_MAX_FILES = 200
+
+
+def pdf_id(data: bytes) -> str:
+    """Identyfikator PDF wyznaczony z jego zawartości"""
+    return hashlib.sha256(data).hexdigest()[:20]
+
+
+def safe_name(name: str) -> str:
+    """Nazwa pliku PDF z identyfikatora zlecenia - tylko znaki bezpieczne w ścieżce"""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+class PdfStore:
+    """Ograniczony magazyn LRU gotowych plików PDF w pamięci"""
+
+    def __init__(self, max_bytes=PDF_STORE_MAX_BYTES, max_items=PDF_STORE_MAX_ITEMS):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def put(self, data: bytes, doc_id: str = None) -> str:
+        """Zapisuje PDF i zwraca jego identyfikator"""
+        doc_id = doc_id or pdf_id(data)
+        with self._lock:
+            if doc_id in self._items:
+                self._items.move_to_end(doc_id)
+                return doc_id
+            self._items[doc_id] = data
+            self._size += len(data)
+            while self._items and (self._size > self.max_bytes or len(self._items) > self.max_items):
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+        return doc_id
+
+    def get(self, doc_id, record_stats=True):
+        """Zwraca zawartość PDF albo None, gdy została już usunięta z pamięci.
+
+        record_stats=False dla odczytów, które nie są zapytaniami do cache (np. pobranie pliku).
+        """
+        with self._lock:
+            data = self._items.get(doc_id)
+            if data is None:
+                if record_stats:
+                    self.misses += 1
+                return None
+            self._items.move_to_end(doc_id)
+            if record_stats:
+                self.hits += 1
+            return data
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._items
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'items': len(self._items),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+@st.cache_resource
+def get_pdf_store() -> PdfStore:
+    """Jeden magazyn PDF na proces (wspólny dla sesji Streamlit); przy starcie czyści stare kopie z dysku"""
+    cleanup_temp_dir()
+    return PdfStore()
+
+
+def cleanup_temp_dir(directory=TEMP_DIR, max_age=TEMP_MAX_AGE, max_files=TEMP_MAX_FILES) -> int:
+    """Usuwa z katalogu kopie PDF starsze niż max_age oraz najstarsze ponad max_files"""
+    if not os.path.isdir(directory):
+        return 0
+
+    files = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.lower().endswith('.pdf'):
+            files.append((entry.stat().st_mtime, entry.path))
+    files.sort(reverse=True)
+
+    cutoff = time.time() - max_age
+    removed = 0
+    for position, (mtime, path) in enumerate(files):
+        if mtime < cutoff or position >= max_files:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Nie udało się usunąć {path}: {str(e)}")
+    if removed:
+        logger.info(f"Usunięto {removed} starych plików PDF z {directory}")
+    return removed
@@ -0,0 +1,165 @@
+"""Wycena ofert niezależna od Streamlit.
+
+Cena całkowita netto to suma cen pojazdu (zabudowa, sklejki, nadkola), agregatu, grzania,
+zestawu podgrzewacza i dodatkowego wyposażenia. Ceny wyposażenia pochodzą z tabeli
+"Ceny wyposażenia" (domyślne wartości w ATTACHMENTS). Ta sama definicja składników
+służy do wyceny jednej oferty (strona, PDF) i do wsadowej wyceny N wariantów
+przekazanych jako kolumny - jednym przebiegiem numpy.
+"""
+import logging
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+import numpy as np
+
+from offer_model import parse_amount
+
+logger = logging.getLogger(__name__)
+
+PRICES_TABLE = 'Ceny wyposażenia'
+
+# Składniki ceny: nazwa pozycji -> (sekcja oferty, pole ceny)
+PRICE_COMPONENTS = {
+    'zabudowa': ('pojazd', 'zabudowa_cena'),
+    'sklejki': ('pojazd', 'sklejki_cena'),
+    'nadkola': ('pojazd', 'nadkola_cena'),
+    'agregat': ('agregat', 'cena_cennikowa'),
+    'grzanie': ('grzanie', 'cena'),
+    'zestaw_podgrzewacza': ('zestaw_podgrzewacza', 'cena')
+}
+ATTACHMENTS_ITEM = 'wyposazenie'
+LINE_ITEMS = tuple(PRICE_COMPONENTS) + (ATTACHMENTS_ITEM,)
+
+# Dodatkowe wyposażenie: (kod, nazwa, sekcja, cena domyślna).
+# Pozycje grupujące (np. "Podłoga") i "Brak" mają cenę 0.
+ATTACHMENTS = (
+    ('izoterma_0st_c', 'Izoterma 0st.C', 'Izolacja', 100.0),
+    ('chlodnia_-20st_c', 'Chłodnia -20st.C', 'Izolacja', 100.0),
+    ('atest_pzh', 'Atest PZH', 'Izolacja', 100.0),
+    ('material_izolacyjny', 'Materiał izolacyjny', 'Materiały', 0.0),
+    ('pianka_40mm', 'Pianka poliuretanowa 40mm', 'Materiały', 100.0),
+    ('pianka_80mm', 'Pianka poliuretanowa 80mm', 'Materiały', 100.0),
+    ('laminat_bialy', 'Ściany, sufity: laminat gładki biały', 'Wykończenie', 100.0),
+    ('podloga', 'Podłoga', 'Podłoga', 0.0),
+    ('wylewka_anty_slizgowa', 'Wylewka antypoślizgowa', 'Podłoga', 100.0),
+    ('blacha_ryflowana', 'Blacha aluminiowa ryflowana', 'Podłoga', 100.0),
+    ('listwa_przypodlogowa', 'Listwa przypodłogowa na ścianach', 'Listwy', 0.0),
+    ('aluminiowa_biala', 'Aluminiowa biała', 'Listwy', 100.0),
+    ('aluminiowa_srebrna', 'Aluminiowa srebrna', 'Listwy', 100.0),
+    ('stal_nierdzewna', 'Stal nierdzewna', 'Listwy', 100.0),
+    ('blacha_aluminiowa_ryflowana', 'Blacha aluminiowa ryflowana', 'Listwy', 100.0),
+    ('brak', 'Brak', 'Listwy', 0.0),
+    ('oswietlenie_led_standard', 'Oświetlenie LED standard (01702)', 'Oświetlenie', 100.0),
+    ('oswietlenie_led_wzmocnione', 'Oświetlenie LED wzmocnione (01660)', 'Oświetlenie', 100.0),
+    ('drzwi_boczne', 'Drzwi boczne', 'Drzwi', 0.0),
+    ('drzwi_boczne_wewnetrzne', 'Wewnętrzne', 'Drzwi', 100.0),
+    ('drzwi_boczne_normalnie', 'Normalnie otwierane', 'Drzwi', 100.0),
+    ('drzwi_boczne_brak', 'Brak', 'Drzwi', 0.0),
+    ('drzwi_tylne_grube', 'Drzwi tylne grube', 'Drzwi', 100.0),
+    ('futryna_drzwi_tylnych', 'Futryna drzwi tylnych', 'Drzwi', 100.0),
+    ('nadkola', 'Nadkola', 'Nadkola', 0.0),
+    ('nadkola_odlew_laminat', 'Odlew z laminatu', 'Nadkola', 100.0),
+    ('nadkola_wzmocnienie', 'Kwadratowe wzmocnienie kątownikami', 'Nadkola', 100.0),
+    ('nadkola_blacha_ryflowana', 'Blacha aluminiowa ryflowana', 'Nadkola', 100.0),
+    ('listwa_airline', 'Listwa airline', 'Inne', 100.0),
+    ('drazek_rozporowy', 'Drążek rozporowy', 'Inne', 100.0),
+    ('przygotowanie_agregatu', 'Przygotowanie do montażu agregatu chłodniczego', 'Inne', 100.0)
+)
+
+
+@dataclass(frozen=True)
+class PriceList:
+    """Cennik dodatkowego wyposażenia: kody w stałej kolejności i wektor cen"""
+    codes: tuple
+    prices: np.ndarray = field(repr=False)
+    index: MappingProxyType = field(repr=False)
+
+    @classmethod
+    def from_rows(cls, rows=()):
+        """Cennik z wierszy (kod, nazwa, sekcja, cena) tabeli; brakujące kody mają ceny domyślne"""
+        prices = {code: price for code, _, _, price in ATTACHMENTS}
+        for code, _, _, price in rows:
+            try:
+                prices[code] = parse_amount(price)
+            except ValueError:
+                logger.warning(f"Niepoprawna cena wyposażenia {code}: {price!r}")
+        codes = tuple(prices)
+        return cls(
+            codes=codes,
+            prices=np.array([prices[code] for code in codes], dtype=np.float64),
+            index=MappingProxyType({code: i for i, code in enumerate(codes)})
+        )
+
+    def price(self, code) -> float:
+        i = self.index.get(code)
+        return 0.0 if i is None else float(self.prices[i])
+
+    def attachments_cost(self, selected) -> float:
+        """Koszt wybranego wyposażenia (słownik kod -> True); pole tekstowe "inne" nie ma ceny"""
+        return sum(self.price(code) for code, value in (selected or {}).items() if value is True)
+
+    def selection_matrix(self, selections) -> np.ndarray:
+        """Macierz N x K wyborów wyposażenia dla listy słowników wybranych opcji"""
+        matrix = np.zeros((len(selections), len(self.codes)), dtype=np.float64)
+        for row, selected in enumerate(selections):
+            for code, value in (selected or {}).items():
+                i = self.index.get(code)
+                if i is not None and value is True:
+                    matrix[row, i] = 1.0
+        return matrix
+
+
+DEFAULT_PRICE_LIST = PriceList.from_rows()
+
+
+def offer_columns(offers) -> dict:
+    """Kolumny cen (pozycja -> tablica N) z listy słowników ofert"""
+    columns = {}
+    for item, (section, name) in PRICE_COMPONENTS.items():
+        columns[item] = np.fromiter(
+            (parse_amount((offer.get(section) or {}).get(name)) for offer in offers),
+            dtype=np.float64, count=len(offers)
+        )
+    return columns
+
+
+def price_batch(columns, price_list=DEFAULT_PRICE_LIST, selections=None, attachments_cost=None) -> dict:
+    """Wycena N ofert jednym przebiegiem.
+
+    columns: pozycja z PRICE_COMPONENTS -> tablica N cen (brakujące pozycje to 0).
+    Koszt wyposażenia pochodzi z macierzy wyborów N x K (selections) pomnożonej przez
+    wektor cen albo z gotowej tablicy attachments_cost. Zwraca pozycje i 'total' jako tablice N.
+    """
+    arrays = {item: np.nan_to_num(np.asarray(values, dtype=np.float64)) for item, values in columns.items()}
+    if selections is not None:
+        attachments = np.asarray(selections, dtype=np.float64) @ price_list.prices
+    elif attachments_cost is not None:
+        attachments = np.asarray(attachments_cost, dtype=np.float64)
+    else:
+        attachments = 0.0
+
+    # Brakujące pozycje i skalary rozszerzane są do długości N
+    values = np.broadcast_arrays(*(arrays.get(item, 0.0) for item in PRICE_COMPONENTS), attachments)
+    items = dict(zip(LINE_ITEMS, values))
+    items['total'] = np.sum([items[item] for item in LINE_ITEMS], axis=0)
+    return items
+
+
+def price_offer(offer_data, attachments_cost=None, selected=None, price_list=DEFAULT_PRICE_LIST) -> dict:
+    """Pozycje i cena całkowita jednej oferty.
+
+    Koszt wyposażenia podany wprost (attachments_cost) ma pierwszeństwo przed wyceną wybranych opcji.
+    """
+    items = {}
+    for item, (section, name) in PRICE_COMPONENTS.items():
+        items[item] = parse_amount((offer_data.get(section) or {}).get(name))
+    if attachments_cost is None:
+        attachments_cost = price_list.attachments_cost(selected)
+    items[ATTACHMENTS_ITEM] = parse_amount(attachments_cost)
+    items['total'] = sum(items[item] for item in LINE_ITEMS)
+    return items
+
+
+def offer_total(offer_data, attachments_cost=None, selected=None, price_list=DEFAULT_PRICE_LIST) -> float:
+    """Cena całkowita netto oferty"""
+    return price_offer(offer_data, attachments_cost, selected, price_list)['total']
@@ -0,0 +1,302 @@
+"""Wspólny limit wywołań LLM: żądania na minutę (RPM) i tokeny na minutę (TPM).
+
+Oba limity to kubełki tokenów uzupełniane w sposób ciągły. Wywołanie czeka, aż oba kubełki
+mają dość miejsca. Oczekujący ustawiani są w kolejce według pasa: wywołania interaktywne
+(strona) przed wsadowymi (batch_offers), a pas wsadowy nie może zejść poniżej rezerwy
+INTERACTIVE_RESERVE - handlowiec nie czeka na uzupełnienie kubełka opróżnionego przez wsad.
+Stan kubełków jest w pamięci procesu albo - przy ustawionym LLM_LIMITER_DB - w pliku SQLite
+wspólnym dla wielu procesów (aplikacja i zadania wsadowe).
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import streamlit as st
+
+from telemetry import Histogram, _histogram_lines, get_telemetry
+
+logger = logging.getLogger(__name__)
+
+LLM_RPM = int(os.environ.get('LLM_RPM', 500))
+LLM_TPM = int(os.environ.get('LLM_TPM', 200_000))
+LIMITER_DB = os.environ.get('LLM_LIMITER_DB')
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+# Kolejność obsługi pasów (mniejsza wartość - wcześniej)
+LANES = {INTERACTIVE: 0, BATCH: 1}
+
+# Część pojemności kubełków zostawiana dla wywołań interaktywnych
+INTERACTIVE_RESERVE = 0.2
+# Szacowana liczba tokenów odpowiedzi (korygowana po otrzymaniu usage)
+COMPLETION_TOKENS_ESTIMATE = 800
+# Najdłuższa przerwa między sprawdzeniami kubełków przez oczekującego
+POLL_INTERVAL = 0.05
+
+WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class RateLimitTimeout(TimeoutError):
+    """Nie doczekano się miejsca w limicie przed upływem czasu"""
+
+
+@dataclass
+class Ticket:
+    """Przydział limitu dla jednego wywołania"""
+    lane: str
+    tokens: int
+    waited: float
+
+
+def estimate_tokens(messages, completion_tokens=COMPLETION_TOKENS_ESTIMATE) -> int:
+    """Przybliżona liczba tokenów wywołania: ok. 4 znaki na token promptu plus szacowana odpowiedź"""
+    chars = sum(len(str(message.get('content') or '')) for message in messages or ())
+    return chars // 4 + completion_tokens
+
+
+def plan_take(demands, state, now) -> tuple:
+    """Wspólna logika magazynów kubełków.
+
+    demands: (nazwa, ile, przyrost na sekundę, pojemność, rezerwa); state: nazwa -> (poziom, czas).
+    Zwraca (czas oczekiwania, nowy stan). Przy zerowym czasie pobierane są wszystkie kubełki,
+    w przeciwnym razie żaden.
+    """
+    levels = {}
+    wait = 0.0
+    for name, amount, rate, capacity, reserve in demands:
+        level, updated = state.get(name, (capacity, now))
+        level = min(capacity, level + max(0.0, now - updated) * rate)
+        levels[name] = level
+        # Wywołanie większe niż pojemność czeka na pełny kubełek
+        need = min(min(amount, capacity) + reserve, capacity) - level
+        if need > 0:
+            wait = max(wait, need / rate)
+    if wait == 0.0:
+        return 0.0, {name: (levels[name] - amount, now) for name, amount, *_ in demands}
+    return wait, {name: (level, now) for name, level in levels.items()}
+
+
+class MemoryBucketStore:
+    """Kubełki w pamięci procesu"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def take(self, demands) -> float:
+        with self._lock:
+            wait, state = plan_take(demands, self._state, time.time())
+            self._state.update(state)
+            return wait
+
+    def adjust(self, name, delta, capacity):
+        """Zwraca (delta > 0) albo dobiera (delta < 0) tokeny po poznaniu faktycznego zużycia"""
+        with self._lock:
+            level, updated = self._state.get(name, (capacity, time.time()))
+            self._state[name] = (min(capacity, level + delta), updated)
+
+
+class SQLiteBucketStore:
+    """Kubełki w pliku SQLite - wspólne dla procesów na jednej maszynie"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, level REAL, updated REAL)'
+        )
+
+    def _update(self, names, fn):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                placeholders = ', '.join('?' * len(names))
+                rows = self._conn.execute(
+                    f'SELECT name, level, updated FROM rate_buckets WHERE name IN ({placeholders})', names
+                ).fetchall()
+                result, state = fn({name: (level, updated) for name, level, updated in rows})
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO rate_buckets (name, level, updated) VALUES (?, ?, ?)',
+                    [(name, level, updated) for name, (level, updated) in state.items()]
+                )
+                self._conn.execute('COMMIT')
+                return result
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def take(self, demands) -> float:
+        return self._update([d[0] for d in demands], lambda state: plan_take(demands, state, time.time()))
+
+    def adjust(self, name, delta, capacity):
+        def apply(state):
+            level, updated = state.get(name, (capacity, time.time()))
+            return None, {name: (min(capacity, level + delta), updated)}
+        self._update([name], apply)
+
+
+class RateLimiter:
+    """Limit RPM/TPM z kolejką priorytetową pasów (interaktywny przed wsadowym)"""
+
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, store=None, reserve=INTERACTIVE_RESERVE, name='openai'):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.store = store or MemoryBucketStore()
+        self.reserve = reserve
+        self.name = name
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._waits = {lane: Histogram(WAIT_BUCKETS) for lane in LANES}
+        self._timeouts = dict.fromkeys(LANES, 0)
+
+    def _demands(self, tokens, lane):
+        reserve = 0.0 if lane == INTERACTIVE else self.reserve
+        return [
+            (f'{self.name}:rpm', 1, self.rpm / 60, self.rpm, reserve * self.rpm),
+            (f'{self.name}:tpm', tokens, self.tpm / 60, self.tpm, reserve * self.tpm)
+        ]
+
+    def _is_first(self, entry) -> bool:
+        with self._cond:
+            return self._waiting[0] == entry
+
+    def _try(self, entry, tokens, lane) -> float:
+        """Czas do ponownej próby; 0 oznacza przydział. Próbuje tylko pierwszy w kolejce.
+
+        Magazyn (np. SQLite z blokadą pliku) wołany jest poza self._cond - oczekiwanie na blokadę
+        innego procesu nie wstrzymuje kolejki ani metryk w tym procesie.
+        """
+        if not self._is_first(entry):
+            return POLL_INTERVAL
+        return self.store.take(self._demands(tokens, lane))
+
+    def _enter(self, lane):
+        entry = (LANES[lane], next(self._seq), lane)
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+        return entry
+
+    def _leave(self, entry, lane, tokens, start, granted) -> Ticket:
+        waited = time.monotonic() - start
+        with self._cond:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+            if granted:
+                self._waits[lane].observe(waited)
+            else:
+                self._timeouts[lane] += 1
+            self._cond.notify_all()
+        if waited > 1.0:
+            logger.info(f"Limit LLM: oczekiwanie {waited:.2f} s (pas {lane})")
+        return Ticket(lane, tokens, waited)
+
+    def acquire(self, tokens, lane=INTERACTIVE, timeout=None) -> Ticket:
+        """Czeka na miejsce w limicie; po timeout (s) zgłasza RateLimitTimeout"""
+        start = time.monotonic()
+        entry = self._enter(lane)
+        granted = False
+        try:
+            while True:
+                wait = self._try(entry, tokens, lane)
+                if wait == 0.0:
+                    granted = True
+                    break
+                if timeout is not None and time.monotonic() - start + min(wait, POLL_INTERVAL) > timeout:
+                    raise RateLimitTimeout(f"Brak miejsca w limicie LLM po {timeout:.1f} s")
+                with self._cond:
+                    self._cond.wait(min(wait, POLL_INTERVAL))
+        finally:
+            ticket = self._leave(entry, lane, tokens, start, granted)
+        return ticket
+
+    async def acquire_async(self, tokens, lane=BATCH, timeout=None) -> Ticket:
+        """Odpowiednik acquire dla asyncio - czeka bez blokowania pętli zdarzeń"""
+        start = time.monotonic()
+        entry = self._enter(lane)
+        granted = False
+        try:
+            while True:
+                if self._is_first(entry):
+                    # Magazyn może czekać na blokadę pliku SQLite - poza pętlą zdarzeń
+                    wait = await asyncio.to_thread(self.store.take, self._demands(tokens, lane))
+                else:
+                    wait = POLL_INTERVAL
+                if wait == 0.0:
+                    granted = True
+                    break
+                if timeout is not None and time.monotonic() - start + min(wait, POLL_INTERVAL) > timeout:
+                    raise RateLimitTimeout(f"Brak miejsca w limicie LLM po {timeout:.1f} s")
+                await asyncio.sleep(min(wait, POLL_INTERVAL))
+        finally:
+            ticket = self._leave(entry, lane, tokens, start, granted)
+        return ticket
+
+    def settle(self, ticket, used_tokens):
+        """Koryguje kubełek TPM o różnicę między oszacowaniem a faktycznym zużyciem"""
+        if used_tokens is None:
+            return
+        self.store.adjust(f'{self.name}:tpm', ticket.tokens - used_tokens, self.tpm)
+
+    def queue_depth(self) -> dict:
+        with self._cond:
+            depth = dict.fromkeys(LANES, 0)
+            for _, _, lane in self._waiting:
+                depth[lane] += 1
+            return depth
+
+    def snapshot(self) -> list:
+        """Długość kolejki, liczba przydziałów i czas oczekiwania (ms) dla każdego pasa"""
+        depth = self.queue_depth()
+        with self._cond:
+            return [
+                {
+                    'pas': lane,
+                    'w_kolejce': depth[lane],
+                    'przydziały': h.count,
+                    'przekroczenia_czasu': self._timeouts[lane],
+                    'oczekiwanie_p50_ms': round(h.quantile(0.5) * 1000, 1),
+                    'oczekiwanie_p95_ms': round(h.quantile(0.95) * 1000, 1)
+                }
+                for lane, h in self._waits.items()
+            ]
+
+    def prometheus_lines(self) -> list:
+        """Długość kolejki i histogram czasu oczekiwania w formacie Prometheus"""
+        depth = self.queue_depth()
+        lines = [
+            '# HELP offer_llm_queue_depth Wywołania LLM czekające na miejsce w limicie',
+            '# TYPE offer_llm_queue_depth gauge'
+        ]
+        lines += [f'offer_llm_queue_depth{{lane="{lane}"}} {depth[lane]}' for lane in LANES]
+        lines += [
+            '# HELP offer_llm_queue_wait_seconds Czas oczekiwania na miejsce w limicie LLM',
+            '# TYPE offer_llm_queue_wait_seconds histogram'
+        ]
+        with self._cond:
+            for lane, h in self._waits.items():
+                lines += _histogram_lines('offer_llm_queue_wait_seconds', f'lane="{lane}"', h)
+            lines += [
+                '# HELP offer_llm_queue_timeouts_total Wywołania LLM odrzucone po upływie czasu oczekiwania',
+                '# TYPE offer_llm_queue_timeouts_total counter'
+            ]
+            lines += [f'offer_llm_queue_timeouts_total{{lane="{lane}"}} {n}' for lane, n in self._timeouts.items()]
+        return lines
+
+
+@st.cache_resource
+def get_rate_limiter() -> RateLimiter:
+    """Jeden limit na proces; przy ustawionym LLM_LIMITER_DB wspólny dla procesów"""
+    store = SQLiteBucketStore(LIMITER_DB) if LIMITER_DB else MemoryBucketStore()
+    limiter = RateLimiter(store=store)
+    get_telemetry().add_collector(limiter.prometheus_lines)
+    logger.info(f"Limit LLM: {limiter.rpm} RPM, {limiter.tpm} TPM ({'SQLite' if LIMITER_DB else 'pamięć'})")
+    return limiter
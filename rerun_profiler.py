@@ -0,0 +1,219 @@
+"""Opcjonalny profiler przeładowań stron Streamlit.
+
+Włączany zmienną środowiskową PROFILE_RERUNS=1 (dla całego procesu) albo parametrem
+?profile=1 w adresie strony (dla jednej sesji). Dla każdego przeładowania zapisuje
+widżet, który je wywołał, czas poszczególnych sekcji i rozmiar session_state.
+Wyniki trafiają do wspólnego bufora cyklicznego pokazywanego w panelu administracyjnym.
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import deque
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENV = 'PROFILE_RERUNS'
+PROFILE_BUFFER_SIZE = 500
+
+# Klucze session_state używane przez profiler (pomijane przy wykrywaniu widżetu i pomiarze rozmiaru)
+ACTIVE_KEY = '_profiler_active'
+ENABLED_KEY = '_profiler_enabled'
+WIDGETS_KEY = '_profiler_widgets'
+PROFILER_KEYS = (ACTIVE_KEY, ENABLED_KEY, WIDGETS_KEY)
+
+# Typy wartości widżetów porównywane między przeładowaniami
+WIDGET_VALUE_TYPES = (bool, int, float, str, list, tuple, dict, type(None))
+
+
+class ProfileBuffer:
+    """Bufor cykliczny ostatnich przeładowań (wspólny dla sesji)"""
+
+    def __init__(self, max_items=PROFILE_BUFFER_SIZE):
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=max_items)
+
+    def add(self, record):
+        with self._lock:
+            self._records.append(record)
+
+    def records(self) -> list:
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def to_json(self) -> str:
+        return json.dumps(self.records(), ensure_ascii=False, indent=2, default=str)
+
+    def summary(self) -> list:
+        """Statystyki czasu sekcji: liczba, średnia, p95 i maksimum w ms"""
+        timings = {}
+        for record in self.records():
+            for name, ms in record['sections'].items():
+                timings.setdefault((record['page'], name), []).append(ms)
+            timings.setdefault((record['page'], '(całość)'), []).append(record['total_ms'])
+
+        rows = []
+        for (page, name), values in sorted(timings.items()):
+            values.sort()
+            rows.append({
+                'strona': page,
+                'sekcja': name,
+                'liczba': len(values),
+                'średnia_ms': round(sum(values) / len(values), 2),
+                'p95_ms': values[min(len(values) - 1, int(len(values) * 0.95))],
+                'max_ms': values[-1]
+            })
+        return rows
+
+
+@st.cache_resource
+def get_profile_buffer() -> ProfileBuffer:
+    """Jeden bufor profilu na proces"""
+    return ProfileBuffer()
+
+
+def is_enabled() -> bool:
+    """Profilowanie włączone dla procesu (PROFILE_RERUNS=1) albo dla sesji (?profile=1)"""
+    if os.environ.get(PROFILE_ENV) == '1':
+        return True
+    if ENABLED_KEY not in st.session_state:
+        st.session_state[ENABLED_KEY] = st.query_params.get('profile') == '1'
+    return st.session_state[ENABLED_KEY]
+
+
+def _widget_values() -> dict:
+    return {
+        key: value for key, value in st.session_state.items()
+        if key not in PROFILER_KEYS and isinstance(value, WIDGET_VALUE_TYPES)
+    }
+
+
+def _trigger(values) -> list:
+    """Klucze widżetów, których wartość zmieniła się od poprzedniego przeładowania"""
+    previous = st.session_state.get(WIDGETS_KEY)
+    if previous is None:
+        return []
+    # Przycisk ma wartość True tylko w przebiegu, w którym go kliknięto
+    return sorted(
+        str(key) for key, value in values.items()
+        if key not in previous or previous[key] != value
+    )
+
+
+def _value_size(value) -> int:
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def _state_size() -> tuple:
+    """Rozmiar session_state w bajtach (serializacja pickle) i największe klucze"""
+    sizes = {
+        str(key): _value_size(value) for key, value in st.session_state.items()
+        if key not in PROFILER_KEYS
+    }
+    largest = sorted(sizes.items(), key=lambda item: item[1], reverse=True)[:5]
+    return sum(sizes.values()), dict(largest)
+
+
+def _fragment_run() -> bool:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return bool(ctx and ctx.fragment_ids_this_run)
+    except Exception:
+        return False
+
+
+def _session_id() -> str:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id[:8] if ctx else ''
+    except Exception:
+        return ''
+
+
+@contextlib.contextmanager
+def profile_rerun(page):
+    """Mierzy całe przeładowanie strony; wewnątrz sekcje mierzone są przez profile_section"""
+    if not is_enabled():
+        yield
+        return
+    with _record(page, 'app'):
+        yield
+
+
+@contextlib.contextmanager
+def profile_section(name, page=None):
+    """Mierzy sekcję przeładowania.
+
+    Sekcja wywołana poza profile_rerun (przeładowanie samego fragmentu) tworzy własny rekord.
+    """
+    if not is_enabled():
+        yield
+        return
+
+    record = st.session_state.get(ACTIVE_KEY)
+    if record is None:
+        with _record(page or name, 'fragment'):
+            with profile_section(name):
+                yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        record['sections'][name] = round(record['sections'].get(name, 0.0) + elapsed, 3)
+
+
+def profiled(name, page=None):
+    """Dekorator: mierzy funkcję (np. fragment Streamlit) jako sekcję profile_section"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with profile_section(name, page):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def _record(page, scope):
+    values = _widget_values()
+    record = {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'session': _session_id(),
+        'page': page,
+        'scope': 'fragment' if scope == 'fragment' or _fragment_run() else 'app',
+        'trigger': _trigger(values),
+        'sections': {},
+        'total_ms': 0.0
+    }
+    st.session_state[ACTIVE_KEY] = record
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        # Wykonuje się także przy st.rerun() i st.stop(), które przerywają skrypt wyjątkiem
+        record['total_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        st.session_state.pop(ACTIVE_KEY, None)
+        st.session_state[WIDGETS_KEY] = _widget_values()
+        record['state_keys'] = len(st.session_state) - sum(1 for key in PROFILER_KEYS if key in st.session_state)
+        record['state_bytes'], record['largest_keys'] = _state_size()
+        get_profile_buffer().add(record)
+        logger.debug(f"Przeładowanie {page} ({record['scope']}): {record['total_ms']:.1f} ms")
@@ -0,0 +1,371 @@
+"""Pomiary etapów generowania oferty i PDF.
+
+Każdy etap (pobranie katalogu, budowa promptu, wywołanie LLM, parsowanie JSON, wyszukanie
+pojazdu, obliczenie ceny, renderowanie PDF) mierzony jest jako span z liczbą tokenów
+i rozmiarem danych. Spany trafiają do histogramów w pamięci procesu, eksportowanych
+w formacie Prometheus (plik METRICS_PATH albo endpoint /metrics przy ustawionym
+METRICS_PORT) oraz do dziennika śladów JSONL (TRACE_PATH). Ślady i plik metryk zapisuje
+wątek tła - wątek obsługujący żądanie tylko dodaje zakończony ślad do kolejki.
+"""
+import atexit
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_DIR = 'telemetry'
+TRACE_PATH = os.environ.get('OFFER_TRACE_PATH', os.path.join(TELEMETRY_DIR, 'trace.jsonl'))
+METRICS_PATH = os.environ.get('OFFER_METRICS_PATH', os.path.join(TELEMETRY_DIR, 'metrics.prom'))
+# Po przekroczeniu rozmiaru dziennik śladów przenoszony jest do pliku .1
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+# Plik metryk zapisywany najwyżej co tyle sekund
+METRICS_WRITE_INTERVAL = 10.0
+# Ślady czekające na zapis; przy pełnej kolejce nowe są odrzucane zamiast blokować wątek
+TRACE_QUEUE_SIZE = 10_000
+
+# Granice kubełków histogramów (sekundy i bajty)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Atrybuty spanu sumowane jako liczniki tokenów
+TOKEN_ATTRS = ('prompt_tokens', 'completion_tokens', 'cached_tokens')
+
+_current_span = contextvars.ContextVar('offer_span', default=None)
+
+
+class Histogram:
+    """Histogram o stałych kubełkach (jak w Prometheus) z przybliżonymi kwantylami"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q) -> float:
+        """Kwantyl z interpolacją liniową w kubełku (jak histogram_quantile w Prometheus)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+class Span:
+    """Pomiar jednego etapu; atrybuty (tokeny, rozmiary) ustawiane przez set()"""
+
+    def __init__(self, name, trace_id, parent=None, attrs=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.attrs = dict(attrs or {})
+        self.start = time.time()
+        self.duration = 0.0
+        self.error = None
+        # Zakończone spany śladu - zapisywane razem przy zamknięciu spanu głównego
+        self.finished = [] if parent is None else parent.finished
+
+    def set(self, **attrs):
+        self.attrs.update({key: value for key, value in attrs.items() if value is not None})
+
+    def to_dict(self) -> dict:
+        return {
+            'trace': self.trace_id,
+            'span': self.span_id,
+            'parent': self.parent.span_id if self.parent else None,
+            'name': self.name,
+            'start': round(self.start, 6),
+            'duration_ms': round(self.duration * 1000, 3),
+            'error': self.error,
+            **self.attrs
+        }
+
+
+class Telemetry:
+    """Histogramy i liczniki etapów w pamięci procesu oraz zapis śladów JSONL"""
+
+    def __init__(self, trace_path=TRACE_PATH, metrics_path=METRICS_PATH):
+        self.trace_path = trace_path
+        self.metrics_path = metrics_path
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._sizes = {}
+        self._tokens = {}
+        self._errors = {}
+        self._collectors = []
+        self._metrics_written = 0.0
+        self._queue = queue.Queue(TRACE_QUEUE_SIZE)
+        self._writer = None
+        self.dropped_traces = 0
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def add_collector(self, collector):
+        """Dodaje funkcję zwracającą dodatkowe linie metryk Prometheus (np. liczniki bramy LLM)"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def observe(self, span):
+        """Dodaje zakończony span do histogramów"""
+        with self._lock:
+            self._durations.setdefault(span.name, Histogram(DURATION_BUCKETS)).observe(span.duration)
+            for key, value in span.attrs.items():
+                if key.endswith('_bytes') and isinstance(value, (int, float)):
+                    label = (span.name, key[:-len('_bytes')])
+                    self._sizes.setdefault(label, Histogram(SIZE_BUCKETS)).observe(value)
+                elif key in TOKEN_ATTRS and isinstance(value, (int, float)):
+                    label = (span.name, key[:-len('_tokens')])
+                    self._tokens[label] = self._tokens.get(label, 0) + value
+            if span.error:
+                self._errors[span.name] = self._errors.get(span.name, 0) + 1
+
+    def submit(self, spans):
+        """Przekazuje spany zakończonego śladu do zapisu w wątku tła"""
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped_traces += 1
+
+    def flush(self, timeout=5.0):
+        """Czeka na zapis przekazanych śladów i zapisuje metryki (np. przy zamknięciu procesu)"""
+        if self._writer is not None and self._writer.is_alive():
+            written = threading.Event()
+            try:
+                self._queue.put(written, timeout=timeout)
+                written.wait(timeout)
+            except queue.Full:
+                logger.warning("Kolejka śladów pełna, pomijam oczekiwanie na zapis")
+        self.write_metrics(force=True)
+
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name='telemetry-writer', daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        """Wątek tła: zapisuje ślady z kolejki partiami i co METRICS_WRITE_INTERVAL plik metryk"""
+        while True:
+            try:
+                batch = [self._queue.get(timeout=METRICS_WRITE_INTERVAL)]
+            except queue.Empty:
+                batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # Znaczniki flush() potwierdzane są po zapisie wszystkiego, co trafiło do kolejki przed nimi
+            markers = [item for item in batch if isinstance(item, threading.Event)]
+            spans = [span for item in batch if not isinstance(item, threading.Event) for span in item]
+            if spans:
+                self.write_trace(spans)
+            self.write_metrics()
+            for marker in markers:
+                marker.set()
+
+    def _after_fork(self):
+        """W procesie potomnym nie działa wątek zapisu - zostanie uruchomiony ponownie"""
+        self._queue = queue.Queue(TRACE_QUEUE_SIZE)
+        self._writer = None
+
+    def write_trace(self, spans):
+        """Dopisuje spany zakończonego śladu do dziennika JSONL"""
+        if not self.trace_path:
+            return
+        lines = ''.join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + '\n' for s in spans)
+        try:
+            with self._lock:
+                if os.path.dirname(self.trace_path):
+                    os.makedirs(os.path.dirname(self.trace_path), exist_ok=True)
+                if os.path.exists(self.trace_path) and os.path.getsize(self.trace_path) > TRACE_MAX_BYTES:
+                    os.replace(self.trace_path, f"{self.trace_path}.1")
+                with open(self.trace_path, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+        except OSError as e:
+            logger.warning(f"Nie udało się zapisać śladu: {str(e)}")
+
+    def summary(self) -> list:
+        """p50/p95/p99 czasu (ms) dla każdego etapu"""
+        with self._lock:
+            return [
+                {
+                    'stage': name,
+                    'count': h.count,
+                    'p50_ms': round(h.quantile(0.5) * 1000, 2),
+                    'p95_ms': round(h.quantile(0.95) * 1000, 2),
+                    'p99_ms': round(h.quantile(0.99) * 1000, 2),
+                    'mean_ms': round(h.sum / h.count * 1000, 2)
+                }
+                for name, h in sorted(self._durations.items())
+            ]
+
+    def render_prometheus(self) -> str:
+        """Metryki w formacie tekstowym Prometheus"""
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP offer_stage_duration_seconds Czas etapów generowania oferty i PDF',
+                '# TYPE offer_stage_duration_seconds histogram'
+            ]
+            for name, h in sorted(self._durations.items()):
+                lines += _histogram_lines('offer_stage_duration_seconds', f'stage="{name}"', h)
+
+            lines += [
+                '# HELP offer_payload_bytes Rozmiar danych etapów (prompt, odpowiedź, PDF)',
+                '# TYPE offer_payload_bytes histogram'
+            ]
+            for (name, kind), h in sorted(self._sizes.items()):
+                lines += _histogram_lines('offer_payload_bytes', f'stage="{name}",payload="{kind}"', h)
+
+            lines += [
+                '# HELP offer_tokens_total Tokeny LLM według etapu i rodzaju',
+                '# TYPE offer_tokens_total counter'
+            ]
+            for (name, kind), value in sorted(self._tokens.items()):
+                lines.append(f'offer_tokens_total{{stage="{name}",type="{kind}"}} {value}')
+
+            lines += [
+                '# HELP offer_stage_errors_total Etapy zakończone błędem',
+                '# TYPE offer_stage_errors_total counter'
+            ]
+            for name, value in sorted(self._errors.items()):
+                lines.append(f'offer_stage_errors_total{{stage="{name}"}} {value}')
+            collectors = list(self._collectors)
+        for collector in collectors:
+            lines += collector()
+        return '\n'.join(lines) + '\n'
+
+    def write_metrics(self, force=False):
+        """Zapisuje metryki do pliku (np. dla node_exporter textfile collector)"""
+        now = time.monotonic()
+        if not self.metrics_path or (not force and now - self._metrics_written < METRICS_WRITE_INTERVAL):
+            return
+        self._metrics_written = now
+        try:
+            if os.path.dirname(self.metrics_path):
+                os.makedirs(os.path.dirname(self.metrics_path), exist_ok=True)
+            tmp_path = f"{self.metrics_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp_path, self.metrics_path)
+        except OSError as e:
+            logger.warning(f"Nie udało się zapisać metryk: {str(e)}")
+
+
+def _histogram_lines(metric, labels, h) -> list:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(h.buckets, h.counts):
+        cumulative += count
+        lines.append(f'{metric}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {h.count}')
+    lines.append(f'{metric}_sum{{{labels}}} {h.sum:.6f}')
+    lines.append(f'{metric}_count{{{labels}}} {h.count}')
+    return lines
+
+
+@st.cache_resource
+def get_telemetry() -> Telemetry:
+    """Jeden zbiór metryk na proces; przy ustawionym METRICS_PORT uruchamia endpoint /metrics"""
+    telemetry = Telemetry()
+    atexit.register(telemetry.flush)
+    port = os.environ.get('METRICS_PORT')
+    if port:
+        start_metrics_server(telemetry, int(port))
+    return telemetry
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Mierzy etap; span bez rodzica rozpoczyna nowy ślad"""
+    parent = _current_span.get()
+    current = Span(name, parent.trace_id if parent else uuid.uuid4().hex, parent, attrs)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {str(e)}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _current_span.reset(token)
+        telemetry = get_telemetry()
+        telemetry.observe(current)
+        current.finished.append(current)
+        if parent is None:
+            telemetry.submit(current.finished)
+
+
+def record(name, duration, **attrs):
+    """Zapisuje etap zmierzony poza blokiem with (np. czas sumowany w pętli strumienia)"""
+    parent = _current_span.get()
+    finished = Span(name, parent.trace_id if parent else uuid.uuid4().hex, parent, attrs)
+    finished.duration = duration
+    telemetry = get_telemetry()
+    telemetry.observe(finished)
+    finished.finished.append(finished)
+    if parent is None:
+        telemetry.submit(finished.finished)
+
+
+def usage_attrs(usage) -> dict:
+    """Liczby tokenów z obiektu usage odpowiedzi OpenAI"""
+    if usage is None:
+        return {}
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+        'completion_tokens': getattr(usage, 'completion_tokens', None),
+        'cached_tokens': getattr(details, 'cached_tokens', None) if details else None
+    }
+
+
+def start_metrics_server(telemetry, port) -> ThreadingHTTPServer:
+    """Endpoint HTTP /metrics w wątku tła"""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = telemetry.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(f"/metrics: {format % args}")
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Endpoint metryk: http://0.0.0.0:{port}/metrics")
+    return server
@@ -0,0 +1,136 @@
+"""Testy regułowej ekstrakcji pól (fast_extractor). Uruchomienie: python -m unittest"""
+import json
+import os
+import unittest
+
+from fast_extractor import MIN_FIELD_CONFIDENCE, FastExtractor
+
+LOADTEST_TEXTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'loadtest', 'requests.jsonl')
+
+
+def extract(text):
+    return FastExtractor((), ()).extract(text)
+
+
+class CompanyNameTest(unittest.TestCase):
+
+    def assertCompany(self, text, expected):
+        result = extract(text)
+        self.assertEqual(result.offer['dane_klienta']['nazwa'], expected)
+        self.assertTrue(result.is_resolved('dane_klienta', 'nazwa'))
+
+    def test_label_stops_at_comma(self):
+        self.assertCompany("Firma: Trans-Pol Sp. z o.o., ul. Długa 5, 00-001 Warszawa, NIP 526-000-12-46",
+                           "Trans-Pol Sp. z o.o.")
+
+    def test_label_stops_at_sentence_end(self):
+        self.assertCompany("Klient: Piekarnia Kłos. Prosimy o szybki kontakt", "Piekarnia Kłos")
+
+    def test_legal_form_does_not_cross_sentences(self):
+        self.assertCompany("Mroźnia -18, grzanie zimą. Transmed S.A., NIP 779-100-20-30.", "Transmed S.A.")
+        self.assertCompany("Zasilanie sieciowe 230V na noc. Lody Polarne Sp. z o.o.", "Lody Polarne Sp. z o.o.")
+
+    def test_leading_label_word_removed(self):
+        self.assertCompany("Firma Chłodex Sp. z o.o., ul. Polna 12, 00-950 Warszawa", "Chłodex Sp. z o.o.")
+
+    def test_implausible_name_stays_unresolved(self):
+        result = extract("Klient: prosi o ofertę na zabudowę chłodniczą do samochodu dostawczego z agregatem")
+        self.assertLess(result.confidence[('dane_klienta', 'nazwa')], MIN_FIELD_CONFIDENCE)
+        self.assertIn('dane_klienta.nazwa', result.unresolved())
+
+
+
+class ContactPersonTest(unittest.TestCase):
+
+    def test_phone_is_not_a_person(self):
+        result = extract("kontakt: 600-200-300")
+        self.assertFalse(result.is_resolved('dane_klienta', 'osoba_odpowiedzialna'))
+        self.assertEqual(result.offer['dane_klienta']['telefon'], '600-200-300')
+        self.assertEqual(result.merge_into({'dane_klienta': {'osoba_odpowiedzialna': 'Jan Kowalski'}})
+                         ['dane_klienta']['osoba_odpowiedzialna'], 'Jan Kowalski')
+
+    def test_email_is_not_a_person(self):
+        result = extract("Kontakt: anna.nowak@farmtrans.pl")
+        self.assertFalse(result.is_resolved('dane_klienta', 'osoba_odpowiedzialna'))
+
+    def test_name_stops_at_contact_details(self):
+        result = extract("osoba kontaktowa: Anna Nowak tel. 600200300")
+        self.assertEqual(result.offer['dane_klienta']['osoba_odpowiedzialna'], 'Anna Nowak')
+
+    def test_later_label_after_rejected_one(self):
+        result = extract("kontakt: 600-200-300. Osoba kontaktowa: Piotr Zieliński")
+        self.assertEqual(result.offer['dane_klienta']['osoba_odpowiedzialna'], 'Piotr Zieliński')
+
+
+class RequirementsTest(unittest.TestCase):
+    # Pojazd z treści zapytania -> (temperatura, zasilanie); None - tekst nie mówi o zasilaniu
+    EXPECTED = {
+        'Opel Vivaro': (0, None),
+        'Renault Master': (-20, 'drogowy_siec_230V'),
+        'Fiat Ducato': (0, None),
+        'Mercedes Sprinter': (-20, None),
+        'Ford Transit': (0, None),
+        'Iveco Daily': (0, None),
+        'Volkswagen Crafter': (-20, 'drogowy_siec_230V'),
+        'Peugeot Boxer': (0, None),
+        'Citroën Jumper': (0, None),
+        'Renault Trafic': (0, None),
+        'Opel Movano': (-20, None),
+        'Toyota Proace': (0, None),
+    }
+
+    def test_loadtest_texts(self):
+        with open(LOADTEST_TEXTS, encoding='utf-8') as f:
+            texts = [json.loads(line)['text'] for line in f if line.strip()]
+        self.assertEqual(len(texts), len(self.EXPECTED))
+        for vehicle, (temperature, power) in self.EXPECTED.items():
+            text = next(t for t in texts if vehicle in t)
+            with self.subTest(vehicle=vehicle):
+                result = extract(text)
+                self.assertEqual(result.offer['wymagania']['temperatura'], temperature)
+                self.assertTrue(result.is_resolved('wymagania', 'temperatura'))
+                if power is None:
+                    self.assertFalse(result.is_resolved('wymagania', 'zasilanie'))
+                    self.assertIn('wymagania.zasilanie', result.unresolved())
+                else:
+                    self.assertEqual(result.offer['wymagania']['zasilanie'], power)
+                    self.assertTrue(result.is_resolved('wymagania', 'zasilanie'))
+
+    def test_zasilanie_is_not_three_phase(self):
+        result = extract("Zasilanie 230V na noc")
+        self.assertEqual(result.offer['wymagania']['zasilanie'], 'drogowy_siec_230V')
+        result = extract("Proszę o ofertę, zasilanie do ustalenia")
+        self.assertFalse(result.is_resolved('wymagania', 'zasilanie'))
+
+    def test_three_phase(self):
+        for text in ("gniazdo 400V", "prąd siłowy na placu", "zasilanie trójfazowe"):
+            with self.subTest(text=text):
+                self.assertEqual(extract(text).offer['wymagania']['zasilanie'], 'drogowy_siec_400V')
+
+    def test_bare_negative_temperature(self):
+        for text in ("chłodnia -20 do Renault Master", "mroźnia minus 20", "temperatura −25°C"):
+            with self.subTest(text=text):
+                self.assertEqual(extract(text).offer['wymagania']['temperatura'], -20)
+        for text in ("rabat -20%", "NIP 526-000-12-46", "data 2024-10-20"):
+            with self.subTest(text=text):
+                self.assertFalse(extract(text).is_resolved('wymagania', 'temperatura'))
+
+    def test_phone_prefix_is_not_temperature(self):
+        for text in ("Proszę o ofertę, tel. +48 601 234 567", "kontakt +48601234567", "tel. +48 22 123 45 67"):
+            with self.subTest(text=text):
+                result = extract(text)
+                self.assertFalse(result.is_resolved('wymagania', 'temperatura'))
+                self.assertIn('wymagania.temperatura', result.unresolved())
+        result = extract("temperatura +5, tel. +48 601 234 567")
+        self.assertEqual(result.offer['wymagania']['temperatura'], 0)
+        self.assertTrue(result.is_resolved('wymagania', 'temperatura'))
+
+    def test_defaults_are_not_resolved(self):
+        result = extract("Proszę o ofertę na zabudowę")
+        self.assertFalse(result.is_resolved('wymagania', 'temperatura'))
+        self.assertFalse(result.is_resolved('wymagania', 'zasilanie'))
+        self.assertNotIn('wymagania', result.resolved_fields())
+
+
+if __name__ == '__main__':
+    unittest.main()
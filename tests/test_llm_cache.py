@@ -0,0 +1,40 @@
+"""Testy cache odpowiedzi LLM. Uruchomienie: python -m unittest"""
+import os
+import tempfile
+import unittest
+
+from llm_cache import LLMResponseCache
+
+
+class LazyStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'llm_cache.db')
+        self.cache = LLMResponseCache(self.path, max_entries=2)
+        self.cache.put('a', 'v1', 'm', {'pojazd': 'a'})
+        self.cache.put('b', 'v1', 'm', {'pojazd': 'b'})
+
+    def test_get_does_not_write(self):
+        changes = self.cache.conn.total_changes
+        self.assertEqual(self.cache.get('a'), {'pojazd': 'a'})
+        self.assertIsNone(self.cache.get('brak'))
+        self.assertEqual(self.cache.conn.total_changes, changes)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_flush_persists_counters(self):
+        self.cache.get('a')
+        self.cache.get('brak')
+        self.cache.flush()
+        stats = LLMResponseCache(self.path).stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_eviction_sees_pending_access(self):
+        self.cache.get('a')
+        self.cache.put('c', 'v1', 'm', {'pojazd': 'c'})
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""Testy bramy LLM: circuit breaker, deadline i rozliczanie limitu TPM. Uruchomienie: python -m unittest"""
+import asyncio
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+import openai
+
+from llm_gateway import CircuitBreaker, LLMDeadlineError, LLMGateway
+from llm_stub import _stream
+from rate_limiter import RateLimitTimeout
+
+
+REQUEST = httpx.Request('POST', 'http://localhost/v1/chat/completions')
+
+
+class FakeCompletions:
+    """Odpowiedzi API; kolejne wywołania zgłaszają najpierw wyjątki z listy errors"""
+
+    def __init__(self, errors=(), delay=0.0):
+        self.calls = 0
+        self.errors = list(errors)
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+            error = self.errors.pop(0) if self.errors else None
+        time.sleep(self.delay)
+        if error is not None:
+            raise error
+        if kwargs.get('stream'):
+            return _stream('{"pojazd": {}}', kwargs['model'], 400)
+        return SimpleNamespace(choices=[], usage=None)
+
+
+class FakeLimiter:
+    """Limiter, który czeka podany czas, a opcjonalnie zgłasza brak miejsca"""
+
+    def __init__(self, wait=0.0, fail=False):
+        self.wait = wait
+        self.fail = fail
+        self.acquired = 0
+        self.settled = []
+
+    def acquire(self, tokens, lane, timeout=None):
+        self.acquired += 1
+        time.sleep(self.wait)
+        if self.fail:
+            raise RateLimitTimeout("Brak miejsca w limicie LLM")
+        return SimpleNamespace(tokens=tokens)
+
+    def settle(self, ticket, used_tokens):
+        self.settled.append(used_tokens)
+
+
+def make_gateway(limiter, breaker=None, completions=None, hedge=False):
+    completions = completions or FakeCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    gateway = LLMGateway(client=client, hedge=hedge, limiter=limiter, breaker=breaker)
+    return gateway, completions
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(threshold=1, reset_after=0.01)
+    breaker.failure()
+    time.sleep(0.02)
+    return breaker
+
+
+class GatewayTest(unittest.TestCase):
+
+    def test_rate_limit_timeout_releases_probe(self):
+        limiter = FakeLimiter(fail=True)
+        gateway, completions = make_gateway(limiter, half_open_breaker())
+        self.addCleanup(gateway.close)
+        with self.assertRaises(RateLimitTimeout):
+            gateway.create(model='m', messages=[])
+        self.assertEqual(gateway.breaker.state, 'half_open')
+
+        limiter.fail = False
+        gateway.create(model='m', messages=[])
+        self.assertEqual(completions.calls, 1)
+        self.assertEqual(gateway.breaker.state, 'closed')
+
+    def test_deadline_spent_in_limiter(self):
+        gateway, completions = make_gateway(FakeLimiter(wait=0.05), half_open_breaker())
+        self.addCleanup(gateway.close)
+        with self.assertRaises(LLMDeadlineError):
+            gateway.create(deadline=0.01, model='m', messages=[])
+        self.assertEqual(completions.calls, 0)
+        self.assertTrue(gateway.breaker.allow())
+
+    def test_client_error_keeps_breaker_half_open(self):
+        error = openai.BadRequestError("bad request", response=httpx.Response(400, request=REQUEST), body=None)
+        gateway, _ = make_gateway(FakeLimiter(), half_open_breaker(), FakeCompletions([error]))
+        self.addCleanup(gateway.close)
+        with self.assertRaises(openai.BadRequestError):
+            gateway.create(model='m', messages=[])
+        self.assertEqual(gateway.breaker.state, 'half_open')
+        self.assertTrue(gateway.breaker.allow())
+
+    @mock.patch.object(LLMGateway, '_retry_delay', return_value=0.0)
+    def test_ticket_per_retry(self, _):
+        limiter = FakeLimiter()
+        completions = FakeCompletions([openai.APIConnectionError(request=REQUEST)])
+        gateway, _ = make_gateway(limiter, completions=completions)
+        self.addCleanup(gateway.close)
+        gateway.create(model='m', messages=[])
+        self.assertEqual(completions.calls, 2)
+        self.assertEqual(limiter.acquired, 2)
+
+    def test_ticket_per_hedged_request(self):
+        limiter = FakeLimiter()
+        gateway, completions = make_gateway(limiter, completions=FakeCompletions(delay=0.3), hedge=True)
+        self.addCleanup(gateway.close)
+        for _ in range(20):
+            gateway.stats.add(0.01)
+        with mock.patch('llm_gateway.HEDGE_MIN_DELAY', 0.05):
+            gateway.create(model='m', messages=[])
+        self.assertEqual(completions.calls, 2)
+        self.assertEqual(limiter.acquired, 2)
+
+    def test_async_client_goes_through_limiter(self):
+        limiter = FakeLimiter()
+        gateway, completions = make_gateway(limiter)
+        self.addCleanup(gateway.close)
+        response = asyncio.run(gateway.async_client.chat.completions.create(model='m', messages=[]))
+        self.assertEqual(response.choices, [])
+        self.assertEqual((completions.calls, limiter.acquired), (1, 1))
+
+    def test_stream_settles_from_usage_chunk(self):
+        limiter = FakeLimiter()
+        gateway, _ = make_gateway(limiter)
+        self.addCleanup(gateway.close)
+        stream = gateway.create(model='m', messages=[], stream=True)
+        self.assertEqual(limiter.settled, [])
+        chunks = list(stream)
+        self.assertEqual(limiter.settled, [chunks[-1].usage.total_tokens])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+"""Testy lokalnego zamiennika LLM (llm_stub). Uruchomienie: python -m unittest"""
+import json
+import os
+import unittest
+
+import jsonschema
+
+from llm_stub import StubOpenAI
+from offer_schema import offer_json_schema
+
+LOADTEST_TEXTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'loadtest', 'requests.jsonl')
+
+
+class SynthesizeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubOpenAI()
+        with open(LOADTEST_TEXTS, encoding='utf-8') as f:
+            cls.texts = [json.loads(line)['text'] for line in f if line.strip()]
+
+    def test_matches_response_schema(self):
+        schema = offer_json_schema()
+        for text in self.texts + ["Proszę o wycenę zabudowy dla busa"]:
+            with self.subTest(text=text[:40]):
+                body = json.loads(self.stub.synthesize([{'role': 'user', 'content': text}]))
+                jsonschema.validate(body, schema)
+
+    def test_aggregate_has_model_only(self):
+        body = json.loads(self.stub.synthesize([{'role': 'user', 'content': self.texts[0]}]))
+        self.assertEqual(list(body['agregat']), ['model'])
+        self.assertTrue(body['pojazd']['marka'])
+
+
+if __name__ == '__main__':
+    unittest.main()
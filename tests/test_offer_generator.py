@@ -0,0 +1,108 @@
+"""Testy generowania oferty poza wątkiem skryptu Streamlit. Uruchomienie: python -m unittest"""
+import asyncio
+import json
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import offer_generator
+from catalog_service import CatalogService
+from llm_cache import LLMResponseCache
+from offer_generator import OfferError, OfferGenerator
+from offer_jobs import DONE, FAILED, JobManager
+
+
+class CatalogDatabase:
+    """Zamiennik OfferDatabase czytający katalog tylko do odczytu"""
+
+    def __init__(self):
+        self._catalog = CatalogService().snapshot()
+
+    def catalog(self):
+        return self._catalog
+
+    def get_vehicle_info(self, marka, model):
+        return self._catalog.vehicle_info(marka, model)
+
+
+class NoStreamlit:
+    """Każde odwołanie do st.* poza wątkiem skryptu jest błędem"""
+
+    def __getattr__(self, name):
+        raise AssertionError(f"st.{name} wywołane w wątku roboczym")
+
+
+def fake_client(vehicle):
+    content = json.dumps({
+        "dane_klienta": {"nazwa": "Chłodex", "adres": "ul. Polna 12", "nip": "5260001246"},
+        "data_oferty": "", "numer_oferty": "1",
+        "pojazd": vehicle,
+        "wymagania": {"temperatura": 0, "zasilanie": "tylko_drogowy"},
+        "agregat": {"model": ""}
+    })
+    response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: response)))
+
+
+def make_generator(vehicle):
+    return OfferGenerator(
+        CatalogDatabase(), cache=LLMResponseCache(':memory:'), client=fake_client(vehicle), structured_output=False
+    )
+
+
+def run_job(fn, *args):
+    manager = JobManager(max_workers=1)
+    job = manager.submit('offer', 'test', fn, *args)
+    deadline = time.monotonic() + 10
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+@mock.patch.object(offer_generator, 'st', NoStreamlit())
+class GenerateOfferTest(unittest.TestCase):
+
+    def test_offer_in_worker_thread(self):
+        generator = make_generator({"marka": "Opel Vivaro", "model": "L2H1"})
+        attachments = {'atest_pzh': True}
+        job = run_job(lambda job: generator.generate_offer("Proszę o ofertę na busa", attachments, 300.0))
+        self.assertEqual(job.status, DONE, job.error)
+        offer_data, _ = job.result
+        self.assertEqual(offer_data['pojazd']['marka'], 'Opel Vivaro')
+        self.assertEqual(offer_data['dodatkowe_wyposazenie'], attachments)
+
+    def test_unknown_vehicle_fails_job(self):
+        generator = make_generator({"marka": "Tesla Cybertruck", "model": "XL"})
+        with self.assertLogs('offer_jobs', 'ERROR'):
+            job = run_job(lambda job: generator.generate_offer("Proszę o ofertę na busa", {}, 0))
+        self.assertEqual(job.status, FAILED)
+        self.assertEqual(job.error, "Wybrany pojazd nie jest dostępny w bazie")
+
+    def test_empty_text(self):
+        with self.assertRaises(OfferError):
+            make_generator({}).generate_offer("", {}, 0)
+
+    def test_does_not_read_session_state(self):
+        generator = make_generator({"marka": "Opel Vivaro", "model": "L2H1"})
+        errors = []
+
+        def worker():
+            try:
+                generator.generate_offer("Proszę o ofertę na busa")
+            except Exception as e:
+                errors.append(e)
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join(10)
+        self.assertEqual(errors, [])
+
+    def test_async_without_client(self):
+        generator = make_generator({"marka": "Opel Vivaro", "model": "L2H1"})
+        with self.assertRaisesRegex(OfferError, "async_client"):
+            asyncio.run(generator.create_offer_async("Proszę o ofertę na busa"))
+
+
+if __name__ == '__main__':
+    unittest.main()
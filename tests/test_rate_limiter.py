@@ -0,0 +1,52 @@
+"""Testy wspólnego limitu RPM/TPM. Uruchomienie: python -m unittest"""
+import asyncio
+import threading
+import unittest
+
+from rate_limiter import BATCH, INTERACTIVE, MemoryBucketStore, RateLimiter
+
+
+class SlowStore(MemoryBucketStore):
+    """Magazyn czekający na zdarzenie - jak SQLite czekający na blokadę pliku innego procesu"""
+
+    def __init__(self):
+        super().__init__()
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def take(self, demands) -> float:
+        self.entered.set()
+        self.release.wait(5)
+        return super().take(demands)
+
+
+class StoreOutsideLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = SlowStore()
+        self.limiter = RateLimiter(rpm=60, tpm=10_000, store=self.store)
+
+    def assert_queue_readable_during_take(self, start_acquire):
+        thread = threading.Thread(target=start_acquire)
+        thread.start()
+        self.assertTrue(self.store.entered.wait(5))
+        try:
+            depth = {}
+            reader = threading.Thread(target=lambda: depth.update(self.limiter.queue_depth()))
+            reader.start()
+            reader.join(1)
+            self.assertFalse(reader.is_alive(), "queue_depth czeka na magazyn")
+            self.assertEqual(sum(depth.values()), 1)
+        finally:
+            self.store.release.set()
+            thread.join(5)
+
+    def test_acquire(self):
+        self.assert_queue_readable_during_take(lambda: self.limiter.acquire(100, INTERACTIVE))
+
+    def test_acquire_async(self):
+        self.assert_queue_readable_during_take(lambda: asyncio.run(self.limiter.acquire_async(100, BATCH)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Testy zapisu śladów i metryk w wątku tła. Uruchomienie: python -m unittest"""
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import telemetry
+from telemetry import Telemetry, span
+
+
+class TraceWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.trace_path = os.path.join(directory, 'trace.jsonl')
+        self.metrics_path = os.path.join(directory, 'metrics.prom')
+        self.telemetry = Telemetry(self.trace_path, self.metrics_path)
+        patcher = mock.patch.object(telemetry, 'get_telemetry', return_value=self.telemetry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_trace(self):
+        with open(self.trace_path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_root_span_does_not_wait_for_disk(self):
+        release = threading.Event()
+        writer_threads = []
+        write_trace = self.telemetry.write_trace
+
+        def slow_write(spans):
+            writer_threads.append(threading.current_thread().name)
+            release.wait(5)
+            write_trace(spans)
+
+        with mock.patch.object(self.telemetry, 'write_trace', slow_write):
+            with span('create_offer'):
+                with span('llm_call') as call:
+                    call.set(prompt_tokens=10)
+            self.assertFalse(os.path.exists(self.trace_path))
+            release.set()
+            self.telemetry.flush()
+
+        self.assertEqual(writer_threads, ['telemetry-writer'])
+        self.assertEqual([s['name'] for s in self.read_trace()], ['llm_call', 'create_offer'])
+
+    def test_flush_writes_metrics(self):
+        with span('pdf_render'):
+            pass
+        self.telemetry.flush()
+        self.assertEqual(len(self.read_trace()), 1)
+        with open(self.metrics_path, encoding='utf-8') as f:
+            self.assertIn('offer_stage_duration_seconds_count{stage="pdf_render"} 1', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
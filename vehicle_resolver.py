@@ -0,0 +1,103 @@
+import logging
+import re
+from collections import defaultdict
+
+from catalog_retrieval import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Minimalne podobieństwo trigramowe, aby uznać pojazd za rozpoznany
+MIN_FUZZY_SCORE = 0.7
+# Minimalna przewaga najlepszego kandydata nad drugim (inaczej dopasowanie jest niejednoznaczne)
+MIN_FUZZY_MARGIN = 0.05
+# Kara za niezgodny wariant (L/H) w nazwie pojazdu
+VARIANT_MISMATCH_PENALTY = 0.5
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def vehicle_key(marka, model='') -> str:
+    """Klucz nazwy pojazdu bez wielkości liter, spacji i znaków diakrytycznych.
+
+    Marka i model są sklejane, więc "Opel" + "Vivaro L2 H1" i "Opel Vivaro" + "L2H1"
+    dają ten sam klucz.
+    """
+    return _NON_ALNUM_RE.sub('', normalize_text(f"{marka or ''} {model or ''}"))
+
+
+def _trigrams(key) -> set:
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _variant(key) -> str:
+    """Wariant długości/wysokości (np. "l2h1") z końca klucza lub pusty tekst"""
+    tail = key[-4:]
+    if len(tail) == 4 and tail[0] == 'l' and tail[2] == 'h' and tail[1].isdigit() and tail[3].isdigit():
+        return tail
+    return ''
+
+
+class VehicleResolver:
+    """Wyszukiwanie pojazdu po nazwie: dokładne, po znormalizowanym kluczu i rozmyte (trigramy)"""
+
+    def __init__(self, vehicles):
+        self.vehicles = list(vehicles)
+        self.exact = {}
+        self.by_key = {}
+        self.keys = []
+        self.trigrams = []
+        self.postings = defaultdict(list)
+
+        for idx, row in enumerate(self.vehicles):
+            self.exact.setdefault((row[0], row[1]), idx)
+            key = vehicle_key(row[0], row[1])
+            self.by_key.setdefault(key, idx)
+            grams = _trigrams(key)
+            self.keys.append(key)
+            self.trigrams.append(grams)
+            for gram in grams:
+                self.postings[gram].append(idx)
+
+    def candidates(self, marka, model='', top_n=5) -> list:
+        """Ranking kandydatów [(podobieństwo, indeks wiersza)] od najlepszego"""
+        key = vehicle_key(marka, model)
+        if not key:
+            return []
+        grams = _trigrams(key)
+        variant = _variant(key)
+
+        # Liczba wspólnych trigramów z indeksu odwrotnego
+        shared = defaultdict(int)
+        for gram in grams:
+            for idx in self.postings.get(gram, ()):
+                shared[idx] += 1
+
+        ranked = []
+        for idx, common in shared.items():
+            # Współczynnik Dice'a na zbiorach trigramów
+            score = 2 * common / (len(grams) + len(self.trigrams[idx]))
+            if variant and _variant(self.keys[idx]) != variant:
+                score *= VARIANT_MISMATCH_PENALTY
+            ranked.append((score, idx))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return ranked[:top_n]
+
+    def resolve(self, marka, model=''):
+        """Zwraca wiersz pojazdu albo None, gdy nazwa jest nieznana lub niejednoznaczna"""
+        idx = self.exact.get((marka, model))
+        if idx is None:
+            idx = self.by_key.get(vehicle_key(marka, model))
+        if idx is not None:
+            return self.vehicles[idx]
+
+        ranked = self.candidates(marka, model, top_n=2)
+        if not ranked or ranked[0][0] < MIN_FUZZY_SCORE:
+            return None
+        if len(ranked) > 1 and ranked[0][0] - ranked[1][0] < MIN_FUZZY_MARGIN:
+            logger.info(f"Niejednoznaczna nazwa pojazdu: {marka} {model}")
+            return None
+
+        row = self.vehicles[ranked[0][1]]
+        logger.info(f"Dopasowano pojazd {marka} {model} -> {row[0]} {row[1]} ({ranked[0][0]:.2f})")
+        return row